@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ItemappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ItemApp'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
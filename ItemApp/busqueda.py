@@ -0,0 +1,67 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, F, Func, Q, Value
+
+from .models import Clasificacion
+
+# InnoDB no indexa palabras más cortas que innodb_ft_min_token_size (3 por defecto)
+LARGO_MINIMO_TEXTO_COMPLETO = 3
+
+
+class CoincideTexto(Func):
+    """ MATCH(campo) AGAINST(consulta IN BOOLEAN MODE); usa el índice FULLTEXT de MySQL """
+    output_field = BooleanField()
+
+    def __init__(self, campo, consulta):
+        super().__init__(F(campo), Value(consulta))
+
+    def as_mysql(self, compiler, connection):
+        campo, params_campo = compiler.compile(self.source_expressions[0])
+        consulta, params_consulta = compiler.compile(self.source_expressions[1])
+        return f'MATCH ({campo}) AGAINST ({consulta} IN BOOLEAN MODE)', (*params_campo, *params_consulta)
+
+
+def busqueda_por_palabras():
+    """ True si la búsqueda usa el índice FULLTEXT: encuentra palabras que empiezan con cada término """
+    return connection.vendor == 'mysql'
+
+
+def filtrar_datos_por_texto(queryset, texto):
+    """
+    Busca por nombre_dato con el índice FULLTEXT en MySQL, que encuentra las palabras que
+    empiezan con cada término (no fragmentos en medio de una palabra). En otros motores, o con
+    términos más cortos que el mínimo indexado, busca el texto en cualquier parte del nombre.
+    También incluye los datos de las clasificaciones cuyo nombre contiene el texto; esa tabla
+    es chica y se resuelve aparte, sin JOIN.
+    """
+    texto = texto.strip()
+    terminos = re.findall(r'\w+', texto)
+    if not terminos:
+        return queryset
+
+    if busqueda_por_palabras() and all(len(t) >= LARGO_MINIMO_TEXTO_COMPLETO for t in terminos):
+        condicion = Q(CoincideTexto('nombre_dato', ' '.join(f'+{t}*' for t in terminos)))
+    else:
+        condicion = Q(nombre_dato__icontains=texto)
+
+    clasificaciones = list(Clasificacion.objects.filter(nombre__icontains=texto).values_list('pk', flat=True))
+    if clasificaciones:
+        condicion |= Q(clasificacion_id__in=clasificaciones)
+
+    return queryset.filter(condicion)
+
+
+def contar_en_cache(queryset, segundos=None):
+    """ COUNT(*) guardado unos segundos por consulta; evita recontar en cada cambio de página """
+    segundos = segundos or getattr(settings, 'LISTADO_CONTEO_TTL', 60)
+    sql, params = queryset.query.sql_with_params()
+    clave = 'conteo:' + hashlib.sha256(f'{sql}{params}'.encode()).hexdigest()
+    total = cache.get(clave)
+    if total is None:
+        total = queryset.count()
+        cache.set(clave, total, segundos)
+    return total
@@ -0,0 +1,958 @@
+import codecs
+import csv
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DatoTributario, CalificacionTributaria, CambioCalificacion
+from .fragmentos import invalidar_fragmentos
+from .resumenes import CambiosResumen
+from .validacion import (
+    validar_datos,
+    resolver_columnas_factores,
+    preparar_calificaciones,
+    ejecutar_en_paralelo
+)
+
+
+# --- FUNCIONES DE LECTURA DE EXCEL (HELPERS) ---
+
+def leer_archivo_excel(archivo):
+    nombre = archivo.name.lower()
+    try:
+        if nombre.endswith('.csv'):
+            dialecto = detectar_dialecto_csv(archivo)
+            try:
+                df = pd.read_csv(
+                    getattr(archivo, 'file', archivo),
+                    encoding=dialecto['encoding'],
+                    encoding_errors='replace',
+                    delimiter=dialecto['delimitador'],
+                    skipinitialspace=True,
+                    na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null', 'NaN'],
+                    keep_default_na=True,
+                    quotechar='"',
+                    skip_blank_lines=True
+                )
+            except pd.errors.EmptyDataError:
+                raise
+            except Exception as e:
+                raise ValueError(f"No se pudo leer el archivo CSV. Error: {str(e)}")
+            
+            df = df.dropna(how='all')
+            df = df.loc[:, ~df.columns.str.contains('^Unnamed|^Unnamed:', case=False, na=False)]
+            df = df.dropna(axis=1, how='all')
+            df.attrs['dialecto'] = dialecto
+            return df
+            
+        elif nombre.endswith(('.xls', '.xlsx')):
+            archivo.seek(0)
+            try:
+                if nombre.endswith('.xlsx'):
+                    bloques = list(leer_xlsx_por_bloques(archivo))
+                    df = pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame()
+                else:
+                    try:
+                        df = pd.read_excel(
+                            archivo, 
+                            engine='xlrd',
+                            sheet_name=0,
+                            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
+                            header=0
+                        )
+                    except Exception:
+                        archivo.seek(0)
+                        df = pd.read_excel(
+                            archivo, 
+                            engine='openpyxl',
+                            sheet_name=0,
+                            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
+                            header=0
+                        )
+            except Exception:
+                try:
+                    archivo.seek(0)
+                    df = pd.read_excel(
+                        archivo, 
+                        sheet_name=0, 
+                        na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
+                        header=0
+                    )
+                except Exception as e2:
+                    raise ValueError(f"No se pudo leer el archivo Excel. Error: {str(e2)}. Verifique que el archivo no esté dañado.")
+            
+            if len(df.columns) == 0:
+                raise ValueError("El archivo Excel no contiene columnas. Verifique que la primera fila tenga nombres de columnas.")
+            
+            df = df.dropna(how='all')
+            df = df.loc[:, ~df.columns.astype(str).str.contains('^Unnamed|^Unnamed:', case=False, na=False)]
+            df = df.dropna(axis=1, how='all')
+            
+            if len(df.columns) == 0:
+                raise ValueError("Después de limpiar el archivo, no quedan columnas válidas. Verifique el formato del archivo.")
+            
+            return df
+        else:
+            raise ValueError("Formato de archivo no soportado. Use .csv, .xlsx o .xls")
+    except pd.errors.EmptyDataError:
+        raise ValueError("El archivo está vacío o no contiene datos válidos")
+    except Exception as e:
+        raise ValueError(f"Error al leer el archivo: {str(e)}. Verifique que el archivo tenga el formato correcto.")
+
+
+DELIMITADORES_CSV = [',', ';', '\t', '|']
+
+
+def _detectar_encoding(muestra):
+    for bom, encoding in [
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16'),
+    ]:
+        if muestra.startswith(bom):
+            return encoding, True
+
+    try:
+        muestra.decode('utf-8')
+        return 'utf-8', False
+    except UnicodeDecodeError as e:
+        # Un carácter multibyte cortado al final de la muestra no invalida UTF-8
+        if e.start >= len(muestra) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8', False
+
+    # Los bytes 0x80-0x9F son de control en latin-1 pero imprimibles en cp1252 (€, comillas, guiones)
+    if any(0x80 <= byte <= 0x9F for byte in muestra):
+        return 'cp1252', False
+    return 'latin-1', False
+
+
+def _puntuar_delimitador(lineas, delimitador):
+    """ Consistencia de la cantidad de campos por línea; un buen delimitador da siempre la misma cantidad """
+    conteos = [len(fila) for fila in csv.reader(lineas, delimiter=delimitador) if fila]
+    if not conteos:
+        return (0, 0)
+    moda = max(set(conteos), key=conteos.count)
+    if moda < 2:
+        return (0, 0)
+    return (conteos.count(moda) / len(conteos), moda)
+
+
+def detectar_dialecto_csv(archivo, tamano_muestra=16 * 1024):
+    """ Detecta encoding y delimitador leyendo solo los primeros KB del archivo """
+    archivo.seek(0)
+    muestra = archivo.read(tamano_muestra)
+    archivo.seek(0)
+    if isinstance(muestra, str):
+        muestra = muestra.encode('utf-8')
+
+    encoding, bom = _detectar_encoding(muestra)
+    texto = muestra.decode(encoding, errors='ignore')
+    lineas = texto.splitlines()
+    if len(lineas) > 1 and len(muestra) >= tamano_muestra:
+        lineas = lineas[:-1]
+
+    try:
+        sugerido = csv.Sniffer().sniff('\n'.join(lineas), delimiters=''.join(DELIMITADORES_CSV)).delimiter
+    except csv.Error:
+        sugerido = None
+
+    puntajes = {d: _puntuar_delimitador(lineas, d) for d in DELIMITADORES_CSV}
+    delimitador = max(DELIMITADORES_CSV, key=lambda d: (puntajes[d][0], d == sugerido, puntajes[d][1]))
+    if puntajes[delimitador] == (0, 0):
+        delimitador = sugerido or ','
+
+    return {
+        'encoding': encoding,
+        'bom': bom,
+        'delimitador': delimitador,
+        'sniffer': sugerido,
+    }
+
+
+def limpiar_bloque(df):
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.loc[:, ~df.columns.str.contains('^Unnamed|^nan$', case=False, na=False)]
+    return df.dropna(how='all')
+
+
+def leer_csv_por_bloques(archivo, tamano_bloque=None):
+    """ Lee el CSV en bloques de tamaño fijo; la memoria no depende de la cantidad de filas """
+    tamano_bloque = tamano_bloque or getattr(settings, 'CARGA_MASIVA_TAMANO_LOTE', 1000)
+    dialecto = detectar_dialecto_csv(archivo)
+
+    try:
+        lector = pd.read_csv(
+            # El archivo interno: un InMemoryUploadedFile no tiene `mode` y pandas lo leería como
+            # texto, ignorando el encoding detectado
+            getattr(archivo, 'file', archivo),
+            encoding=dialecto['encoding'],
+            encoding_errors='replace',
+            delimiter=dialecto['delimitador'],
+            skipinitialspace=True,
+            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null', 'NaN'],
+            keep_default_na=True,
+            quotechar='"',
+            skip_blank_lines=True,
+            chunksize=tamano_bloque
+        )
+    except pd.errors.EmptyDataError:
+        raise ValueError("El archivo está vacío o no contiene datos válidos")
+
+    with lector:
+        for bloque in lector:
+            bloque = limpiar_bloque(bloque)
+            if not bloque.empty:
+                bloque.attrs['dialecto'] = dialecto
+                yield bloque
+
+
+VALORES_NULOS_EXCEL = ['', ' ', 'N/A', 'n/a', 'NULL', 'null', 'NaN', '#N/A']
+
+
+def _encabezados_excel(fila):
+    """ Nombres de columna como los genera pandas: 'Unnamed: i' para vacías y sufijo .N para repetidas """
+    encabezados = []
+    vistos = {}
+    for i, valor in enumerate(fila):
+        nombre = f'Unnamed: {i}' if valor is None or str(valor).strip() == '' else str(valor)
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f'{nombre}.{vistos[nombre]}'
+        else:
+            vistos[nombre] = 0
+        encabezados.append(nombre)
+    return encabezados
+
+
+def leer_xlsx_por_bloques(archivo, tamano_bloque=None):
+    """ 
+    Recorre la primera hoja con openpyxl en modo read_only/data_only y entrega 
+    DataFrames tipados de tamaño fijo, sin construir el libro completo en memoria.
+    """
+    tamano_bloque = tamano_bloque or getattr(settings, 'CARGA_MASIVA_TAMANO_LOTE', 1000)
+    archivo.seek(0)
+    try:
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"No se pudo leer el archivo Excel. Error: {str(e)}. Verifique que el archivo no esté dañado.")
+
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        primera = next(filas, None)
+        if primera is None:
+            raise ValueError("El archivo está vacío o no contiene datos válidos")
+        columnas = _encabezados_excel(primera)
+
+        def armar_bloque(buffer):
+            ancho = len(columnas)
+            bloque = pd.DataFrame.from_records(
+                [fila[:ancho] + (None,) * (ancho - len(fila)) for fila in buffer], columns=columnas
+            )
+            return bloque.replace(VALORES_NULOS_EXCEL, np.nan)
+
+        buffer = []
+        for fila in filas:
+            buffer.append(fila)
+            if len(buffer) >= tamano_bloque:
+                yield armar_bloque(buffer)
+                buffer = []
+        if buffer:
+            yield armar_bloque(buffer)
+    finally:
+        libro.close()
+
+
+def leer_archivo_por_bloques(archivo, tamano_bloque=None):
+    """ CSV y XLSX se leen por bloques; los .xls se entregan como un único bloque """
+    nombre = archivo.name.lower()
+    if nombre.endswith('.csv'):
+        yield from leer_csv_por_bloques(archivo, tamano_bloque)
+    elif nombre.endswith('.xlsx'):
+        for bloque in leer_xlsx_por_bloques(archivo, tamano_bloque):
+            bloque = limpiar_bloque(bloque)
+            if not bloque.empty:
+                yield bloque
+    else:
+        yield limpiar_bloque(leer_archivo_excel(archivo))
+
+
+FILAS_VISTA_PREVIA = 50
+
+
+def leer_encabezado_archivo(archivo, filas=FILAS_VISTA_PREVIA):
+    """ Solo el encabezado y las primeras filas; alcanza para detectar columnas y mostrar ejemplos """
+    bloques = leer_archivo_por_bloques(archivo, filas)
+    try:
+        return next(bloques, None)
+    finally:
+        bloques.close()
+
+
+def contar_filas_archivo(archivo):
+    """ 
+    Cantidad de filas de datos sin parsear el archivo: saltos de línea en CSV y la 
+    dimensión declarada de la hoja en XLSX. Puede incluir filas en blanco.
+    """
+    nombre = archivo.name.lower()
+    if nombre.endswith('.csv'):
+        archivo.seek(0)
+        lineas = 0
+        ultimo = b''
+        for trozo in iter(lambda: archivo.read(1024 * 1024), b''):
+            lineas += trozo.count(b'\n')
+            ultimo = trozo[-1:]
+        if ultimo and ultimo != b'\n':
+            lineas += 1
+        archivo.seek(0)
+        return max(lineas - 1, 0)
+
+    if nombre.endswith('.xlsx'):
+        archivo.seek(0)
+        libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            hoja = libro.worksheets[0]
+            total = hoja.max_row
+            if total is None:
+                # Sin dimensión declarada en el archivo: se recorren las filas sin armar DataFrames
+                total = sum(1 for _ in hoja.iter_rows(values_only=True))
+        finally:
+            libro.close()
+            archivo.seek(0)
+        return max(total - 1, 0)
+
+    return len(leer_archivo_excel(archivo))
+
+
+ALIAS_COLUMNAS = {
+    'nombre': ['nombre', 'name', 'nombre_dato', 'descripcion', 'descripción', 'desc', 'dato', 'item', 
+               'concepto', 'detalle', 'descrip', 'titulo', 'title', 'concept', 'detail'],
+    'monto': ['monto', 'amount', 'valor', 'value', 'precio', 'price', 'importe', 'cantidad', 
+              'total', 'suma', 'capital', 'dinero', 'money', 'val', 'mnt'],
+    'factor': ['factor', 'factor_', 'multiplicador', 'multiplier', 'ratio', 'coeficiente', 
+               'coef', 'multi', 'porcentaje', 'percent', 'fac', 'rat'],
+    'fecha': ['fecha', 'date', 'fecha_dato', 'fecha_creacion', 'created_at', 'fecha_registro',
+              'fecha_ingreso', 'fecha_carga', 'fech', 'fecha_', 'date_', 'fec']
+}
+
+
+def normalizar_encabezado(texto):
+    if not texto:
+        return ""
+    texto = str(texto).lower().strip()
+    return texto.replace(' ', '').replace('-', '').replace('_', '').replace('.', '')
+
+
+# Tabla de alias normalizada una sola vez: por tipo (para el puntaje por subcadena)
+# y por clave exacta (para resolver la mayoría de los encabezados con un lookup)
+_ALIAS_NORMALIZADOS = {
+    tipo: tuple(dict.fromkeys(normalizar_encabezado(alias) for alias in aliases))
+    for tipo, aliases in ALIAS_COLUMNAS.items()
+}
+_TIPOS_POR_ALIAS = {}
+for _tipo, _aliases in _ALIAS_NORMALIZADOS.items():
+    for _alias in _aliases:
+        _TIPOS_POR_ALIAS.setdefault(_alias, []).append(_tipo)
+
+
+def _puntaje_subcadena(alias, columna):
+    if alias in columna:
+        return (len(alias) / max(len(columna), 1)) * 100
+    if columna in alias and len(columna) > 3:
+        return (len(columna) / len(alias)) * 80
+    return 0
+
+
+@lru_cache(maxsize=256)
+def _detectar_por_encabezados(encabezados):
+    """ Resultado inmutable por tupla de encabezados: {tipo: índice de columna} """
+    normalizados = [normalizar_encabezado(col) for col in encabezados]
+
+    # Coincidencia exacta: gana la última columna que coincide, como en la versión anterior
+    exactas = {}
+    for indice, clave in enumerate(normalizados):
+        for tipo in _TIPOS_POR_ALIAS.get(clave, ()):
+            exactas[tipo] = indice
+
+    detectadas = {}
+    for tipo, aliases in _ALIAS_NORMALIZADOS.items():
+        if tipo in exactas:
+            detectadas[tipo] = exactas[tipo]
+            continue
+
+        mejor_indice = None
+        mejor_score = 0
+        for indice, clave in enumerate(normalizados):
+            if not clave:
+                continue
+            for alias in aliases:
+                score = _puntaje_subcadena(alias, clave)
+                if score > mejor_score:
+                    mejor_score = score
+                    mejor_indice = indice
+        if mejor_indice is not None and mejor_score > 40:
+            detectadas[tipo] = mejor_indice
+
+    return tuple(detectadas.items())
+
+
+def detectar_columnas(df):
+    
+    if df.empty:
+        raise ValueError("El archivo no contiene datos. Verifique que el archivo tenga filas de datos además del encabezado.")
+    
+    if len(df.columns) == 0:
+        raise ValueError("El archivo no contiene columnas. Verifique el formato del archivo.")
+    
+    columnas_reales = [str(col) for col in df.columns.tolist()]
+
+    columnas_detectadas = {}
+    for tipo, indice in _detectar_por_encabezados(tuple(columnas_reales)):
+        columnas_detectadas[tipo] = {
+            'nombre_original': columnas_reales[indice],
+            'nombre_normalizado': normalizar_encabezado(columnas_reales[indice]),
+            'indice': indice
+        }
+
+    columnas_no_detectadas = [] if 'nombre' in columnas_detectadas else ['nombre']
+    return columnas_detectadas, columnas_no_detectadas, columnas_reales
+
+
+# --- CALIFICACIONES TRIBUTARIAS ---
+
+class MotorCargaCalificaciones:
+    """ Upsert en lotes de CalificacionTributaria usando secuencia_evento como llave """
+
+    def __init__(self, tamano_lote=None):
+        self.tamano_lote = tamano_lote or getattr(settings, 'CARGA_MASIVA_TAMANO_LOTE', 1000)
+        self.filas_procesadas = 0
+        self.registros_insertados = 0
+        self.registros_actualizados = 0
+        self.errores = []
+        self._pendientes = []
+
+    @property
+    def registros_procesados(self):
+        return self.registros_insertados + self.registros_actualizados
+
+    def agregar(self, index, datos):
+        self._pendientes.append((index, datos))
+        if len(self._pendientes) >= self.tamano_lote:
+            self._escribir_lote()
+
+    def finalizar(self):
+        if self._pendientes:
+            self._escribir_lote()
+        return self
+
+    def _escribir_lote(self):
+        lote, self._pendientes = self._pendientes, []
+
+        try:
+            with transaction.atomic():
+                insertados, actualizados = self._upsert(lote)
+            self.registros_insertados += insertados
+            self.registros_actualizados += actualizados
+        except Exception:
+            for index, datos in lote:
+                try:
+                    with transaction.atomic():
+                        insertados, actualizados = self._upsert([(index, datos)])
+                    self.registros_insertados += insertados
+                    self.registros_actualizados += actualizados
+                except Exception as e:
+                    self.errores.append(f"Fila {index}: {str(e)}")
+
+    def _upsert(self, lote):
+        # Si una secuencia se repite en el lote gana la última fila, igual que con update_or_create
+        por_secuencia = {}
+        repetidas = 0
+        for _, datos in lote:
+            secuencia = int(datos['secuencia_evento'])
+            if secuencia in por_secuencia:
+                repetidas += 1
+            por_secuencia[secuencia] = dict(datos, secuencia_evento=secuencia)
+
+        existentes = set(
+            CalificacionTributaria.objects.filter(
+                secuencia_evento__in=por_secuencia.keys()
+            ).values_list('secuencia_evento', flat=True)
+        )
+
+        campos = [campo for campo in lote[0][1] if campo != 'secuencia_evento']
+        campos.append('actualizado_en')
+        opciones = {'update_conflicts': True, 'update_fields': campos}
+        if connection.features.supports_update_conflicts_with_target:
+            opciones['unique_fields'] = ['secuencia_evento']
+
+        # El queryset de CalificacionTributaria arma el vector compacto de cada objeto
+        objetos = [CalificacionTributaria(**datos) for datos in por_secuencia.values()]
+        CalificacionTributaria.objects.bulk_create(objetos, **opciones)
+
+        # Al final del lote, justo antes del commit, para el feed de cambios
+        CambioCalificacion.registrar(
+            CalificacionTributaria.objects.filter(
+                secuencia_evento__in=por_secuencia.keys()
+            ).values_list('pk', 'secuencia_evento', 'anio')
+        )
+
+        insertados = len(por_secuencia) - len(existentes)
+        return insertados, len(existentes) + repetidas
+
+
+# --- MOTOR DE INGESTA EN LOTES ---
+
+class MotorCargaDatos:
+    """ Valida filas de la carga masiva y las escribe en lotes con bulk_create """
+
+    def __init__(self, clasificacion, usuario, columnas_detectadas, modo_carga='crear', tamano_lote=None):
+        self.clasificacion = clasificacion
+        self.usuario = usuario
+        self.columnas_detectadas = columnas_detectadas
+        self.modo_carga = modo_carga
+        self.tamano_lote = tamano_lote or getattr(settings, 'CARGA_MASIVA_TAMANO_LOTE', 1000)
+
+        self.registros_creados = 0
+        self.registros_actualizados = 0
+        self.filas_procesadas = 0
+        self._errores = []
+        self._pendientes = []
+
+    @property
+    def errores(self):
+        """ Errores por fila en el orden del archivo, aunque se detecten al escribir el lote """
+        return [mensaje for _, mensaje in sorted(self._errores, key=lambda e: e[0])]
+
+    def agregar_filas(self, df, desplazamiento=0):
+        """ Valida un bloque del DataFrame y encola las filas válidas; escribe cada vez que se llena un lote """
+        validado, errores_fila = validar_datos(df, self.columnas_detectadas, desplazamiento)
+        self.agregar_validados(validado, errores_fila, desplazamiento)
+
+    def agregar_validados(self, validado, errores_fila, desplazamiento=0):
+        """ Encola un bloque ya validado (por ejemplo en otro proceso) """
+        self.filas_procesadas += len(validado)
+
+        con_error = pd.notna(errores_fila)
+        self._errores.extend(
+            (desplazamiento + posicion, errores_fila[posicion]) for posicion in np.flatnonzero(con_error)
+        )
+
+        validos = validado[~con_error]
+        indices = desplazamiento + np.flatnonzero(~con_error)
+        registros = validos.astype(object).where(validos.notna(), None).to_dict('records')
+
+        for index, datos in zip(indices.tolist(), registros):
+            self._pendientes.append((index, datos))
+            if len(self._pendientes) >= self.tamano_lote:
+                self._escribir_lote()
+
+    def finalizar(self):
+        if self._pendientes:
+            self._escribir_lote()
+        return self
+
+    def _construir_dato(self, datos):
+        return DatoTributario(
+            clasificacion=self.clasificacion,
+            nombre_dato=datos['nombre_dato'],
+            monto=datos.get('monto'),
+            factor=datos.get('factor'),
+            fecha_dato=datos.get('fecha_dato'),
+            creado_por=self.usuario
+        )
+
+    def _escribir_lote(self):
+        lote, self._pendientes = self._pendientes, []
+
+        try:
+            with transaction.atomic():
+                creados, actualizados = self._escribir_filas(lote)
+            self.registros_creados += creados
+            self.registros_actualizados += actualizados
+        except Exception:
+            # Si el lote falla se reintenta fila a fila para reportar el error exacto
+            for index, datos in lote:
+                try:
+                    with transaction.atomic():
+                        creados, actualizados = self._escribir_filas([(index, datos)])
+                    self.registros_creados += creados
+                    self.registros_actualizados += actualizados
+                except Exception as e:
+                    self._errores.append((index, f"Fila {index + 2}: {str(e)}"))
+
+    def _escribir_filas(self, lote):
+        # bulk_create/bulk_update no emiten señales: el resumen se actualiza en la misma transacción
+        cambios = CambiosResumen()
+        if self.modo_carga == 'actualizar':
+            resultado = self._actualizar_lote(lote, cambios)
+        else:
+            objetos = DatoTributario.objects.bulk_create([self._construir_dato(datos) for _, datos in lote])
+            for dato in objetos:
+                cambios.alta(dato)
+            resultado = len(lote), 0
+        cambios.aplicar()
+        return resultado
+
+    def _actualizar_lote(self, lote, cambios):
+        """ Upsert por conjuntos: una consulta para los existentes, luego bulk_create y solo los modificados """
+        nombres = {datos['nombre_dato'] for _, datos in lote}
+        existentes = {}
+        # Bloqueados hasta el commit: el upsert por llave primaria reinsertaría un dato borrado entretanto
+        for dato in DatoTributario.objects.select_for_update().filter(
+            clasificacion=self.clasificacion,
+            nombre_dato__in=nombres
+        ).order_by('pk'):
+            existentes.setdefault(dato.nombre_dato, dato)
+
+        campos = [campo for campo in CAMPOS_ACTUALIZABLES if campo in lote[0][1]]
+        nuevos = {}
+        por_actualizar = {}
+        anteriores = {}
+        modificados = set()
+        actualizados = 0
+
+        for _, datos in lote:
+            nombre = datos['nombre_dato']
+            dato = existentes.get(nombre) or nuevos.get(nombre)
+            if dato is None:
+                nuevos[nombre] = self._construir_dato(datos)
+                continue
+            actualizados += 1
+
+            distintos = [
+                campo for campo in campos
+                if _valor_guardado(campo, datos.get(campo)) != _valor_guardado(campo, getattr(dato, campo))
+            ]
+            if not distintos:
+                continue
+
+            if dato.pk and dato.pk not in anteriores:
+                anteriores[dato.pk] = {
+                    'clasificacion_id': dato.clasificacion_id,
+                    'monto': dato.monto,
+                    'factor': dato.factor,
+                    'creado_en': dato.creado_en
+                }
+            for campo in distintos:
+                setattr(dato, campo, datos.get(campo))
+            if dato.pk:
+                por_actualizar[dato.pk] = dato
+                modificados.update(distintos)
+
+        if nuevos:
+            for dato in DatoTributario.objects.bulk_create(list(nuevos.values())):
+                cambios.alta(dato)
+        if por_actualizar:
+            # Mismo orden de campos que la lista de origen para que el SQL generado no varíe entre lotes
+            _guardar_modificados(list(por_actualizar.values()), [c for c in campos if c in modificados])
+            for pk, dato in por_actualizar.items():
+                cambios.modificacion(anteriores[pk], dato)
+        return len(nuevos), actualizados
+
+
+CAMPOS_ACTUALIZABLES = ('monto', 'factor', 'fecha_dato')
+
+# bulk_update arma un CASE WHEN por fila y campo: en lotes grandes el costo de construir la
+# consulta supera al de ejecutarla
+LOTE_BULK_UPDATE = 100
+
+
+def _valor_guardado(campo, valor):
+    """ El valor tal como queda en la base (decimales redondeados), para saber si una fila cambió """
+    field = DatoTributario._meta.get_field(campo)
+    try:
+        valor = field.to_python(valor)
+        if valor is not None and field.get_internal_type() == 'DecimalField':
+            valor = valor.quantize(Decimal(1).scaleb(-field.decimal_places))
+    except (ValidationError, InvalidOperation):
+        # Se considera distinto y el error lo informa la base al escribir la fila
+        pass
+    return valor
+
+
+def _guardar_modificados(datos, campos):
+    if connection.features.supports_update_conflicts:
+        # INSERT ... ON DUPLICATE KEY UPDATE (u ON CONFLICT) sobre la llave primaria: una sentencia
+        # por lote sin expresiones por fila, como el upsert de calificaciones
+        opciones = {'update_conflicts': True, 'update_fields': campos}
+        if connection.features.supports_update_conflicts_with_target:
+            opciones['unique_fields'] = ['pk']
+        DatoTributario.objects.bulk_create(datos, **opciones)
+    else:
+        DatoTributario.objects.bulk_update(datos, campos, batch_size=LOTE_BULK_UPDATE)
+
+
+# --- ARCHIVOS PREPARADOS (compartidos entre la vista previa y la carga) ---
+
+TIPOS_PREPARADOS = {
+    'nombre_dato': pa.string(),
+    'monto': pa.float64(),
+    'factor': pa.float64(),
+    'fecha_dato': pa.date32(),
+    'error': pa.string(),
+}
+
+
+def _directorio_preparados():
+    """ Directorio privado (0700) de los archivos preparados; lo deben ver la web y el worker """
+    directorio = settings.CARGA_MASIVA_DIRECTORIO_PREPARADOS
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    os.chmod(directorio, 0o700)
+    return directorio
+
+
+def _ruta_preparado(token):
+    if not token or not re.fullmatch(r'[0-9a-f]{64}', token):
+        return None
+    return os.path.join(_directorio_preparados(), f'{token}.parquet')
+
+
+def _vencido(ruta):
+    return os.path.getmtime(ruta) < time.time() - settings.CARGA_MASIVA_PREPARADOS_TTL
+
+
+def _eliminar_preparados_vencidos():
+    for entrada in os.scandir(_directorio_preparados()):
+        try:
+            if entrada.is_file() and _vencido(entrada.path):
+                os.remove(entrada.path)
+        except OSError:
+            continue
+
+
+def token_archivo(archivo):
+    """ Hash SHA-256 del contenido; identifica el archivo ya preparado """
+    archivo.seek(0)
+    digest = hashlib.sha256()
+    for trozo in iter(lambda: archivo.read(1024 * 1024), b''):
+        digest.update(trozo)
+    archivo.seek(0)
+    return digest.hexdigest()
+
+
+def preparar_archivo(archivo, columnas_detectadas):
+    """ 
+    Lee y valida el archivo completo y guarda el resultado en Parquet (un row group por bloque)
+    bajo el hash de su contenido, para que la carga no lo vuelva a leer. Retorna (token, filas).
+    """
+    _eliminar_preparados_vencidos()
+    token = token_archivo(archivo)
+    ruta = _ruta_preparado(token)
+    bloques = leer_archivo_por_bloques(archivo)
+
+    # mkstemp crea el archivo con permisos 0600; se publica con un rename atómico al terminar
+    descriptor, temporal = tempfile.mkstemp(dir=_directorio_preparados(), suffix='.tmp')
+    filas = 0
+    try:
+        with os.fdopen(descriptor, 'wb') as salida:
+            escritor = None
+            try:
+                for validado, errores in _validar_bloques(next(bloques, None), bloques, columnas_detectadas):
+                    tabla = validado.assign(error=errores)
+                    if escritor is None:
+                        esquema = pa.schema(
+                            [(columna, TIPOS_PREPARADOS[columna]) for columna in tabla.columns],
+                            metadata={'columnas_detectadas': json.dumps(columnas_detectadas)}
+                        )
+                        escritor = pq.ParquetWriter(salida, esquema)
+                    escritor.write_table(pa.Table.from_pandas(tabla, schema=esquema, preserve_index=False))
+                    filas += len(tabla)
+            finally:
+                if escritor is not None:
+                    escritor.close()
+        if escritor is None:
+            raise ValueError("El archivo está vacío o no contiene datos válidos")
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+    return token, filas
+
+
+def abrir_preparado(token, archivo):
+    """ Ruta del archivo preparado con `token` si corresponde al contenido de `archivo` y no venció """
+    ruta = _ruta_preparado(token)
+    if ruta is None or not os.path.exists(ruta) or token_archivo(archivo) != token:
+        return None
+    if _vencido(ruta):
+        os.remove(ruta)
+        return None
+    return ruta
+
+
+def leer_preparado(ruta):
+    """ Columnas detectadas y bloques (validado, errores) guardados por preparar_archivo """
+    parquet = pq.ParquetFile(ruta)
+    columnas_detectadas = json.loads(parquet.schema_arrow.metadata[b'columnas_detectadas'])
+
+    def bloques():
+        for grupo in range(parquet.num_row_groups):
+            validado = parquet.read_row_group(grupo).to_pandas()
+            errores = validado.pop('error')
+            yield validado, errores.astype(object).where(errores.notna(), None).to_numpy()
+
+    return columnas_detectadas, bloques()
+
+
+# --- CARGAS COMPLETAS (usadas por las vistas y por el worker de trabajos) ---
+
+def _procesos_validacion():
+    return max(getattr(settings, 'CARGA_MASIVA_PROCESOS', 1), 1)
+
+
+def _validar_bloques(df, bloques, columnas_detectadas):
+    """ (validado, errores) de cada bloque en orden; la validación puede correr en otros procesos """
+    def tareas(df):
+        desplazamiento = 0
+        while df is not None:
+            yield df, columnas_detectadas, desplazamiento
+            desplazamiento += len(df)
+            df = next(bloques, None)
+
+    return ejecutar_en_paralelo(validar_datos, tareas(df), _procesos_validacion())
+
+
+def _leer_y_detectar(archivo):
+    """ Primer bloque, resto de los bloques y columnas detectadas; ValueError si falta la columna de nombre """
+    bloques = leer_archivo_por_bloques(archivo)
+    df = next(bloques, None)
+
+    if df is None or df.empty:
+        raise ValueError(
+            'El archivo está vacío o no contiene datos. '
+            'Asegúrese de que el archivo tenga al menos una fila de datos además del encabezado.')
+
+    if len(df.columns) == 0:
+        raise ValueError(
+            'El archivo no contiene columnas válidas. '
+            'Verifique que el archivo tenga nombres de columnas en la primera fila.')
+
+    columnas_detectadas, columnas_no_detectadas, columnas_originales = detectar_columnas(df)
+
+    if 'nombre' in columnas_no_detectadas:
+        mensaje_error = (
+            f'No se pudo detectar la columna de nombre en el archivo. '
+            f'Columnas encontradas en el archivo: {", ".join(columnas_originales[:10])}'
+        )
+        if len(columnas_originales) > 10:
+            mensaje_error += f' (y {len(columnas_originales) - 10} más)'
+        mensaje_error += (
+            '. La columna de nombre es obligatoria y puede llamarse: '
+            'Nombre, Name, Descripción, Desc, Dato, Item, etc. '
+            'Asegúrese de que la primera fila del archivo contenga los nombres de las columnas.'
+        )
+        raise ValueError(mensaje_error)
+
+    for tipo, info in columnas_detectadas.items():
+        nombre_col = info['nombre_original']
+        if nombre_col not in df.columns:
+            raise ValueError(
+                f'Error: La columna detectada "{nombre_col}" no existe en el DataFrame. '
+                f'Columnas disponibles: {", ".join(df.columns.tolist()[:10])}')
+
+    print("=" * 60)
+    print(f"PROCESAMIENTO DE ARCHIVO: {archivo.name}")
+    print(f"Total de columnas: {len(df.columns)}")
+    print(f"Columnas en DataFrame: {list(df.columns)}")
+    print("Columnas detectadas:")
+    for tipo, info in columnas_detectadas.items():
+        print(f"   - {tipo}: '{info['nombre_original']}' (índice: {info['indice']})")
+    print("=" * 60)
+
+    return df, bloques, columnas_detectadas
+
+
+def cargar_datos_tributarios(archivo, clasificacion, usuario, modo_carga='crear', al_avanzar=None, token=None):
+    """ 
+    Lee, detecta columnas, valida y escribe un archivo de datos tributarios bloque a bloque. 
+    Si `token` es el que devolvió la vista previa para este mismo archivo, se escriben los datos
+    ya validados que guardó y el archivo no se vuelve a leer.
+    Lanza ValueError con un mensaje para el usuario si el archivo no se puede cargar.
+    """
+    preparado = abrir_preparado(token, archivo) if token else None
+    if preparado:
+        columnas_detectadas, validados = leer_preparado(preparado)
+    else:
+        df, bloques, columnas_detectadas = _leer_y_detectar(archivo)
+        validados = _validar_bloques(df, bloques, columnas_detectadas)
+
+    motor = MotorCargaDatos(
+        clasificacion=clasificacion,
+        usuario=usuario,
+        columnas_detectadas=columnas_detectadas,
+        modo_carga=modo_carga
+    )
+
+    desplazamiento = 0
+    for validado, errores_fila in validados:
+        motor.agregar_validados(validado, errores_fila, desplazamiento)
+        desplazamiento += len(validado)
+        if al_avanzar:
+            al_avanzar(motor.filas_procesadas, motor.registros_creados, motor.registros_actualizados)
+    motor.finalizar()
+
+    # Ya se usó; si la carga falla queda para un reintento hasta que venza
+    if preparado:
+        os.remove(preparado)
+
+    print("=" * 60)
+    print("RESUMEN DE CARGA:")
+    print(f"   - Filas procesadas: {motor.filas_procesadas}")
+    print(f"   - Registros creados: {motor.registros_creados}")
+    print(f"   - Registros actualizados: {motor.registros_actualizados}")
+    print(f"   - Errores: {len(motor.errores)}")
+    print("=" * 60)
+
+    return motor
+
+
+def cargar_calificaciones(archivo, al_avanzar=None):
+    """ Carga el Excel de calificaciones; retorna el motor y el mapeo de columnas de factores usado """
+    if archivo.name.lower().endswith('.xlsx'):
+        bloques = leer_xlsx_por_bloques(archivo)
+    else:
+        bloques = [pd.read_excel(archivo)]
+
+    motor = MotorCargaCalificaciones()
+    mapeo_factores = {}
+    fecha_defecto = timezone.now().date()
+    anio_defecto = datetime.now().year
+
+    def tareas():
+        desplazamiento = 0
+        for df in bloques:
+            df.columns = df.columns.str.strip().str.upper()
+            if not mapeo_factores:
+                mapeo_factores.update(resolver_columnas_factores(list(df.columns)))
+            yield df, mapeo_factores, desplazamiento, fecha_defecto, anio_defecto
+            desplazamiento += len(df)
+
+    for filas, total_bloque in ejecutar_en_paralelo(preparar_calificaciones, tareas(), _procesos_validacion()):
+        for index, datos in filas:
+            motor.agregar(index, datos)
+        motor.filas_procesadas += total_bloque
+        if al_avanzar:
+            al_avanzar(motor.filas_procesadas, motor.registros_insertados, motor.registros_actualizados)
+
+    motor.finalizar()
+    for error in motor.errores:
+        print(f"Error en {error}")
+
+    # El upsert en lote no emite señales por fila
+    invalidar_fragmentos()
+    return motor, mapeo_factores
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def revisar_cache_compartida(app_configs, **kwargs):
+    """ Con el worker de cargas hay al menos dos procesos: una caché en memoria no vería sus invalidaciones """
+    backend = settings.CACHES['default']['BACKEND']
+    if getattr(settings, 'CARGA_MASIVA_EN_SEGUNDO_PLANO', True) and backend.endswith('LocMemCache'):
+        return [Error(
+            'CARGA_MASIVA_EN_SEGUNDO_PLANO está activo con una caché en memoria por proceso.',
+            hint='Quite CACHE_EN_MEMORIA para usar la caché en archivos de CACHE_DIRECTORIO.',
+            id='ItemApp.E001',
+        )]
+    return []
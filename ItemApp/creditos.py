@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from django.db.models import Q
+
+from .carga import leer_archivo_excel, limpiar_bloque
+from .models import CalificacionTributaria
+from .validacion import CODIGOS_FACTORES, _convertir_numerico
+
+COLUMNAS_SECUENCIA = ('SEC_EVE', 'SECUENCIA', 'SECUENCIA_EVENTO')
+COLUMNAS_INSTRUMENTO = ('NEMO', 'INSTRUMENTO')
+COLUMNAS_CANTIDAD = ('CANTIDAD', 'ACCIONES', 'CUOTAS', 'UNIDADES')
+COLUMNAS_MONTO = ('MONTO', 'MONTO_PERCIBIDO', 'IMPORTE')
+
+ENCABEZADOS_RESULTADO = (
+    ['Fila', 'Secuencia evento', 'Instrumento', 'Fecha pago', 'Monto'] +
+    [f'F{codigo}' for codigo in CODIGOS_FACTORES] +
+    ['Observación']
+)
+
+
+def _primera_columna(df, candidatas):
+    return next((col for col in candidatas if col in df.columns), None)
+
+
+def leer_tenencias(archivo):
+    """
+    Lee el archivo de tenencias (secuencia de evento o nemo, y cantidad o monto) a un frame
+    con columnas fila, secuencia, instrumento, cantidad y monto.
+    """
+    df = limpiar_bloque(leer_archivo_excel(archivo))
+    df.columns = df.columns.str.upper().str.strip().str.replace(' ', '_')
+
+    col_secuencia = _primera_columna(df, COLUMNAS_SECUENCIA)
+    col_instrumento = _primera_columna(df, COLUMNAS_INSTRUMENTO)
+    col_cantidad = _primera_columna(df, COLUMNAS_CANTIDAD)
+    col_monto = _primera_columna(df, COLUMNAS_MONTO)
+
+    if col_secuencia is None and col_instrumento is None:
+        raise ValueError("El archivo debe tener una columna SEC_EVE o NEMO para identificar el evento.")
+    if col_cantidad is None and col_monto is None:
+        raise ValueError("El archivo debe tener una columna CANTIDAD o MONTO.")
+
+    vacia = pd.Series(np.nan, index=df.index)
+    tenencias = pd.DataFrame({
+        # +2: encabezado y numeración desde 1, igual que los errores de la carga masiva
+        'fila': np.arange(len(df)) + 2,
+        'secuencia': _convertir_numerico(df[col_secuencia]) if col_secuencia else vacia,
+        'instrumento': df[col_instrumento].fillna('').astype(str).str.strip().str.upper() if col_instrumento else '',
+        'cantidad': _convertir_numerico(df[col_cantidad]) if col_cantidad else vacia,
+        'monto': _convertir_numerico(df[col_monto], quitar_simbolo=True) if col_monto else vacia,
+    })
+    return tenencias.reset_index(drop=True)
+
+
+def _eventos_del_anio(tenencias, anio):
+    """ Calificaciones del año que pueden cruzar con las tenencias, con su fila en la matriz de factores """
+    secuencias = tenencias['secuencia'].dropna().astype('int64').unique().tolist()
+    instrumentos = tenencias.loc[tenencias['secuencia'].isna(), 'instrumento'].unique().tolist()
+
+    calificaciones = CalificacionTributaria.objects.filter(anio=anio).filter(
+        Q(secuencia_evento__in=secuencias) | Q(instrumento__in=instrumentos)
+    )
+    ids, matriz = CalificacionTributaria.matriz_factores(calificaciones)
+    eventos = pd.DataFrame(
+        list(calificaciones.values_list('pk', 'secuencia_evento', 'instrumento', 'fecha_pago', 'valor_historico')),
+        columns=['pk', 'secuencia_evento', 'instrumento_evento', 'fecha_pago', 'valor_historico']
+    )
+    posiciones = pd.Series(np.arange(len(ids)), index=ids)
+    eventos['posicion'] = posiciones.reindex(eventos['pk']).to_numpy()
+    eventos['clave_instrumento'] = eventos['instrumento_evento'].str.strip().str.upper()
+    eventos['valor_historico'] = eventos['valor_historico'].astype('float64')
+    return eventos, matriz
+
+
+def calcular_creditos(tenencias, anio):
+    """
+    Cruza las tenencias con las calificaciones del año y multiplica el monto de cada una por sus
+    31 factores en una sola operación matricial. Una tenencia por NEMO sin secuencia genera una
+    fila por cada evento del instrumento en el año. Retorna (cruce, creditos, sin_calificacion).
+    """
+    eventos, matriz = _eventos_del_anio(tenencias, anio)
+
+    por_secuencia = tenencias[tenencias['secuencia'].notna()].astype({'secuencia': 'int64'}).merge(
+        eventos, left_on='secuencia', right_on='secuencia_evento'
+    )
+    por_instrumento = tenencias[tenencias['secuencia'].isna()].merge(
+        eventos, left_on='instrumento', right_on='clave_instrumento'
+    )
+    cruce = pd.concat([por_secuencia, por_instrumento], ignore_index=True).sort_values(
+        ['fila', 'fecha_pago'], kind='stable'
+    ).reset_index(drop=True)
+
+    # Sin monto informado se usa cantidad x valor histórico del evento
+    montos = cruce['monto'].fillna(cruce['cantidad'] * cruce['valor_historico']).fillna(0.0).to_numpy()
+    cruce['monto'] = montos
+    creditos = np.round(montos[:, None] * matriz[cruce['posicion'].to_numpy(dtype=np.int64)], 2)
+
+    sin_calificacion = tenencias[~tenencias['fila'].isin(cruce['fila'])]
+    return cruce, creditos, sin_calificacion
+
+
+def filas_resultado(cruce, creditos, sin_calificacion, anio, tamano_bloque=1000):
+    """ Filas para ENCABEZADOS_RESULTADO; se generan por bloques para empezar a responder de inmediato """
+    for inicio in range(0, len(cruce), tamano_bloque):
+        bloque = cruce.iloc[inicio:inicio + tamano_bloque]
+        valores = creditos[inicio:inicio + tamano_bloque].tolist()
+        for fila, secuencia, instrumento, fecha_pago, monto, factores in zip(
+                bloque['fila'], bloque['secuencia_evento'], bloque['instrumento_evento'],
+                bloque['fecha_pago'], bloque['monto'], valores):
+            yield [fila, secuencia, instrumento, fecha_pago, round(monto, 2), *factores, '']
+
+    vacios = [''] * len(CODIGOS_FACTORES)
+    for fila, secuencia, instrumento in zip(
+            sin_calificacion['fila'], sin_calificacion['secuencia'], sin_calificacion['instrumento']):
+        secuencia = '' if pd.isna(secuencia) else int(secuencia)
+        yield [fila, secuencia, instrumento, '', '', *vacios, f'Sin calificación para el año {anio}']
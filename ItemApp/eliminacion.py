@@ -0,0 +1,67 @@
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Clasificacion, DatoTributario, SolicitudEdicion
+from .resumenes import reconstruir_resumenes
+
+
+def _borrar_por_ids(modelo, columna, ids):
+    """ DELETE directo, sin cargar objetos ni emitir señales """
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    columna = connection.ops.quote_name(columna)
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabla} WHERE {columna} IN ({marcadores})', ids)
+        return cursor.rowcount
+
+
+def eliminar_clasificacion(clasificacion_id, tamano_lote=None, al_avanzar=None):
+    """
+    Borra los datos tributarios de la clasificación (y sus solicitudes de edición) en lotes de
+    `tamano_lote` ids, cada lote en su propia transacción corta, y al final la clasificación.
+    Los lotes no pasan por las señales de DatoTributario: los resúmenes de la clasificación se
+    van en cascada con ella y, si algo falla a mitad, se recalculan para lo que quedó.
+    Retorna la cantidad de datos eliminados.
+    """
+    tamano_lote = tamano_lote or getattr(settings, 'CLASIFICACION_ELIMINACION_LOTE', 2000)
+    eliminados = 0
+
+    try:
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    DatoTributario.objects.filter(clasificacion_id=clasificacion_id)
+                    .order_by('pk').values_list('pk', flat=True)[:tamano_lote]
+                )
+                if not ids:
+                    break
+                _borrar_por_ids(SolicitudEdicion, 'dato_id', ids)
+                eliminados += _borrar_por_ids(DatoTributario, 'id', ids)
+            if al_avanzar:
+                al_avanzar(eliminados)
+
+        # Ya sin datos: el borrado normal solo arrastra resúmenes y dispara las invalidaciones
+        Clasificacion.objects.filter(pk=clasificacion_id).delete()
+    except Exception:
+        print(f"ERROR AL ELIMINAR CLASIFICACIÓN #{clasificacion_id} tras {eliminados} datos:")
+        print(traceback.format_exc())
+        if eliminados:
+            reconstruir_resumenes(clasificacion_id)
+        raise
+
+    return eliminados
+
+
+def eliminar_clasificaciones(ids, tamano_lote=None, al_avanzar=None):
+    """ Elimina varias clasificaciones con eliminar_clasificacion; `al_avanzar` recibe el total acumulado """
+    total = 0
+    for clasificacion_id in ids:
+        previo = total
+        total += eliminar_clasificacion(
+            clasificacion_id,
+            tamano_lote,
+            al_avanzar=(lambda eliminados: al_avanzar(previo + eliminados)) if al_avanzar else None
+        )
+    return total
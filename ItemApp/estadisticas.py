@@ -0,0 +1,140 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Clasificacion, DatoTributario, RegistroNUAM
+from .resumenes import totales_globales, clasificaciones_con_resumen, datos_creados_desde
+
+CLAVE_ESTADISTICAS_PANEL = 'estadisticas:panel'
+
+
+def contadores_usuarios(fecha_limite):
+    """ Todos los contadores de usuarios en una sola consulta con agregación condicional """
+    return User.objects.aggregate(
+        total=Count('id'),
+        staff=Count('id', filter=Q(is_staff=True)),
+        superusuarios=Count('id', filter=Q(is_superuser=True)),
+        nuevos_30d=Count('id', filter=Q(date_joined__gte=fecha_limite)),
+        activos_30d=Count('id', filter=Q(last_login__gte=fecha_limite)),
+    )
+
+
+def contadores_registros(fecha_limite):
+    return RegistroNUAM.objects.aggregate(
+        total=Count('id'),
+        nuevos_30d=Count('id', filter=Q(creado_en__gte=fecha_limite)),
+    )
+
+
+def calcular_estadisticas_panel():
+    fecha_limite = timezone.now() - timedelta(days=30)
+    usuarios = contadores_usuarios(fecha_limite)
+    registros = contadores_registros(fecha_limite)
+    datos = totales_globales()
+
+    return {
+        'total_usuarios': usuarios['total'],
+        'total_staff': usuarios['staff'],
+        'total_superusuarios': usuarios['superusuarios'],
+        'total_usuarios_regulares': usuarios['total'] - usuarios['staff'],
+        'usuarios_nuevos_30d': usuarios['nuevos_30d'],
+        'usuarios_activos_30d': usuarios['activos_30d'],
+
+        'total_registros_nuam': registros['total'],
+        'registros_nuevos_30d': registros['nuevos_30d'],
+
+        'total_clasificaciones': Clasificacion.objects.count(),
+        'total_datos_tributarios': datos['total_datos'],
+        'datos_nuevos_30d': datos_creados_desde(timezone.localdate(fecha_limite)),
+
+        'monto_total': datos['monto_total'],
+        'monto_promedio': datos['monto_promedio'],
+        'monto_maximo': datos['monto_maximo'],
+        'monto_minimo': datos['monto_minimo'],
+        'factor_promedio': datos['factor_promedio'],
+
+        'stats_paises': list(
+            RegistroNUAM.objects.values('pais').annotate(total=Count('id')).order_by('-total')[:10]
+        ),
+        'stats_clasificacion': list(
+            clasificaciones_con_resumen().values('nombre', 'total_datos', 'monto_total')[:10]
+        ),
+    }
+
+
+def estadisticas_panel():
+    """ Estadísticas del panel de administración, guardadas unos segundos en caché """
+    estadisticas = cache.get(CLAVE_ESTADISTICAS_PANEL)
+    if estadisticas is None:
+        estadisticas = calcular_estadisticas_panel()
+        cache.set(CLAVE_ESTADISTICAS_PANEL, estadisticas, getattr(settings, 'ESTADISTICAS_CACHE_TTL', 60))
+    return estadisticas
+
+
+def invalidar_estadisticas():
+    cache.delete(CLAVE_ESTADISTICAS_PANEL)
+
+
+AGRUPACIONES = ('dia', 'semana', 'mes')
+
+
+def _truncar_creado_en(agrupacion):
+    if agrupacion == 'semana':
+        return TruncWeek('creado_en', output_field=DateField())
+    if agrupacion == 'mes':
+        return TruncMonth('creado_en', output_field=DateField())
+    return TruncDate('creado_en')
+
+
+def _inicio_periodo(fecha, agrupacion):
+    if agrupacion == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    if agrupacion == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def _siguiente_periodo(fecha, agrupacion):
+    if agrupacion == 'semana':
+        return fecha + timedelta(days=7)
+    if agrupacion == 'mes':
+        return (fecha.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return fecha + timedelta(days=1)
+
+
+def serie_actividad(desde, hasta, agrupacion='dia', clasificacion_id=None):
+    """ 
+    Cantidad y suma de montos de DatoTributario creados entre dos fechas (inclusive), 
+    agrupados por día, semana o mes. Los períodos sin datos vienen en cero.
+    """
+    # El primer período se toma completo aunque `desde` caiga a mitad de semana o de mes
+    desde = _inicio_periodo(desde, agrupacion)
+    inicio = timezone.make_aware(datetime.combine(desde, time.min))
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+
+    datos = DatoTributario.objects.filter(creado_en__gte=inicio, creado_en__lt=fin)
+    if clasificacion_id:
+        datos = datos.filter(clasificacion_id=clasificacion_id)
+
+    filas = datos.annotate(periodo=_truncar_creado_en(agrupacion)).values('periodo').annotate(
+        total=Count('id'),
+        monto_total=Sum('monto')
+    ).order_by('periodo')
+    por_periodo = {fila['periodo']: fila for fila in filas}
+
+    serie = []
+    periodo = desde
+    while periodo <= hasta:
+        fila = por_periodo.get(periodo, {})
+        serie.append({
+            'periodo': periodo.isoformat(),
+            'total': fila.get('total', 0),
+            'monto_total': float(fila.get('monto_total') or 0),
+        })
+        periodo = _siguiente_periodo(periodo, agrupacion)
+    return serie
@@ -0,0 +1,82 @@
+import csv
+import tempfile
+from datetime import datetime
+
+import openpyxl
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .paginacion import recorrer_en_lotes
+
+FORMATOS_EXPORTACION = ('csv', 'xlsx')
+
+
+class _Eco:
+    """ Objeto tipo archivo para csv.writer que devuelve la línea en vez de guardarla """
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_local(valor):
+    # openpyxl no acepta fechas con zona horaria; se exportan en hora local
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def _lineas_csv(encabezados, filas):
+    escritor = csv.writer(_Eco(), delimiter=';')
+    # BOM para que Excel abra el archivo como UTF-8
+    yield '\ufeff' + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow([_valor_local(valor) for valor in fila])
+
+
+def exportar(queryset, columnas, nombre_archivo, formato='csv'):
+    """
+    Respuesta con todo el queryset. `columnas` es una lista de (campo, encabezado).
+    CSV se envía línea a línea mientras se leen los lotes. XLSX no se puede transmitir así: es
+    un ZIP que openpyxl solo escribe al guardar, así que el libro completo se arma en un archivo
+    temporal antes de enviar el primer byte. Por eso tiene un máximo de filas
+    (EXPORTACION_XLSX_MAXIMO_FILAS); si se supera lanza ValueError y hay que usar CSV.
+    """
+    campos = [campo for campo, _ in columnas]
+    encabezados = [encabezado for _, encabezado in columnas]
+
+    if formato == 'xlsx':
+        maximo = getattr(settings, 'EXPORTACION_XLSX_MAXIMO_FILAS', 100000)
+        if queryset[:maximo + 1].count() > maximo:
+            raise ValueError(
+                f"La exportación a Excel admite hasta {maximo:,} filas. Aplique más filtros o descargue en CSV."
+            )
+
+    filas = recorrer_en_lotes(queryset, campos)
+
+    if formato == 'xlsx':
+        sello = timezone.localtime().strftime('%Y%m%d_%H%M')
+        libro = openpyxl.Workbook(write_only=True)
+        hoja = libro.create_sheet(nombre_archivo[:31])
+        hoja.append(encabezados)
+        for fila in filas:
+            hoja.append([_valor_local(valor) for valor in fila])
+        temporal = tempfile.TemporaryFile()
+        libro.save(temporal)
+        temporal.seek(0)
+        return FileResponse(
+            temporal,
+            as_attachment=True,
+            filename=f'{nombre_archivo}_{sello}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+    return respuesta_csv(encabezados, filas, nombre_archivo)
+
+
+def respuesta_csv(encabezados, filas, nombre_archivo):
+    """ Envía `filas` (cualquier iterable) como CSV a medida que se van generando """
+    sello = timezone.localtime().strftime('%Y%m%d_%H%M')
+    respuesta = StreamingHttpResponse(_lineas_csv(encabezados, filas), content_type='text/csv; charset=utf-8')
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo}_{sello}.csv"'
+    return respuesta
@@ -106,6 +106,9 @@ class CargaMasivaForm(forms.Form):
         widget=forms.RadioSelect(attrs={'class': 'form-check-input'}),
         help_text="Elige si quieres crear nuevos registros o actualizar los existentes"
     )
+
+    # Lo completa la vista previa; permite cargar sin volver a leer el archivo
+    token_preparado = forms.CharField(required=False, widget=forms.HiddenInput(attrs={'id': 'token_preparado'}))
     
     def clean_archivo_masivo(self):
         archivo = self.cleaned_data.get('archivo_masivo')
@@ -149,4 +152,17 @@ class CargaMasivaCalificacionForm(forms.Form):
     archivo_excel = forms.FileField(
         label="Seleccionar Archivo Excel de Calificaciones",
         widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx, .xls'})
-    )
\ No newline at end of file
+    )
+
+
+class CalculoCreditosForm(forms.Form):
+    """ Archivo de tenencias para calcular créditos con los factores de un año tributario """
+    anio = forms.IntegerField(
+        label="Año Tributario",
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+    archivo_tenencias = forms.FileField(
+        label="Archivo de Tenencias (Excel o CSV)",
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx,.xls'}),
+        help_text="Columnas: SEC_EVE o NEMO, y CANTIDAD o MONTO"
+    )
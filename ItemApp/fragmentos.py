@@ -0,0 +1,38 @@
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+CLAVE_VERSION_FRAGMENTOS = 'fragmentos:version'
+
+
+def version_fragmentos():
+    """ 
+    Versión vigente de los fragmentos cacheados ({% cache ... version_fragmentos %}). 
+    Cambiarla deja obsoletos todos los fragmentos de una vez, incluidos los que varían por filtros.
+    """
+    version = cache.get(CLAVE_VERSION_FRAGMENTOS)
+    if version is None:
+        version = time.time_ns()
+        cache.set(CLAVE_VERSION_FRAGMENTOS, version, None)
+    return version
+
+
+def invalidar_fragmentos():
+    cache.set(CLAVE_VERSION_FRAGMENTOS, time.time_ns(), None)
+
+
+def ttl_fragmentos():
+    return getattr(settings, 'FRAGMENTOS_CACHE_TTL', 300)
+
+
+def diferido(funcion, *args, **kwargs):
+    """ 
+    Valor para el contexto que solo se calcula si el template lo usa, es decir, si el 
+    fragmento no estaba en caché. Se calcula una vez aunque el template lo lea varias veces.
+    """
+    @lru_cache(maxsize=None)
+    def calcular():
+        return funcion(*args, **kwargs)
+    return calcular
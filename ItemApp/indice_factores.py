@@ -0,0 +1,246 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .models import CalificacionTributaria, CambioCalificacion
+from .sincronizacion import tope_visible
+from .validacion import CODIGOS_FACTORES
+
+CAMPOS_INDICE = ('pk', 'secuencia_evento', 'instrumento', 'fecha_pago')
+
+# Calificaciones releídas por consulta al aplicar entradas de la bitácora
+LOTE_RELECTURA = 1000
+
+
+def _clave_instrumento(instrumento):
+    return str(instrumento).strip().upper()
+
+
+def _entradas_aplicables(desde):
+    """ Entradas de la bitácora posteriores a `desde` ya confirmadas, con el mismo tope que el feed """
+    entradas = CambioCalificacion.objects.filter(id__gt=desde)
+    tope = tope_visible(desde)
+    if tope is not None:
+        entradas = entradas.filter(id__lt=tope)
+    return entradas
+
+
+class _AlDiaConBitacora:
+    """
+    Estado en memoria que se pone al día con la bitácora CambioCalificacion: guarda el id de la
+    última entrada aplicada y en cada verificación lee solo las posteriores (un rango de la llave
+    primaria). Las escrituras se ven con SINCRONIZACION_MARGEN segundos de retraso.
+    """
+    campos_bitacora = ('id',)
+
+    def __init__(self):
+        self.ultimo_cambio = None
+        self.verificado_en = 0.0
+        self._bloqueo = threading.Lock()
+
+    def refrescar(self, forzar=False):
+        """ Consulta la bitácora como máximo cada INDICE_FACTORES_VERIFICACION segundos """
+        intervalo = getattr(settings, 'INDICE_FACTORES_VERIFICACION', 1)
+        if not forzar and time.monotonic() - self.verificado_en < intervalo:
+            return self
+
+        with self._bloqueo:
+            if self.ultimo_cambio is None:
+                # Lo registrado hasta esta entrada ya está confirmado y entra en la carga completa
+                self.ultimo_cambio = _entradas_aplicables(0).aggregate(ultimo=Max('id'))['ultimo'] or 0
+                self._cargar_completo()
+            else:
+                entradas = list(
+                    _entradas_aplicables(self.ultimo_cambio).order_by('id').values_list(*self.campos_bitacora)
+                )
+                if entradas:
+                    self._aplicar(entradas)
+                    self.ultimo_cambio = entradas[-1][0]
+            self.verificado_en = time.monotonic()
+        return self
+
+
+class IndiceFactores(_AlDiaConBitacora):
+    """
+    Factores de un año tributario en memoria: una matriz (filas x 31) contigua y diccionarios de
+    secuencia_evento e instrumento a fila. Se pone al día releyendo solo las calificaciones con
+    entradas nuevas en la bitácora; si hubo bajas se vuelve a cargar completo.
+    """
+    campos_bitacora = ('id', 'calificacion_id', 'anio')
+
+    def __init__(self, anio):
+        super().__init__()
+        self.anio = anio
+        self._vaciar()
+
+    def _vaciar(self):
+        self.matriz = np.zeros((0, len(CODIGOS_FACTORES)))
+        self.secuencias = []
+        self.instrumentos = []
+        self.fechas = []
+        self._por_pk = {}
+        self._por_secuencia = {}
+        self._por_instrumento = {}
+
+    def __len__(self):
+        return len(self.secuencias)
+
+    def _consulta(self):
+        return CalificacionTributaria.objects.filter(anio=self.anio)
+
+    def _incorporar(self, queryset):
+        """ Agrega o reemplaza las filas del queryset; retorna los pk incorporados """
+        ids, matriz = CalificacionTributaria.matriz_factores(queryset)
+        posicion_en_matriz = {int(pk): i for i, pk in enumerate(ids)}
+        nuevas = []
+        incorporados = set()
+
+        for pk, secuencia, instrumento, fecha_pago in queryset.values_list(*CAMPOS_INDICE):
+            if pk not in posicion_en_matriz:
+                # Creada entre las dos consultas; entra en la próxima verificación
+                continue
+            incorporados.add(pk)
+            vector = matriz[posicion_en_matriz[pk]]
+            fila = self._por_pk.get(pk)
+            if fila is None:
+                nuevas.append(vector)
+                fila = len(self.secuencias)
+                self._por_pk[pk] = fila
+                self.secuencias.append(secuencia)
+                self.instrumentos.append(instrumento)
+                self.fechas.append(fecha_pago)
+                self._por_instrumento.setdefault(_clave_instrumento(instrumento), []).append(fila)
+            else:
+                self.matriz[fila] = vector
+                if _clave_instrumento(self.instrumentos[fila]) != _clave_instrumento(instrumento):
+                    self._por_instrumento[_clave_instrumento(self.instrumentos[fila])].remove(fila)
+                    self._por_instrumento.setdefault(_clave_instrumento(instrumento), []).append(fila)
+                del self._por_secuencia[self.secuencias[fila]]
+                self.secuencias[fila] = secuencia
+                self.instrumentos[fila] = instrumento
+                self.fechas[fila] = fecha_pago
+            self._por_secuencia[secuencia] = fila
+
+        if nuevas:
+            self.matriz = np.ascontiguousarray(np.vstack([self.matriz, np.array(nuevas)]))
+        return incorporados
+
+    def _cargar_completo(self):
+        self._vaciar()
+        self._incorporar(self._consulta())
+
+    def _aplicar(self, entradas):
+        # Las del año y las que ya estaban en el índice (pudieron cambiar de año o darse de baja)
+        pks = sorted({pk for _, pk, anio in entradas if anio == self.anio or pk in self._por_pk})
+        for inicio in range(0, len(pks), LOTE_RELECTURA):
+            lote = pks[inicio:inicio + LOTE_RELECTURA]
+            incorporados = self._incorporar(self._consulta().filter(pk__in=lote))
+            if any(pk in self._por_pk and pk not in incorporados for pk in lote):
+                print(f"Índice de factores {self.anio}: hubo bajas, se recarga completo")
+                self._cargar_completo()
+                return
+
+    def _resultado(self, fila):
+        return {
+            'secuencia_evento': self.secuencias[fila],
+            'instrumento': self.instrumentos[fila],
+            'anio': self.anio,
+            'fecha_pago': self.fechas[fila].isoformat(),
+            'factores': self.matriz[fila].tolist(),
+        }
+
+    def vector(self, secuencia):
+        """ Arreglo de 31 factores de una secuencia de evento, o None """
+        fila = self._por_secuencia.get(secuencia)
+        return None if fila is None else self.matriz[fila]
+
+    def por_secuencia(self, secuencia):
+        fila = self._por_secuencia.get(secuencia)
+        return None if fila is None else self._resultado(fila)
+
+    def por_instrumento(self, instrumento):
+        """ Todos los eventos del instrumento en el año, ordenados por fecha de pago """
+        filas = sorted(self._por_instrumento.get(_clave_instrumento(instrumento), []), key=lambda f: self.fechas[f])
+        return [self._resultado(fila) for fila in filas]
+
+
+class AniosPorSecuencia(_AlDiaConBitacora):
+    """ secuencia_evento -> anio de todas las calificaciones, para buscar secuencias sin indicar el año """
+    campos_bitacora = ('id', 'secuencia_evento', 'anio', 'tipo')
+
+    def __init__(self):
+        super().__init__()
+        self.anios = {}
+
+    def _cargar_completo(self):
+        self.anios = dict(
+            CalificacionTributaria.objects.values_list('secuencia_evento', 'anio').iterator(chunk_size=5000)
+        )
+
+    def _aplicar(self, entradas):
+        for _, secuencia, anio, tipo in entradas:
+            if tipo == 'baja':
+                self.anios.pop(secuencia, None)
+            else:
+                self.anios[secuencia] = anio
+
+
+_indices = {}
+_bloqueo_indices = threading.Lock()
+_anios_por_secuencia = AniosPorSecuencia()
+
+
+def indice_factores(anio):
+    """ Índice del año para este proceso, al día con la base """
+    anio = int(anio)
+    with _bloqueo_indices:
+        indice = _indices.get(anio)
+        if indice is None:
+            indice = _indices[anio] = IndiceFactores(anio)
+    return indice.refrescar()
+
+
+def buscar_factores(secuencias=(), instrumentos=(), anio=None):
+    """
+    Resuelve en lote secuencias de evento e instrumentos. Las secuencias sin año se ubican con el
+    mapa secuencia -> año en memoria. Retorna (por_secuencia, por_instrumento, no_encontrados).
+    """
+    secuencias = [int(secuencia) for secuencia in secuencias]
+    por_secuencia = {}
+    por_instrumento = {}
+    no_encontrados = []
+
+    if anio is not None:
+        anios_por_secuencia = {secuencia: int(anio) for secuencia in secuencias}
+    elif secuencias:
+        anios = _anios_por_secuencia.refrescar().anios
+        anios_por_secuencia = {secuencia: anios.get(secuencia) for secuencia in secuencias}
+    else:
+        anios_por_secuencia = {}
+
+    indices = {}
+    for secuencia in secuencias:
+        anio_secuencia = anios_por_secuencia.get(secuencia)
+        if anio_secuencia and anio_secuencia not in indices:
+            indices[anio_secuencia] = indice_factores(anio_secuencia)
+        resultado = indices[anio_secuencia].por_secuencia(secuencia) if anio_secuencia else None
+        if resultado is None:
+            no_encontrados.append(secuencia)
+        else:
+            por_secuencia[secuencia] = resultado
+
+    if instrumentos:
+        if anio is None:
+            raise ValueError("Para buscar por instrumento se debe indicar el año tributario.")
+        indice = indice_factores(anio)
+        for instrumento in instrumentos:
+            eventos = indice.por_instrumento(instrumento)
+            if eventos:
+                por_instrumento[instrumento] = eventos
+            else:
+                no_encontrados.append(instrumento)
+
+    return por_secuencia, por_instrumento, no_encontrados
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ItemApp.trabajos import tomar_siguiente_trabajo, ejecutar_trabajo
+
+
+class Command(BaseCommand):
+    help = 'Procesa las cargas masivas encoladas. Se pueden levantar varios procesos en paralelo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa los trabajos pendientes y termina en vez de quedar esperando'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera entre consultas cuando la cola está vacía'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Worker de cargas iniciado.')
+        while True:
+            close_old_connections()
+            trabajo = tomar_siguiente_trabajo()
+
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'Procesando carga #{trabajo.pk} ({trabajo.archivo_nombre})...')
+            trabajo = ejecutar_trabajo(trabajo)
+            if trabajo.estado == 'completado':
+                self.stdout.write(self.style.SUCCESS(
+                    f'Carga #{trabajo.pk} completada: {trabajo.registros_creados} creados, '
+                    f'{trabajo.registros_actualizados} actualizados, {trabajo.total_errores} errores.'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f'Carga #{trabajo.pk} falló: {trabajo.mensaje}'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ItemApp.resumenes import reconstruir_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los resúmenes por clasificación y por día de los datos tributarios (todos o los de una clasificación).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clasificacion',
+            type=int,
+            help='ID de la clasificación a recalcular; sin este parámetro se recalculan todas'
+        )
+
+    def handle(self, *args, **options):
+        clasificaciones, dias = reconstruir_resumenes(options['clasificacion'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes reconstruidos: {clasificaciones} clasificaciones, {dias} días.'
+        ))
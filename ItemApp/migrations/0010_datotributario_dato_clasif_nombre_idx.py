@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0009_datotributario_desbloqueado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datotributario',
+            index=models.Index(fields=['clasificacion', 'nombre_dato'], name='dato_clasif_nombre_idx'),
+        ),
+    ]
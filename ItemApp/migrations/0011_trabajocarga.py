@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0010_datotributario_dato_clasif_nombre_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoCarga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('datos', 'Datos Tributarios'), ('calificaciones', 'Calificaciones Tributarias')], max_length=20)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('archivo_nombre', models.CharField(max_length=255)),
+                ('archivo_ruta', models.CharField(blank=True, help_text='Archivo en CARGA_MASIVA_DIRECTORIO_COLA mientras espera al worker; se borra al terminar', max_length=255)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('filas_procesadas', models.PositiveIntegerField(default=0)),
+                ('registros_creados', models.PositiveIntegerField(default=0)),
+                ('registros_actualizados', models.PositiveIntegerField(default=0)),
+                ('total_errores', models.PositiveIntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=list, help_text='Primeros errores por fila')),
+                ('detalle', models.JSONField(blank=True, default=dict)),
+                ('mensaje', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(blank=True, help_text='Último avance informado por el worker; sin avances se da por caído', null=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Carga',
+                'verbose_name_plural': 'Trabajos de Carga',
+                'indexes': [models.Index(fields=['estado', 'creado_en'], name='trabajo_estado_idx')],
+            },
+        ),
+    ]
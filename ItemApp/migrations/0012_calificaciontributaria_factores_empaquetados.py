@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:26
+
+from decimal import Decimal
+
+import numpy as np
+from django.db import migrations, models
+
+CAMPOS_FACTORES = (
+    [f'factor_{i:02d}' for i in range(8, 20)] + ['factor_19A'] + [f'factor_{i:02d}' for i in range(20, 38)]
+)
+
+
+def empaquetar_existentes(apps, schema_editor):
+    CalificacionTributaria = apps.get_model('ItemApp', 'CalificacionTributaria')
+    lote = []
+    for calificacion in CalificacionTributaria.objects.only('pk', *CAMPOS_FACTORES).iterator(chunk_size=1000):
+        escalados = [
+            int((Decimal(getattr(calificacion, campo) or 0) * 10 ** 8).to_integral_value())
+            for campo in CAMPOS_FACTORES
+        ]
+        calificacion.factores_empaquetados = np.array(escalados, dtype='<i8').tobytes()
+        lote.append(calificacion)
+        if len(lote) >= 1000:
+            CalificacionTributaria.objects.bulk_update(lote, ['factores_empaquetados'])
+            lote = []
+    if lote:
+        CalificacionTributaria.objects.bulk_update(lote, ['factores_empaquetados'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0011_trabajocarga'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calificaciontributaria',
+            name='factores_empaquetados',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(empaquetar_existentes, migrations.RunPython.noop),
+    ]
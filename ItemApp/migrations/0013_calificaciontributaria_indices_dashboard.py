@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0012_calificaciontributaria_factores_empaquetados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['fecha_pago', 'id'], name='calif_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['anio', 'fecha_pago', 'id'], name='calif_anio_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calificaciontributaria',
+            index=models.Index(fields=['mercado', 'fecha_pago', 'id'], name='calif_mercado_fecha_idx'),
+        ),
+    ]
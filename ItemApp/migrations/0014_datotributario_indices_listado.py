@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Django no declara índices FULLTEXT; solo se crean en MySQL, que es donde los usa la búsqueda
+def crear_indice_texto_completo(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX dato_nombre_ft_idx ON ItemApp_datotributario (nombre_dato)'
+        )
+
+
+def eliminar_indice_texto_completo(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX dato_nombre_ft_idx ON ItemApp_datotributario')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0013_calificaciontributaria_indices_dashboard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datotributario',
+            index=models.Index(fields=['creado_en', 'id'], name='dato_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datotributario',
+            index=models.Index(fields=['clasificacion', 'creado_en', 'id'], name='dato_clasif_creado_idx'),
+        ),
+        migrations.RunPython(crear_indice_texto_completo, eliminar_indice_texto_completo),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def calcular_resumenes(apps, schema_editor):
+    DatoTributario = apps.get_model('ItemApp', 'DatoTributario')
+    ResumenClasificacion = apps.get_model('ItemApp', 'ResumenClasificacion')
+    ResumenDiario = apps.get_model('ItemApp', 'ResumenDiario')
+
+    por_clasificacion = DatoTributario.objects.values('clasificacion_id').annotate(
+        total=Count('id'), suma_monto=Sum('monto'), montos=Count('monto'), maximo=Max('monto'),
+        minimo=Min('monto'), suma_factor=Sum('factor'), factores=Count('factor'),
+    ).order_by()
+    ResumenClasificacion.objects.bulk_create([
+        ResumenClasificacion(
+            clasificacion_id=fila['clasificacion_id'],
+            total_datos=fila['total'],
+            monto_total=fila['suma_monto'] or 0,
+            montos_informados=fila['montos'],
+            monto_maximo=fila['maximo'],
+            monto_minimo=fila['minimo'],
+            factor_total=fila['suma_factor'] or 0,
+            factores_informados=fila['factores'],
+        ) for fila in por_clasificacion
+    ], batch_size=1000)
+
+    por_dia = DatoTributario.objects.annotate(fecha=TruncDate('creado_en')).values(
+        'clasificacion_id', 'fecha'
+    ).annotate(total=Count('id')).order_by()
+    ResumenDiario.objects.bulk_create([
+        ResumenDiario(clasificacion_id=fila['clasificacion_id'], fecha=fila['fecha'], total_datos=fila['total'])
+        for fila in por_dia
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0014_datotributario_indices_listado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenClasificacion',
+            fields=[
+                ('clasificacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='ItemApp.clasificacion')),
+                ('total_datos', models.PositiveBigIntegerField(default=0)),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=22)),
+                ('montos_informados', models.PositiveBigIntegerField(default=0)),
+                ('monto_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('monto_minimo', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('factor_total', models.DecimalField(decimal_places=4, default=0, max_digits=22)),
+                ('factores_informados', models.PositiveBigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen por Clasificación',
+                'verbose_name_plural': 'Resúmenes por Clasificación',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('total_datos', models.PositiveBigIntegerField(default=0)),
+                ('clasificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='ItemApp.clasificacion')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'indexes': [models.Index(fields=['fecha'], name='resumen_diario_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('clasificacion', 'fecha'), name='resumen_diario_unico')],
+            },
+        ),
+        migrations.RunPython(calcular_resumenes, migrations.RunPython.noop),
+    ]
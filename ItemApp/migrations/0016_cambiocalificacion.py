@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+def poblar_bitacora(apps, schema_editor):
+    # Una entrada por calificación existente para que el feed parta con todas
+    CalificacionTributaria = apps.get_model('ItemApp', 'CalificacionTributaria')
+    CambioCalificacion = apps.get_model('ItemApp', 'CambioCalificacion')
+
+    lote = []
+    for pk, secuencia, anio in CalificacionTributaria.objects.order_by('actualizado_en', 'id').values_list(
+        'id', 'secuencia_evento', 'anio'
+    ).iterator(chunk_size=1000):
+        lote.append(CambioCalificacion(calificacion_id=pk, secuencia_evento=secuencia, anio=anio))
+        if len(lote) >= 1000:
+            CambioCalificacion.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        CambioCalificacion.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0015_resumenes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calificacion_id', models.BigIntegerField()),
+                ('secuencia_evento', models.BigIntegerField()),
+                ('anio', models.IntegerField()),
+                ('tipo', models.CharField(choices=[('cambio', 'Alta o modificación'), ('baja', 'Baja')], default='cambio', max_length=10)),
+                ('registrado_en', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Calificación',
+                'verbose_name_plural': 'Cambios de Calificaciones',
+            },
+        ),
+        migrations.RunPython(poblar_bitacora, migrations.RunPython.noop),
+    ]
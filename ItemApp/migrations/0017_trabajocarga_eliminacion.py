@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ItemApp', '0016_cambiocalificacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajocarga',
+            name='tipo',
+            field=models.CharField(choices=[('datos', 'Datos Tributarios'), ('calificaciones', 'Calificaciones Tributarias'), ('eliminacion', 'Eliminación de Clasificaciones')], max_length=20),
+        ),
+    ]
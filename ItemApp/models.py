@@ -2,6 +2,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from .validacion import CAMPOS_FACTORES
 
 class RegistroNUAM(models.Model):
     nombre_completo = models.CharField(max_length=255)
@@ -80,6 +85,12 @@ class DatoTributario(models.Model):
     class Meta:
         verbose_name = "Dato Tributario"
         verbose_name_plural = "Datos Tributarios"
+        indexes = [
+            models.Index(fields=['clasificacion', 'nombre_dato'], name='dato_clasif_nombre_idx'),
+            # Paginación por llave (creado_en, id) del listado
+            models.Index(fields=['creado_en', 'id'], name='dato_creado_idx'),
+            models.Index(fields=['clasificacion', 'creado_en', 'id'], name='dato_clasif_creado_idx'),
+        ]
     
     @property
     def tiempo_edicion_expirado(self):
@@ -95,6 +106,59 @@ class DatoTributario(models.Model):
         return timezone.now() > tiempo_limite
 
 
+# Los factores empaquetados se guardan como int64 little-endian escalados en 10^8: 
+# cubren exactamente un DecimalField(18, 8) y ocupan 8 bytes por factor
+ESCALA_FACTORES = 10 ** 8
+
+
+def _factor_escalado(valor):
+    if valor is None or valor != valor:
+        return 0
+    if isinstance(valor, float):
+        return int(round(valor * ESCALA_FACTORES))
+    return int((Decimal(valor) * ESCALA_FACTORES).to_integral_value())
+
+
+def empaquetar_factores(valores):
+    """ Valores de factor_08 ... factor_37 (en el orden de CAMPOS_FACTORES) a bytes """
+    return np.array([_factor_escalado(v) for v in valores], dtype='<i8').tobytes()
+
+
+def desempaquetar_factores(empaquetado):
+    """ Bytes empaquetados a un arreglo float64 con un elemento por factor """
+    return np.frombuffer(bytes(empaquetado), dtype='<i8') / ESCALA_FACTORES
+
+
+class CalificacionQuerySet(models.QuerySet):
+    """ 
+    Mantiene factores_empaquetados al día en las escrituras que no pasan por save(): 
+    bulk_create y bulk_update lo reempaquetan y update() lo deja en NULL, porque el UPDATE 
+    no conoce los demás factores de cada fila. Las filas en NULL se leen desde las columnas.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.empaquetar_factores()
+        update_fields = kwargs.get('update_fields')
+        if update_fields and any(campo in CAMPOS_FACTORES for campo in update_fields):
+            kwargs['update_fields'] = list(dict.fromkeys([*update_fields, 'factores_empaquetados']))
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if any(campo in CAMPOS_FACTORES for campo in fields):
+            objs = list(objs)
+            for obj in objs:
+                obj.empaquetar_factores()
+            fields = list(dict.fromkeys([*fields, 'factores_empaquetados']))
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if any(campo in CAMPOS_FACTORES for campo in kwargs):
+            kwargs.setdefault('factores_empaquetados', None)
+        return super().update(**kwargs)
+
+
 class CalificacionTributaria(models.Model):
     MERCADO_CHOICES = [
         ('AC', 'Acciones'),
@@ -155,16 +219,101 @@ class CalificacionTributaria(models.Model):
     factor_35 = models.DecimalField(max_digits=18, decimal_places=8, default=0, verbose_name="F35 Tasa Efectiva Cred FUT")
     factor_36 = models.DecimalField(max_digits=18, decimal_places=8, default=0, verbose_name="F36 Tasa Efectiva Cred FUNT")
     factor_37 = models.DecimalField(max_digits=18, decimal_places=8, default=0, verbose_name="F37 Dev Capital Art 17 num 7")
+
+    # Copia compacta de los 31 factores para matriz_factores; la mantienen save() y CalificacionQuerySet
+    factores_empaquetados = models.BinaryField(null=True, blank=True, editable=False)
     
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    objects = CalificacionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.instrumento} - {self.secuencia_evento} ({self.anio})"
 
+    def save(self, *args, **kwargs):
+        self.empaquetar_factores()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and any(campo in CAMPOS_FACTORES for campo in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'factores_empaquetados'}
+        super().save(*args, **kwargs)
+
+    def empaquetar_factores(self):
+        self.factores_empaquetados = empaquetar_factores(getattr(self, campo) for campo in CAMPOS_FACTORES)
+
+    @property
+    def vector_factores(self):
+        """ Factores como arreglo NumPy float64, en el orden de CODIGOS_FACTORES """
+        # Desde las columnas de la instancia: incluye cambios aún no guardados
+        return np.array([float(getattr(self, campo) or 0) for campo in CAMPOS_FACTORES])
+
+    def factor(self, codigo):
+        """ Valor exacto (Decimal) de un factor por código: '08', '19A', ... """
+        return getattr(self, f'factor_{codigo}')
+
+    @staticmethod
+    def matriz_factores(queryset):
+        """ 
+        Matriz (filas x 31) de factores leyendo solo la columna empaquetada, sin 
+        hidratar los Decimal de cada fila. Retorna (ids, matriz).
+        """
+        filas = list(queryset.values_list('pk', 'factores_empaquetados'))
+        ids = np.array([pk for pk, _ in filas], dtype=np.int64)
+        matriz = np.zeros((len(filas), len(CAMPOS_FACTORES)))
+
+        sin_empaquetar = {}
+        for i, (pk, empaquetado) in enumerate(filas):
+            if empaquetado:
+                matriz[i] = desempaquetar_factores(empaquetado)
+            else:
+                sin_empaquetar[pk] = i
+        if sin_empaquetar:
+            for pk, *valores in CalificacionTributaria.objects.filter(
+                    pk__in=sin_empaquetar.keys()).values_list('pk', *CAMPOS_FACTORES):
+                matriz[sin_empaquetar[pk]] = [float(v or 0) for v in valores]
+        return ids, matriz
+
     class Meta:
         verbose_name = "Calificación Tributaria (UI)"
         verbose_name_plural = "Calificaciones Tributarias (UI)"
+        # Índices para la paginación por llave (fecha_pago, id) del dashboard, con y sin filtros
+        indexes = [
+            models.Index(fields=['fecha_pago', 'id'], name='calif_fecha_idx'),
+            models.Index(fields=['anio', 'fecha_pago', 'id'], name='calif_anio_fecha_idx'),
+            models.Index(fields=['mercado', 'fecha_pago', 'id'], name='calif_mercado_fecha_idx'),
+        ]
+
+
+class CambioCalificacion(models.Model):
+    """
+    Bitácora de altas, modificaciones y bajas de calificaciones. El id autoincremental es el cursor
+    del feed de cambios; cada escritura agrega su fila al final de la transacción (ver sincronizacion.py)
+    """
+    TIPO_CHOICES = [
+        ('cambio', 'Alta o modificación'),
+        ('baja', 'Baja'),
+    ]
+
+    calificacion_id = models.BigIntegerField()
+    secuencia_evento = models.BigIntegerField()
+    anio = models.IntegerField()
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='cambio')
+    registrado_en = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cambio de Calificación"
+        verbose_name_plural = "Cambios de Calificaciones"
+
+    def __str__(self):
+        return f"#{self.pk} {self.secuencia_evento} ({self.anio}) {self.tipo}"
+
+    @classmethod
+    def registrar(cls, calificaciones, tipo='cambio'):
+        """ Una fila por calificación, con (pk, secuencia_evento, anio) """
+        cls.objects.bulk_create([
+            cls(calificacion_id=pk, secuencia_evento=secuencia, anio=anio, tipo=tipo)
+            for pk, secuencia, anio in calificaciones
+        ], batch_size=1000)
 
 
 class SolicitudEdicion(models.Model):
@@ -175,4 +324,114 @@ class SolicitudEdicion(models.Model):
     revisado = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"Solicitud de {self.solicitante.username} - {self.dato.nombre_dato}"
\ No newline at end of file
+        return f"Solicitud de {self.solicitante.username} - {self.dato.nombre_dato}"
+
+class TrabajoCarga(models.Model):
+    """ Carga masiva (o eliminación de clasificaciones) encolada; la procesa el worker `manage.py procesar_cargas` """
+    TIPO_CHOICES = [
+        ('datos', 'Datos Tributarios'),
+        ('calificaciones', 'Calificaciones Tributarias'),
+        ('eliminacion', 'Eliminación de Clasificaciones'),
+    ]
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+
+    archivo_nombre = models.CharField(max_length=255)
+    archivo_ruta = models.CharField(
+        max_length=255, blank=True,
+        help_text="Archivo en CARGA_MASIVA_DIRECTORIO_COLA mientras espera al worker; se borra al terminar"
+    )
+    parametros = models.JSONField(default=dict, blank=True)
+
+    creado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    registros_creados = models.PositiveIntegerField(default=0)
+    registros_actualizados = models.PositiveIntegerField(default=0)
+    total_errores = models.PositiveIntegerField(default=0)
+    errores = models.JSONField(default=list, blank=True, help_text="Primeros errores por fila")
+    detalle = models.JSONField(default=dict, blank=True)
+    mensaje = models.TextField(blank=True)
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    actualizado_en = models.DateTimeField(
+        null=True, blank=True, help_text="Último avance informado por el worker; sin avances se da por caído"
+    )
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"Carga #{self.pk} - {self.archivo_nombre} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Trabajo de Carga"
+        verbose_name_plural = "Trabajos de Carga"
+        indexes = [
+            models.Index(fields=['estado', 'creado_en'], name='trabajo_estado_idx'),
+        ]
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
+
+
+class ResumenClasificacion(models.Model):
+    """ Totales de DatoTributario por clasificación, mantenidos al escribir (ver resumenes.py) """
+    clasificacion = models.OneToOneField(
+        Clasificacion,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="resumen"
+    )
+    total_datos = models.PositiveBigIntegerField(default=0)
+    monto_total = models.DecimalField(max_digits=22, decimal_places=2, default=0)
+    montos_informados = models.PositiveBigIntegerField(default=0)
+    monto_maximo = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    monto_minimo = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    factor_total = models.DecimalField(max_digits=22, decimal_places=4, default=0)
+    factores_informados = models.PositiveBigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen {self.clasificacion_id}: {self.total_datos} datos"
+
+    @property
+    def monto_promedio(self):
+        return self.monto_total / self.montos_informados if self.montos_informados else None
+
+    class Meta:
+        verbose_name = "Resumen por Clasificación"
+        verbose_name_plural = "Resúmenes por Clasificación"
+
+
+class ResumenDiario(models.Model):
+    """ Cantidad de DatoTributario creados por día y clasificación """
+    clasificacion = models.ForeignKey(Clasificacion, on_delete=models.CASCADE, related_name="resumenes_diarios")
+    fecha = models.DateField()
+    total_datos = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.fecha} - {self.clasificacion_id}: {self.total_datos}"
+
+    class Meta:
+        verbose_name = "Resumen Diario"
+        verbose_name_plural = "Resúmenes Diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['clasificacion', 'fecha'], name='resumen_diario_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='resumen_diario_fecha_idx'),
+        ]
@@ -0,0 +1,84 @@
+from django.db.models import Q
+
+
+class PaginaKeyset:
+    """ Página de resultados por llave (campo, id); el costo no depende de qué tan profunda sea """
+
+    def __init__(self, objetos, campo, tiene_siguiente, tiene_anterior):
+        self.object_list = objetos
+        self.campo = campo
+        self.has_next = tiene_siguiente
+        self.has_previous = tiene_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, objeto):
+        valor = getattr(objeto, self.campo)
+        return f"{valor.isoformat() if hasattr(valor, 'isoformat') else valor}_{objeto.pk}"
+
+    @property
+    def cursor_siguiente(self):
+        return self._cursor(self.object_list[-1]) if self.has_next and self.object_list else None
+
+    @property
+    def cursor_anterior(self):
+        return self._cursor(self.object_list[0]) if self.has_previous and self.object_list else None
+
+
+def leer_cursor(queryset, campo, cursor):
+    """ 'valor_id' a (valor, id) tipados; None si el cursor no es válido """
+    if not cursor or '_' not in cursor:
+        return None
+    valor, _, pk = cursor.rpartition('_')
+    try:
+        return queryset.model._meta.get_field(campo).to_python(valor), int(pk)
+    except Exception:
+        return None
+
+
+def paginar_por_llave(queryset, campo, despues=None, antes=None, tamano=20):
+    """
+    Ordena de forma descendente por (campo, id) y filtra con WHERE sobre la llave en vez de
+    OFFSET. `despues` avanza a la página siguiente y `antes` retrocede a la anterior.
+    """
+    llave_despues = leer_cursor(queryset, campo, despues)
+    llave_antes = None if llave_despues else leer_cursor(queryset, campo, antes)
+
+    if llave_antes:
+        valor, pk = llave_antes
+        filas = list(
+            queryset.filter(Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'pk__gt': pk}))
+            .order_by(campo, 'pk')[:tamano + 1]
+        )
+        tiene_anterior = len(filas) > tamano
+        return PaginaKeyset(filas[:tamano][::-1], campo, True, tiene_anterior)
+
+    if llave_despues:
+        valor, pk = llave_despues
+        queryset = queryset.filter(Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'pk__lt': pk}))
+
+    filas = list(queryset.order_by(f'-{campo}', '-pk')[:tamano + 1])
+    return PaginaKeyset(filas[:tamano], campo, len(filas) > tamano, llave_despues is not None)
+
+
+def recorrer_en_lotes(queryset, campos, tamano=2000):
+    """
+    Recorre todo el queryset como tuplas de `campos`, de a `tamano` filas por consulta y
+    avanzando por id descendente. A diferencia de .iterator() en MySQL, nunca trae el
+    resultado completo a memoria.
+    """
+    ultimo = None
+    while True:
+        lote = queryset.order_by('-pk')
+        if ultimo is not None:
+            lote = lote.filter(pk__lt=ultimo)
+        filas = list(lote.values_list('pk', *campos)[:tamano])
+        for fila in filas:
+            yield fila[1:]
+        if len(filas) < tamano:
+            return
+        ultimo = filas[-1][0]
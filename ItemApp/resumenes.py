@@ -0,0 +1,226 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Clasificacion, DatoTributario, ResumenClasificacion, ResumenDiario
+
+CENTAVOS = Decimal('0.01')
+DIEZMILESIMOS = Decimal('0.0001')
+
+
+def _decimal(valor, exponente):
+    """ Mismo redondeo que aplica la base al guardar el DecimalField """
+    if valor is None:
+        return None
+    return Decimal(str(valor)).quantize(exponente)
+
+
+def _dia(creado_en):
+    return timezone.localdate(creado_en) if timezone.is_aware(creado_en) else creado_en.date()
+
+
+class CambiosResumen:
+    """
+    Acumula en memoria el efecto de altas, bajas y modificaciones de DatoTributario y
+    lo aplica a las tablas de resumen con una escritura por clasificación y por día.
+    """
+
+    def __init__(self):
+        self._clasificaciones = defaultdict(lambda: {
+            'total': 0, 'monto': Decimal(0), 'montos': 0, 'factor': Decimal(0), 'factores': 0,
+            'maximo': None, 'minimo': None, 'quitado_maximo': None, 'quitado_minimo': None,
+        })
+        self._dias = defaultdict(int)
+
+    def __bool__(self):
+        return bool(self._clasificaciones)
+
+    def _valores(self, clasificacion_id, monto, factor, signo):
+        cambio = self._clasificaciones[clasificacion_id]
+        monto = _decimal(monto, CENTAVOS)
+        factor = _decimal(factor, DIEZMILESIMOS)
+
+        if monto is not None:
+            cambio['monto'] += signo * monto
+            cambio['montos'] += signo
+            if signo > 0:
+                cambio['maximo'] = monto if cambio['maximo'] is None else max(cambio['maximo'], monto)
+                cambio['minimo'] = monto if cambio['minimo'] is None else min(cambio['minimo'], monto)
+            else:
+                cambio['quitado_maximo'] = monto if cambio['quitado_maximo'] is None else max(cambio['quitado_maximo'], monto)
+                cambio['quitado_minimo'] = monto if cambio['quitado_minimo'] is None else min(cambio['quitado_minimo'], monto)
+        if factor is not None:
+            cambio['factor'] += signo * factor
+            cambio['factores'] += signo
+
+    def alta(self, dato):
+        self._clasificaciones[dato.clasificacion_id]['total'] += 1
+        self._dias[(dato.clasificacion_id, _dia(dato.creado_en))] += 1
+        self._valores(dato.clasificacion_id, dato.monto, dato.factor, 1)
+
+    def baja(self, dato):
+        self._clasificaciones[dato.clasificacion_id]['total'] -= 1
+        self._dias[(dato.clasificacion_id, _dia(dato.creado_en))] -= 1
+        self._valores(dato.clasificacion_id, dato.monto, dato.factor, -1)
+
+    def modificacion(self, anterior, dato):
+        """ `anterior` es un dict con clasificacion_id, monto, factor y creado_en antes del cambio """
+        if anterior['clasificacion_id'] != dato.clasificacion_id:
+            self._clasificaciones[anterior['clasificacion_id']]['total'] -= 1
+            self._dias[(anterior['clasificacion_id'], _dia(anterior['creado_en']))] -= 1
+            self._clasificaciones[dato.clasificacion_id]['total'] += 1
+            self._dias[(dato.clasificacion_id, _dia(dato.creado_en))] += 1
+        self._valores(anterior['clasificacion_id'], anterior['monto'], anterior['factor'], -1)
+        self._valores(dato.clasificacion_id, dato.monto, dato.factor, 1)
+
+    def aplicar(self):
+        with transaction.atomic():
+            # Orden fijo de clasificaciones para que dos cargas concurrentes no se bloqueen en cruz
+            for clasificacion_id in sorted(self._clasificaciones):
+                cambio = self._clasificaciones[clasificacion_id]
+                resumen, _ = ResumenClasificacion.objects.select_for_update().get_or_create(
+                    clasificacion_id=clasificacion_id
+                )
+                resumen.total_datos += cambio['total']
+                resumen.monto_total += cambio['monto']
+                resumen.montos_informados += cambio['montos']
+                resumen.factor_total += cambio['factor']
+                resumen.factores_informados += cambio['factores']
+
+                quito_extremo = (
+                    (cambio['quitado_maximo'] is not None and resumen.monto_maximo is not None
+                     and cambio['quitado_maximo'] >= resumen.monto_maximo) or
+                    (cambio['quitado_minimo'] is not None and resumen.monto_minimo is not None
+                     and cambio['quitado_minimo'] <= resumen.monto_minimo)
+                )
+                if quito_extremo:
+                    extremos = DatoTributario.objects.filter(clasificacion_id=clasificacion_id).aggregate(
+                        maximo=Max('monto'), minimo=Min('monto')
+                    )
+                    resumen.monto_maximo = extremos['maximo']
+                    resumen.monto_minimo = extremos['minimo']
+                else:
+                    if cambio['maximo'] is not None:
+                        resumen.monto_maximo = cambio['maximo'] if resumen.monto_maximo is None \
+                            else max(resumen.monto_maximo, cambio['maximo'])
+                    if cambio['minimo'] is not None:
+                        resumen.monto_minimo = cambio['minimo'] if resumen.monto_minimo is None \
+                            else min(resumen.monto_minimo, cambio['minimo'])
+                resumen.save()
+
+            for (clasificacion_id, fecha), cantidad in sorted(self._dias.items()):
+                if cantidad == 0:
+                    continue
+                ResumenDiario.objects.get_or_create(clasificacion_id=clasificacion_id, fecha=fecha)
+                ResumenDiario.objects.filter(clasificacion_id=clasificacion_id, fecha=fecha).update(
+                    total_datos=F('total_datos') + cantidad
+                )
+
+        self._clasificaciones.clear()
+        self._dias.clear()
+
+
+def reconstruir_resumenes(clasificacion_id=None):
+    """ 
+    Recalcula los resúmenes desde DatoTributario, todos o los de una clasificación;
+    retorna (clasificaciones, días)
+    """
+    datos = DatoTributario.objects.all()
+    resumenes_clasificacion = ResumenClasificacion.objects.all()
+    resumenes_diarios = ResumenDiario.objects.all()
+    if clasificacion_id is not None:
+        datos = datos.filter(clasificacion_id=clasificacion_id)
+        resumenes_clasificacion = resumenes_clasificacion.filter(clasificacion_id=clasificacion_id)
+        resumenes_diarios = resumenes_diarios.filter(clasificacion_id=clasificacion_id)
+
+    por_clasificacion = datos.values('clasificacion_id').annotate(
+        total=Count('id'),
+        suma_monto=Sum('monto'),
+        montos=Count('monto'),
+        maximo=Max('monto'),
+        minimo=Min('monto'),
+        suma_factor=Sum('factor'),
+        factores=Count('factor'),
+    ).order_by()
+    por_dia = datos.annotate(fecha=TruncDate('creado_en')).values(
+        'clasificacion_id', 'fecha'
+    ).annotate(total=Count('id')).order_by()
+
+    with transaction.atomic():
+        resumenes_clasificacion.delete()
+        resumenes_diarios.delete()
+        resumenes = ResumenClasificacion.objects.bulk_create([
+            ResumenClasificacion(
+                clasificacion_id=fila['clasificacion_id'],
+                total_datos=fila['total'],
+                monto_total=fila['suma_monto'] or 0,
+                montos_informados=fila['montos'],
+                monto_maximo=fila['maximo'],
+                monto_minimo=fila['minimo'],
+                factor_total=fila['suma_factor'] or 0,
+                factores_informados=fila['factores'],
+            ) for fila in por_clasificacion
+        ], batch_size=1000)
+        dias = ResumenDiario.objects.bulk_create([
+            ResumenDiario(clasificacion_id=fila['clasificacion_id'], fecha=fila['fecha'], total_datos=fila['total'])
+            for fila in por_dia
+        ], batch_size=1000)
+
+    from .estadisticas import invalidar_estadisticas
+    invalidar_estadisticas()
+    return len(resumenes), len(dias)
+
+
+def totales_globales():
+    """ Totales de todo DatoTributario leyendo una fila por clasificación """
+    totales = ResumenClasificacion.objects.aggregate(
+        total_datos=Sum('total_datos'),
+        monto_total=Sum('monto_total'),
+        montos_informados=Sum('montos_informados'),
+        monto_maximo=Max('monto_maximo'),
+        monto_minimo=Min('monto_minimo'),
+        factor_total=Sum('factor_total'),
+        factores_informados=Sum('factores_informados'),
+    )
+    montos = totales['montos_informados'] or 0
+    factores = totales['factores_informados'] or 0
+    return {
+        'total_datos': totales['total_datos'] or 0,
+        'monto_total': totales['monto_total'] or 0,
+        'monto_promedio': totales['monto_total'] / montos if montos else 0,
+        'monto_maximo': totales['monto_maximo'] or 0,
+        'monto_minimo': totales['monto_minimo'] or 0,
+        'factor_promedio': totales['factor_total'] / factores if factores else 0,
+    }
+
+
+def datos_creados_desde(fecha):
+    return ResumenDiario.objects.filter(fecha__gte=fecha).aggregate(total=Sum('total_datos'))['total'] or 0
+
+
+def clasificaciones_con_resumen():
+    """ Clasificaciones con total_datos y monto_total tomados del resumen, de mayor a menor """
+    return Clasificacion.objects.annotate(
+        total_datos=Coalesce(F('resumen__total_datos'), Value(0)),
+        monto_total=F('resumen__monto_total')
+    ).order_by('-total_datos')
+
+
+def reporte_desde_resumen(clasificacion_id=None):
+    """ Mismas filas que el reporte agrupado por clasificación, sin recorrer DatoTributario """
+    resumenes = ResumenClasificacion.objects.filter(total_datos__gt=0).select_related('clasificacion')
+    if clasificacion_id:
+        resumenes = resumenes.filter(clasificacion_id=int(clasificacion_id))
+    return [
+        {
+            'clasificacion__nombre': resumen.clasificacion.nombre,
+            'total_datos': resumen.total_datos,
+            'monto_total': resumen.monto_total if resumen.montos_informados else None,
+            'monto_promedio': resumen.monto_promedio,
+        }
+        for resumen in resumenes.order_by(F('monto_total').desc(nulls_last=True))
+    ]
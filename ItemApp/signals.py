@@ -0,0 +1,85 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .estadisticas import invalidar_estadisticas
+from .fragmentos import invalidar_fragmentos
+from .models import (
+    CalificacionTributaria,
+    CambioCalificacion,
+    Clasificacion,
+    DatoTributario,
+    RegistroNUAM,
+    ResumenClasificacion
+)
+from .resumenes import CambiosResumen
+
+
+@receiver(pre_save, sender=DatoTributario)
+def recordar_valores_anteriores(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._resumen_anterior = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {'clasificacion', 'monto', 'factor'} & set(update_fields):
+        return
+    instance._resumen_anterior = DatoTributario.objects.filter(pk=instance.pk).values(
+        'clasificacion_id', 'monto', 'factor', 'creado_en'
+    ).first()
+
+
+@receiver(post_save, sender=DatoTributario)
+def actualizar_resumen_al_guardar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    cambios = CambiosResumen()
+    anterior = getattr(instance, '_resumen_anterior', None)
+    if created:
+        cambios.alta(instance)
+    elif anterior:
+        cambios.modificacion(anterior, instance)
+    if cambios:
+        cambios.aplicar()
+
+
+@receiver(post_delete, sender=DatoTributario)
+def actualizar_resumen_al_eliminar(sender, instance, origin=None, **kwargs):
+    # Si se está borrando la clasificación completa sus resúmenes se van en cascada
+    if isinstance(origin, Clasificacion) or getattr(origin, 'model', None) is Clasificacion:
+        return
+    cambios = CambiosResumen()
+    cambios.baja(instance)
+    cambios.aplicar()
+
+
+@receiver(post_save, sender=CalificacionTributaria)
+def registrar_cambio_calificacion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    CambioCalificacion.registrar([(instance.pk, instance.secuencia_evento, instance.anio)])
+
+
+@receiver(post_delete, sender=CalificacionTributaria)
+def registrar_baja_calificacion(sender, instance, **kwargs):
+    CambioCalificacion.registrar([(instance.pk, instance.secuencia_evento, instance.anio)], tipo='baja')
+
+
+# Cualquier cambio en lo que cuenta el panel descarta sus estadísticas en caché.
+# Los datos tributarios llegan a través de ResumenClasificacion, que se guarda en cada alta o carga.
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=RegistroNUAM)
+@receiver([post_save, post_delete], sender=Clasificacion)
+@receiver([post_save, post_delete], sender=ResumenClasificacion)
+def invalidar_estadisticas_panel(sender, **kwargs):
+    invalidar_estadisticas()
+
+
+# Fragmentos de inicio, panel y reportes. Las cargas masivas no emiten señales por fila:
+# las de datos pasan por ResumenClasificacion y las de calificaciones invalidan al terminar.
+@receiver([post_save, post_delete], sender=Clasificacion)
+@receiver([post_save, post_delete], sender=DatoTributario)
+@receiver([post_save, post_delete], sender=CalificacionTributaria)
+@receiver([post_save, post_delete], sender=ResumenClasificacion)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=RegistroNUAM)
+def invalidar_fragmentos_dashboards(sender, **kwargs):
+    invalidar_fragmentos()
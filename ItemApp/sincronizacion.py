@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import CalificacionTributaria, CambioCalificacion
+
+CAMPOS_FEED = [
+    campo.attname for campo in CalificacionTributaria._meta.concrete_fields
+    if campo.name != 'factores_empaquetados'
+]
+
+
+def tope_visible(desde):
+    """
+    Primer id de la bitácora que todavía no se entrega. Un id se asigna al insertar y no al
+    confirmar, así que uno menor puede aparecer después de uno mayor; como cada escritura agrega
+    su fila al final de la transacción, ese retraso queda acotado por SINCRONIZACION_MARGEN y
+    basta con no pasar de la primera fila registrada dentro del margen.
+    """
+    corte = timezone.now() - timedelta(seconds=getattr(settings, 'SINCRONIZACION_MARGEN', 5))
+    return CambioCalificacion.objects.filter(id__gt=desde, registrado_en__gte=corte).aggregate(
+        tope=Min('id')
+    )['tope']
+
+
+def cambios_calificaciones(desde=0, limite=500):
+    """
+    Entradas de la bitácora posteriores al cursor `desde`, en orden de id. Las altas y
+    modificaciones se entregan con el estado actual de la calificación (una vez por página) y las
+    bajas con su identificación; el cursor es el id de la última entrada leída.
+    """
+    entradas = CambioCalificacion.objects.filter(id__gt=desde)
+    tope = tope_visible(desde)
+    if tope is not None:
+        entradas = entradas.filter(id__lt=tope)
+    entradas = list(entradas.order_by('id')[:limite + 1])
+    hay_mas = len(entradas) > limite
+    entradas = entradas[:limite]
+
+    # Solo la última entrada de cada calificación en la página; lo anterior quedó superado
+    ultimas = {entrada.calificacion_id: entrada for entrada in entradas}
+    ids_cambios = [pk for pk, entrada in ultimas.items() if entrada.tipo == 'cambio']
+    vigentes = CalificacionTributaria.objects.only(*CAMPOS_FEED).in_bulk(ids_cambios)
+
+    cambios = []
+    eliminadas = []
+    for entrada in sorted(ultimas.values(), key=lambda entrada: entrada.pk):
+        if entrada.tipo == 'baja':
+            eliminadas.append({
+                'id': entrada.calificacion_id,
+                'secuencia_evento': entrada.secuencia_evento,
+                'anio': entrada.anio,
+                'eliminado_en': entrada.registrado_en,
+            })
+        elif entrada.calificacion_id in vigentes:
+            # Si ya no existe, su baja viene más adelante en la bitácora
+            calificacion = vigentes[entrada.calificacion_id]
+            cambios.append({campo: getattr(calificacion, campo) for campo in CAMPOS_FEED})
+
+    return {
+        'cambios': cambios,
+        'eliminadas': eliminadas,
+        'cursor': entradas[-1].pk if entradas else desde,
+        'hay_mas': hay_mas,
+    }
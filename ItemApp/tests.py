@@ -1,3 +1,1089 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import carga, eliminacion, indice_factores
+from .carga import (
+    ALIAS_COLUMNAS,
+    FILAS_VISTA_PREVIA,
+    MotorCargaCalificaciones,
+    MotorCargaDatos,
+    _detectar_por_encabezados,
+    cargar_datos_tributarios,
+    contar_filas_archivo,
+    detectar_columnas,
+    leer_archivo_por_bloques,
+    leer_encabezado_archivo
+)
+from .creditos import calcular_creditos, leer_tenencias
+from .indice_factores import AniosPorSecuencia, IndiceFactores, _indices, buscar_factores
+from .models import (
+    CalificacionTributaria,
+    CambioCalificacion,
+    Clasificacion,
+    DatoTributario,
+    RegistroNUAM,
+    ResumenClasificacion,
+    SolicitudEdicion,
+    TrabajoCarga,
+    empaquetar_factores
+)
+from .paginacion import paginar_por_llave
+from .sincronizacion import cambios_calificaciones
+from .trabajos import ejecutar_trabajo, procesar_carga, tomar_siguiente_trabajo
+from .validacion import CAMPOS_FACTORES, CODIGOS_FACTORES, convertir_factores, ejecutar_en_paralelo, resolver_columnas_factores
+
+# El backend de caché por defecto, en un directorio propio de las pruebas
+CACHE_PRUEBAS = {
+    'default': dict(settings.CACHES['default'], LOCATION=os.path.join(tempfile.gettempdir(), 'nuam_cache_pruebas'))
+}
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class PanelAdministracionConsultasTest(TestCase):
+    """ El panel no debe volver a crecer en consultas a medida que se agregan contadores """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin@nuam.cl', 'admin@nuam.cl', 'clave', is_staff=True)
+        User.objects.create_user('usuario@nuam.cl', 'usuario@nuam.cl', 'clave')
+        clasificacion = Clasificacion.objects.create(nombre='Dividendos', creado_por=cls.admin)
+        for i in range(3):
+            DatoTributario.objects.create(clasificacion=clasificacion, nombre_dato=f'Dato {i}', monto=100 * i)
+        RegistroNUAM.objects.create(
+            nombre_completo='Usuario Prueba', email='usuario@nuam.cl', pais='chile',
+            identificador_tributario='11.111.111-1', fecha_nacimiento='1990-01-01'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_panel_con_cache_vacia(self):
+        # sesión, usuario, 7 agregados de estadísticas, solicitudes y los 3 listados recientes
+        with self.assertNumQueries(13):
+            respuesta = self.client.get(reverse('admin_panel'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['total_usuarios'], 2)
+        self.assertEqual(respuesta.context['total_staff'], 1)
+        self.assertEqual(respuesta.context['total_datos_tributarios'], 3)
+
+    def test_panel_con_cache(self):
+        # Con los fragmentos en caché solo quedan la sesión, el usuario y las solicitudes pendientes
+        self.client.get(reverse('admin_panel'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('admin_panel'))
+
+    def test_cache_se_invalida_al_crear_datos(self):
+        self.client.get(reverse('admin_panel'))
+        DatoTributario.objects.create(
+            clasificacion=Clasificacion.objects.get(), nombre_dato='Nuevo', monto=50
+        )
+        respuesta = self.client.get(reverse('admin_panel'))
+        self.assertEqual(respuesta.context['total_datos_tributarios'], 4)
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class FragmentosDashboardTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario@nuam.cl', 'usuario@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Intereses', creado_por=cls.usuario)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_inicio_con_cache_no_consulta_datos(self):
+        self.client.get(reverse('inicio'))
+        with self.assertNumQueries(3):
+            self.client.get(reverse('inicio'))
+
+    def test_inicio_se_actualiza_al_crear_datos(self):
+        self.client.get(reverse('inicio'))
+        DatoTributario.objects.create(clasificacion=self.clasificacion, nombre_dato='Cupón Bono', monto=10)
+        respuesta = self.client.get(reverse('inicio'))
+        self.assertContains(respuesta, 'Cupón Bono')
+
+
+class ApiActividadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('actividad@nuam.cl', 'actividad@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Actividad', creado_por=cls.usuario)
+        for monto in (10, 20, 30):
+            DatoTributario.objects.create(clasificacion=cls.clasificacion, nombre_dato=f'Dato {monto}', monto=monto)
+        cls.hoy = timezone.localdate()
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.parametros = {'desde': (self.hoy - timedelta(days=2)).isoformat(), 'hasta': self.hoy.isoformat()}
+
+    def consultar(self, parametros=None, encabezados=None):
+        return self.client.get(reverse('api_actividad'), parametros or self.parametros, headers=encabezados)
+
+    def test_serie_por_dia_con_periodos_vacios(self):
+        respuesta = self.consultar()
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual((datos['agrupacion'], datos['desde'], datos['hasta']),
+                         ('dia', self.parametros['desde'], self.parametros['hasta']))
+        self.assertEqual([periodo['total'] for periodo in datos['serie']], [0, 0, 3])
+        self.assertEqual(datos['serie'][-1], {'periodo': self.hoy.isoformat(), 'total': 3, 'monto_total': 60.0})
+
+        semanal = self.consultar(dict(self.parametros, agrupacion='semana')).json()['serie']
+        lunes = self.hoy - timedelta(days=self.hoy.weekday())
+        self.assertEqual(semanal[-1], {'periodo': lunes.isoformat(), 'total': 3, 'monto_total': 60.0})
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.consultar({'agrupacion': 'hora'}).status_code, 400)
+        self.assertEqual(self.consultar({'desde': '2024-13-01'}).status_code, 400)
+        self.assertEqual(self.consultar({'desde': '2024-02-01', 'hasta': '2024-01-01'}).status_code, 400)
+
+    def test_etag_y_last_modified(self):
+        respuesta = self.consultar()
+        etag = respuesta.headers['ETag']
+        self.assertTrue(respuesta.headers['Last-Modified'])
+        self.assertIn('private', respuesta.headers['Cache-Control'])
+
+        no_modificada = self.consultar(encabezados={'If-None-Match': etag})
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada.content, b'')
+        self.assertEqual(self.consultar(encabezados={'If-Modified-Since': respuesta.headers['Last-Modified']}).status_code, 304)
+        self.assertNotEqual(self.consultar(dict(self.parametros, agrupacion='mes')).headers['ETag'], etag)
+
+        DatoTributario.objects.create(clasificacion=self.clasificacion, nombre_dato='Nuevo', monto=5)
+        actualizada = self.consultar(encabezados={'If-None-Match': etag})
+        self.assertEqual(actualizada.status_code, 200)
+        self.assertEqual(actualizada.json()['serie'][-1]['total'], 4)
+
+
+def archivo_csv(lineas, nombre='datos.csv'):
+    return SimpleUploadedFile(nombre, '\n'.join(lineas).encode('utf-8'))
+
+
+def archivo_xlsx(filas, nombre='datos.xlsx'):
+    libro = openpyxl.Workbook()
+    for fila in filas:
+        libro.active.append(fila)
+    contenido = io.BytesIO()
+    libro.save(contenido)
+    return SimpleUploadedFile(nombre, contenido.getvalue())
+
+
+def calificacion(secuencia, **campos):
+    datos = {'instrumento': 'NEMO', 'fecha_pago': date(2024, 5, 1), 'anio': 2024, 'secuencia_evento': secuencia}
+    datos.update(campos)
+    return datos
+
+
+@override_settings(CARGA_MASIVA_TAMANO_LOTE=2, CARGA_MASIVA_PROCESOS=1)
+class MotorCargaDatosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('carga@nuam.cl', 'carga@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Dividendos', creado_por=cls.usuario)
+
+    def cargar(self, lineas, modo_carga='crear'):
+        return cargar_datos_tributarios(archivo_csv(lineas), self.clasificacion, self.usuario, modo_carga)
+
+    def test_crear_en_lotes_actualiza_resumen(self):
+        motor = self.cargar(['Nombre;Monto', 'A;10', 'B;20', 'C;30'])
+        self.assertEqual((motor.filas_procesadas, motor.registros_creados, motor.errores), (3, 3, []))
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.clasificacion).total_datos, 3)
+
+    def test_errores_en_orden_del_archivo(self):
+        # La fila 3 falla al validar y la 5 recién al escribir su lote, que se reintenta fila a fila
+        construir = MotorCargaDatos._construir_dato
+
+        def construir_con_fecha_invalida(motor, datos):
+            dato = construir(motor, datos)
+            if dato.nombre_dato == 'C':
+                dato.fecha_dato = 'no es fecha'
+            return dato
+
+        with mock.patch.object(MotorCargaDatos, '_construir_dato', construir_con_fecha_invalida):
+            motor = self.cargar(['Nombre;Monto', 'A;10', ';5', 'B;20', 'C;30', 'D;40'])
+        self.assertEqual(motor.registros_creados, 3)
+        self.assertEqual([error.split(':')[0] for error in motor.errores], ['Fila 3', 'Fila 5'])
+
+    def test_actualizar_crea_y_modifica(self):
+        self.cargar(['Nombre;Monto', 'A;10', 'B;20'])
+        motor = self.cargar(['Nombre;Monto', 'A;11', 'C;30', 'A;12'], modo_carga='actualizar')
+        self.assertEqual((motor.registros_creados, motor.registros_actualizados), (1, 2))
+        self.assertEqual(DatoTributario.objects.get(nombre_dato='A').monto, 12)
+        self.assertEqual(DatoTributario.objects.count(), 3)
+
+    def test_actualizar_solo_escribe_filas_modificadas(self):
+        self.cargar(['Nombre;Monto', 'A;10', 'B;20'])
+        creado_en = DatoTributario.objects.get(nombre_dato='B').creado_en
+        with mock.patch('ItemApp.carga._guardar_modificados', wraps=carga._guardar_modificados) as guardar:
+            motor = self.cargar(['Nombre;Monto', 'A;10.00', 'B;25'], modo_carga='actualizar')
+        self.assertEqual(motor.registros_actualizados, 2)
+        self.assertEqual([[dato.nombre_dato for dato in args[0]] for args, _ in guardar.call_args_list], [['B']])
+        dato = DatoTributario.objects.get(nombre_dato='B')
+        self.assertEqual((dato.monto, dato.creado_en), (25, creado_en))
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.clasificacion).monto_total, 35)
+
+    def test_actualizar_sin_upsert_usa_bulk_update(self):
+        self.cargar(['Nombre;Monto', 'A;10', 'B;20'])
+        with mock.patch.object(type(connection.features), 'supports_update_conflicts', False):
+            self.cargar(['Nombre;Monto', 'A;11', 'B;20'], modo_carga='actualizar')
+        self.assertEqual(
+            list(DatoTributario.objects.order_by('nombre_dato').values_list('monto', flat=True)), [11, 20]
+        )
+
+
+class MotorCargaCalificacionesTest(TestCase):
+
+    def test_upsert_por_secuencia(self):
+        motor = MotorCargaCalificaciones(tamano_lote=2)
+        for i, secuencia in enumerate([1, 2, 3]):
+            motor.agregar(i, calificacion(secuencia, factor_08=0.5))
+        motor.finalizar()
+        self.assertEqual((motor.registros_insertados, motor.registros_actualizados), (3, 0))
+
+        motor = MotorCargaCalificaciones(tamano_lote=2)
+        motor.agregar(0, calificacion(3, factor_08=0.7))
+        motor.agregar(1, calificacion(4))
+        motor.finalizar()
+        self.assertEqual((motor.registros_insertados, motor.registros_actualizados), (1, 1))
+        self.assertEqual(CalificacionTributaria.objects.get(secuencia_evento=3).factor('08'), Decimal('0.7'))
+
+    def test_fila_invalida_no_descarta_el_lote(self):
+        motor = MotorCargaCalificaciones(tamano_lote=3)
+        motor.agregar(0, calificacion(1))
+        motor.agregar(1, calificacion(2, fecha_pago='no es fecha'))
+        motor.agregar(2, calificacion(3))
+        motor.finalizar()
+        self.assertEqual(motor.registros_insertados, 2)
+        self.assertEqual(len(motor.errores), 1)
+        self.assertTrue(motor.errores[0].startswith('Fila 1:'))
+
+
+class ColumnasFactoresTest(TestCase):
+
+    def test_f19a_no_queda_en_factor_19(self):
+        for columnas in (['SEC_EVE', 'F19A-Crédito', 'F19-Incremento'], ['SEC_EVE', 'F19-Incremento', 'F19A-Crédito']):
+            mapeo = resolver_columnas_factores(columnas)
+            self.assertEqual(mapeo['factor_19A'], 'F19A-Crédito')
+            self.assertEqual(mapeo['factor_19'], 'F19-Incremento')
+
+        mapeo = resolver_columnas_factores(['F19A-Crédito'])
+        self.assertEqual((mapeo['factor_19A'], mapeo['factor_19']), ('F19A-Crédito', None))
+
+    def test_variantes_de_encabezado(self):
+        mapeo = resolver_columnas_factores(['FACTOR 8', 'F09-Otro', 'F08- No Constitutiva', 'FACTOR-10', 'F37'])
+        self.assertEqual(mapeo['factor_08'], 'FACTOR 8')
+        self.assertEqual(mapeo['factor_09'], 'F09-Otro')
+        self.assertEqual(mapeo['factor_10'], 'FACTOR-10')
+        self.assertEqual(mapeo['factor_37'], 'F37')
+        self.assertEqual(resolver_columnas_factores(['F08- No Constitutiva'])['factor_08'], 'F08- No Constitutiva')
+        self.assertEqual(set(mapeo), {f'factor_{codigo}' for codigo in CODIGOS_FACTORES})
+        self.assertIsNone(mapeo['factor_20'])
+
+    def test_convierte_el_bloque_de_factores(self):
+        df = pd.DataFrame({'F08-A': ['0,5', '$1.25', None], 'F09-B': ['x', '', 2]})
+        factores = convertir_factores(df, resolver_columnas_factores(list(df.columns)))
+        self.assertEqual(factores['factor_08'].tolist(), [0.5, 1.25, 0.0])
+        self.assertEqual(factores['factor_09'].tolist(), [0.0, 0.0, 2.0])
+        self.assertEqual(factores['factor_10'].tolist(), [0.0, 0.0, 0.0])
+
+
+class FactoresEmpaquetadosTest(TestCase):
+
+    def setUp(self):
+        self.calificacion = CalificacionTributaria.objects.create(
+            **calificacion(1, factor_08=Decimal('0.5'), factor_19A=Decimal('0.12345678'))
+        )
+        CalificacionTributaria.objects.create(**calificacion(2, factor_08=Decimal('0.1')))
+
+    def matriz(self):
+        ids, matriz = CalificacionTributaria.matriz_factores(CalificacionTributaria.objects.order_by('pk'))
+        return dict(zip(ids.tolist(), matriz.tolist()))
+
+    def test_update_de_queryset_no_deja_vector_desactualizado(self):
+        CalificacionTributaria.objects.filter(secuencia_evento=1).update(factor_08=Decimal('0.9'))
+        self.calificacion.refresh_from_db()
+        self.assertIsNone(self.calificacion.factores_empaquetados)
+        self.assertEqual(self.calificacion.factor('08'), Decimal('0.9'))
+        self.assertEqual(self.matriz()[self.calificacion.pk][0], 0.9)
+
+        # Un update sin factores conserva el vector, y save() lo vuelve a armar
+        CalificacionTributaria.objects.filter(secuencia_evento=2).update(descripcion='Otra')
+        self.assertIsNotNone(CalificacionTributaria.objects.get(secuencia_evento=2).factores_empaquetados)
+        self.calificacion.save(update_fields=['factor_08'])
+        self.calificacion.refresh_from_db()
+        self.assertEqual(bytes(self.calificacion.factores_empaquetados), empaquetar_factores(
+            getattr(self.calificacion, campo) for campo in CAMPOS_FACTORES
+        ))
+
+    def test_bulk_update_reempaqueta(self):
+        self.calificacion.factor_09 = Decimal('0.25')
+        CalificacionTributaria.objects.bulk_update([self.calificacion], ['factor_09'])
+        fila = self.matriz()[self.calificacion.pk]
+        self.assertEqual(fila[:2], [0.5, 0.25])
+        self.assertEqual(fila[CODIGOS_FACTORES.index('19A')], 0.12345678)
+
+    def test_factor_de_instancia_sin_guardar(self):
+        self.calificacion.factor_10 = Decimal('1.5')
+        self.assertEqual(self.calificacion.factor('10'), Decimal('1.5'))
+        self.assertEqual(self.calificacion.vector_factores[CODIGOS_FACTORES.index('10')], 1.5)
+        self.assertEqual(self.calificacion.factor('19A'), Decimal('0.12345678'))
+
+
+class MigracionFactoresEmpaquetadosTest(TransactionTestCase):
+
+    def test_empaqueta_las_calificaciones_existentes(self):
+        executor = MigrationExecutor(connection)
+        ultima = executor.loader.graph.leaf_nodes('ItemApp')
+        anterior = [('ItemApp', '0011_trabajocarga')]
+        executor.migrate(anterior)
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(ultima))
+
+        antes = executor.loader.project_state(anterior).apps.get_model('ItemApp', 'CalificacionTributaria')
+        antes.objects.create(**calificacion(1, factor_08=Decimal('0.5'), factor_19A=Decimal('-0.00000001')))
+        antes.objects.create(**calificacion(2, factor_37=Decimal('1234567890.12345678')))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('ItemApp', '0012_calificaciontributaria_factores_empaquetados')])
+
+        for fila in CalificacionTributaria.objects.order_by('secuencia_evento').values():
+            with self.subTest(secuencia=fila['secuencia_evento']):
+                self.assertEqual(
+                    bytes(fila['factores_empaquetados']),
+                    empaquetar_factores(fila[campo] for campo in CAMPOS_FACTORES)
+                )
+
+
+class LecturaPorBloquesTest(TestCase):
+
+    def test_csv_latin1_con_punto_y_coma(self):
+        contenido = 'Descripción;Monto\n' + ''.join(f'Ítem {i};{i},5\n' for i in range(5))
+        bloques = list(leer_archivo_por_bloques(SimpleUploadedFile('datos.csv', contenido.encode('latin-1')), 2))
+        self.assertEqual([len(bloque) for bloque in bloques], [2, 2, 1])
+        self.assertEqual(list(bloques[0].columns), ['Descripción', 'Monto'])
+        self.assertEqual(bloques[2].iloc[0]['Descripción'], 'Ítem 4')
+        self.assertEqual(bloques[0].attrs['dialecto']['delimitador'], ';')
+
+    def test_xlsx_en_bloques_sin_filas_ni_columnas_vacias(self):
+        filas = [['Nombre', None, 'Monto', 'Monto']] + [[f'D{i}', None, i, i * 2] for i in range(3)]
+        filas.insert(2, [None, None, None, None])
+        bloques = list(leer_archivo_por_bloques(archivo_xlsx(filas), 2))
+        self.assertEqual([len(bloque) for bloque in bloques], [1, 2])
+        self.assertEqual(list(bloques[0].columns), ['Nombre', 'Monto', 'Monto.1'])
+        self.assertEqual(bloques[1]['Monto.1'].tolist(), [2, 4])
+
+
+    def test_encabezado_lee_solo_las_primeras_filas(self):
+        lineas = ['Nombre;Monto'] + [f'D{i};{i}' for i in range(FILAS_VISTA_PREVIA * 4)]
+        with mock.patch.object(carga, 'leer_csv_por_bloques', wraps=carga.leer_csv_por_bloques) as leer:
+            df = leer_encabezado_archivo(archivo_csv(lineas))
+        self.assertEqual(len(df), FILAS_VISTA_PREVIA)
+        self.assertEqual(leer.call_args.args[1], FILAS_VISTA_PREVIA)
+        self.assertIsNone(leer_encabezado_archivo(archivo_csv(['Nombre;Monto'])))
+
+    def test_contar_filas_sin_parsear(self):
+        lineas = ['Nombre;Monto'] + [f'D{i};{i}' for i in range(7)]
+        self.assertEqual(contar_filas_archivo(archivo_csv(lineas)), 7)
+        self.assertEqual(contar_filas_archivo(SimpleUploadedFile('datos.csv', ('\n'.join(lineas) + '\n').encode())), 7)
+        self.assertEqual(contar_filas_archivo(archivo_csv(['Nombre;Monto'])), 0)
+        self.assertEqual(contar_filas_archivo(archivo_xlsx([['Nombre', 'Monto']] + [[f'D{i}', i] for i in range(5)])), 5)
+
+    def test_vista_previa_sin_columna_nombre_informa_total_aproximado(self):
+        usuario = User.objects.create_user('encabezado@nuam.cl', 'encabezado@nuam.cl', 'clave')
+        self.client.force_login(usuario)
+        lineas = ['Código;Monto'] + [f'C{i};{i}' for i in range(FILAS_VISTA_PREVIA * 3)]
+        with mock.patch('ItemApp.views.preparar_archivo') as preparar:
+            respuesta = self.client.post(reverse('preview_archivo'), {'archivo': archivo_csv(lineas)}).json()
+        preparar.assert_not_called()
+        self.assertTrue(respuesta['success'])
+        self.assertEqual((respuesta['total_filas'], respuesta['total_aproximado']), (FILAS_VISTA_PREVIA * 3, True))
+        self.assertIsNone(respuesta['token'])
+        self.assertEqual(len(respuesta['preview']), 5)
+        self.assertEqual(respuesta['columnas_no_detectadas'], ['nombre'])
+
+
+def detectar_como_antes(columnas):
+    """ Algoritmo de detección anterior a la tabla de alias precalculada: {tipo: índice} """
+    def normalizar(texto):
+        return str(texto).lower().strip().replace(' ', '').replace('-', '').replace('_', '').replace('.', '') if texto else ''
+
+    detectadas = {}
+    for tipo, posibles in ALIAS_COLUMNAS.items():
+        encontrada = mejor = None
+        mejor_score = 0
+        for col in columnas:
+            normalizada = normalizar(col)
+            for nombre in map(normalizar, posibles):
+                if nombre == normalizada:
+                    encontrada = col
+                    mejor_score = 100
+                    break
+                if nombre and normalizada:
+                    if nombre in normalizada:
+                        score = (len(nombre) / max(len(normalizada), 1)) * 100
+                    elif normalizada in nombre and len(normalizada) > 3:
+                        score = (len(normalizada) / len(nombre)) * 80
+                    else:
+                        continue
+                    if score > mejor_score:
+                        mejor_score = score
+                        mejor = col
+        if encontrada:
+            detectadas[tipo] = columnas.index(encontrada)
+        elif mejor and mejor_score > 40:
+            detectadas[tipo] = columnas.index(mejor)
+    return detectadas
+
+
+class DeteccionColumnasTest(TestCase):
+
+    def detectar(self, columnas):
+        detectadas, _, _ = detectar_columnas(pd.DataFrame([range(len(columnas))], columns=columnas))
+        return {tipo: datos['indice'] for tipo, datos in detectadas.items()}
+
+    def test_igual_al_algoritmo_anterior(self):
+        casos = [
+            ['Nombre', 'Monto', 'Factor', 'Fecha'],
+            ['Detalle', 'Importe', 'fecha', 'Fecha Registro'],
+            ['Concepto del pago', 'Monto total', 'Ratio %', 'Fec. Pago'],
+            ['Fech', 'desc', 'MNT', 'coef'],
+            ['nombre completo', 'nombre', 'valor'],
+            ['Código', 'RUT', 'Observación'],
+        ]
+        azar = random.Random(13)
+        aliases = [alias for lista in ALIAS_COLUMNAS.values() for alias in lista] + ['id', 'rut', 'obs', 'x']
+        for _ in range(300):
+            columnas = []
+            for alias in azar.sample(aliases, azar.randint(1, 6)):
+                columnas.append(azar.choice([
+                    alias, alias.upper(), f'{alias} pago', f'Total {alias}', alias[:4], alias.replace('_', ' ')
+                ]))
+            casos.append(list(dict.fromkeys(columnas)))
+
+        for columnas in casos:
+            with self.subTest(columnas=columnas):
+                self.assertEqual(self.detectar(columnas), detectar_como_antes(columnas))
+
+    def test_resultado_en_cache_no_se_comparte(self):
+        columnas = ['Descripción', 'Valor', 'Fecha']
+        primera, _, _ = detectar_columnas(pd.DataFrame([[1, 2, 3]], columns=columnas))
+        primera['nombre']['nombre_original'] = 'modificado'
+        aciertos = _detectar_por_encabezados.cache_info().hits
+        segunda, no_detectadas, _ = detectar_columnas(pd.DataFrame([[1, 2, 3]], columns=columnas))
+        self.assertEqual(_detectar_por_encabezados.cache_info().hits, aciertos + 1)
+        self.assertEqual(segunda['nombre'], {'nombre_original': 'Descripción', 'nombre_normalizado': 'descripción', 'indice': 0})
+        self.assertEqual(no_detectadas, [])
+
+
+@override_settings(CARGA_MASIVA_TAMANO_LOTE=2, CARGA_MASIVA_PROCESOS=1)
+class ArchivosPreparadosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('previa@nuam.cl', 'previa@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Previa', creado_por=cls.usuario)
+
+    def setUp(self):
+        raiz = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, raiz)
+        self.directorio = os.path.join(raiz, 'preparados')
+        ajustes = self.settings(CARGA_MASIVA_DIRECTORIO_PREPARADOS=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(self.usuario)
+        self.lineas = ['Nombre;Monto;Fecha', 'A;10;15/01/2024', ';5;', 'B;1,5;', 'C;x;01/02/2024']
+
+    def vista_previa(self, lineas):
+        return self.client.post(reverse('preview_archivo'), {'archivo': archivo_csv(lineas)}).json()
+
+    def cargar(self, lineas, token=None):
+        return cargar_datos_tributarios(archivo_csv(lineas), self.clasificacion, self.usuario, token=token)
+
+    def test_la_carga_usa_lo_validado_en_la_vista_previa(self):
+        previa = self.vista_previa(self.lineas)
+        self.assertEqual((previa['total_filas'], previa['total_aproximado']), (4, False))
+        self.assertEqual(os.stat(self.directorio).st_mode & 0o777, 0o700)
+        self.assertEqual(os.listdir(self.directorio), [f"{previa['token']}.parquet"])
+
+        with mock.patch.object(carga, 'leer_archivo_por_bloques') as leer:
+            motor = self.cargar(self.lineas, token=previa['token'])
+        leer.assert_not_called()
+        self.assertEqual(os.listdir(self.directorio), [])
+
+        datos = list(DatoTributario.objects.order_by('nombre_dato').values_list('nombre_dato', 'monto', 'fecha_dato'))
+        DatoTributario.objects.all().delete()
+        sin_token = self.cargar(self.lineas)
+        self.assertEqual((motor.filas_procesadas, motor.registros_creados, motor.errores),
+                         (sin_token.filas_procesadas, sin_token.registros_creados, sin_token.errores))
+        self.assertEqual(
+            datos, list(DatoTributario.objects.order_by('nombre_dato').values_list('nombre_dato', 'monto', 'fecha_dato'))
+        )
+        self.assertEqual(datos[0], ('A', Decimal('10.00'), date(2024, 1, 15)))
+
+    def test_token_de_otro_contenido_se_ignora(self):
+        previa = self.vista_previa(self.lineas)
+        otro = ['Nombre;Monto', 'Z;1']
+        motor = self.cargar(otro, token=previa['token'])
+        self.assertEqual(list(DatoTributario.objects.values_list('nombre_dato', flat=True)), ['Z'])
+        self.assertEqual(motor.registros_creados, 1)
+        self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+    def test_preparados_vencidos_se_descartan(self):
+        previa = self.vista_previa(self.lineas)
+        with self.settings(CARGA_MASIVA_PREPARADOS_TTL=-1):
+            with mock.patch.object(carga, 'leer_preparado') as leer_preparado:
+                self.cargar(self.lineas, token=previa['token'])
+        leer_preparado.assert_not_called()
+        self.assertEqual(os.listdir(self.directorio), [])
+
+
+class ColaDeCargasTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cola@nuam.cl', 'cola@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Cola', creado_por=cls.usuario)
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+
+    def procesar(self, **opciones):
+        with self.settings(CARGA_MASIVA_DIRECTORIO_COLA=self.directorio, **opciones):
+            return procesar_carga(
+                'datos', archivo_csv(['Nombre;Monto', 'A;1', 'B;2']), self.usuario,
+                clasificacion_id=self.clasificacion.pk, modo_carga='crear'
+            )
+
+    def test_sin_worker_se_procesa_sin_copiar_el_archivo(self):
+        trabajo = self.procesar(CARGA_MASIVA_EN_SEGUNDO_PLANO=False)
+        self.assertEqual((trabajo.estado, trabajo.registros_creados), ('completado', 2))
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_encolado_lo_procesa_el_worker_y_borra_el_archivo(self):
+        trabajo = self.procesar(CARGA_MASIVA_EN_SEGUNDO_PLANO=True)
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+        with self.settings(CARGA_MASIVA_DIRECTORIO_COLA=self.directorio):
+            tomado = tomar_siguiente_trabajo()
+            self.assertEqual((tomado.pk, tomado.intentos), (trabajo.pk, 1))
+            self.assertIsNone(tomar_siguiente_trabajo())
+            ejecutar_trabajo(tomado)
+
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.filas_procesadas, trabajo.archivo_ruta), ('completado', 2, ''))
+        self.assertEqual(DatoTributario.objects.count(), 2)
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_vista_redirige_al_estado_del_trabajo_encolado(self):
+        self.client.force_login(self.usuario)
+        with self.settings(CARGA_MASIVA_DIRECTORIO_COLA=self.directorio, CARGA_MASIVA_EN_SEGUNDO_PLANO=True):
+            respuesta = self.client.post(reverse('carga_datos'), {
+                'clasificacion': self.clasificacion.pk,
+                'modo_carga': 'crear',
+                'archivo_masivo': archivo_csv(['Nombre;Monto', 'A;1']),
+            })
+        trabajo = TrabajoCarga.objects.get()
+        self.assertRedirects(respuesta, reverse('estado_carga', args=[trabajo.pk]), fetch_redirect_response=False)
+        self.assertEqual((trabajo.estado, trabajo.parametros['modo_carga']), ('pendiente', 'crear'))
+        self.assertFalse(DatoTributario.objects.exists())
+
+        estado = self.client.get(reverse('estado_carga', args=[trabajo.pk]))
+        self.assertEqual(estado.status_code, 200)
+
+    def test_trabajos_vencidos(self):
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        crear = TrabajoCarga.objects.create(
+            tipo='datos', archivo_nombre='a.csv', parametros={'modo_carga': 'crear'},
+            estado='procesando', actualizado_en=hace_una_hora, intentos=1, filas_procesadas=500
+        )
+        calificaciones = TrabajoCarga.objects.create(
+            tipo='calificaciones', archivo_nombre='c.xlsx', estado='procesando',
+            actualizado_en=hace_una_hora, intentos=1
+        )
+        activo = TrabajoCarga.objects.create(
+            tipo='calificaciones', archivo_nombre='d.xlsx', estado='procesando',
+            actualizado_en=timezone.now(), intentos=1
+        )
+
+        with self.settings(CARGA_MASIVA_TRABAJO_VENCIDO=900):
+            tomado = tomar_siguiente_trabajo()
+
+        # Una carga en modo crear no se repite; la de calificaciones vuelve a la cola y se toma de nuevo
+        crear.refresh_from_db()
+        self.assertEqual((crear.estado, crear.filas_procesadas), ('error', 500))
+        self.assertEqual((tomado.pk, tomado.intentos), (calificaciones.pk, 2))
+        activo.refresh_from_db()
+        self.assertEqual(activo.estado, 'procesando')
+
+
+class ValidacionEnParaleloTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('paralelo@nuam.cl', 'paralelo@nuam.cl', 'clave')
+        cls.clasificacion = Clasificacion.objects.create(nombre='Paralelo', creado_por=cls.usuario)
+
+    def test_resultados_en_orden_de_entrada(self):
+        tareas = ((i, i) for i in range(20))
+        self.assertEqual(list(ejecutar_en_paralelo(pow, tareas, procesos=2, en_vuelo=3)), [i ** i for i in range(20)])
+
+    def test_misma_carga_con_uno_y_varios_procesos(self):
+        lineas = ['Nombre;Monto'] + [f'Dato {i};{i}' if i % 7 else f';{i}' for i in range(1, 60)]
+        resultados = []
+        for procesos in (1, 3):
+            with self.settings(CARGA_MASIVA_TAMANO_LOTE=10, CARGA_MASIVA_PROCESOS=procesos):
+                motor = cargar_datos_tributarios(archivo_csv(lineas), self.clasificacion, self.usuario)
+            resultados.append((motor.filas_procesadas, motor.registros_creados, motor.errores))
+        self.assertEqual(resultados[0], resultados[1])
+        self.assertEqual(resultados[0][2][0].split(':')[0], 'Fila 8')
+
+
+class PaginacionPorLlaveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Dos calificaciones por fecha: la llave (fecha_pago, id) desempata las repetidas
+        CalificacionTributaria.objects.bulk_create([
+            CalificacionTributaria(**calificacion(i, fecha_pago=date(2024, 1, 1 + i // 2), anio=2024 if i % 3 else 2023))
+            for i in range(9)
+        ])
+        cls.orden = list(CalificacionTributaria.objects.order_by('-fecha_pago', '-pk').values_list('pk', flat=True))
+
+    def ids(self, pagina):
+        return [calificacion.pk for calificacion in pagina]
+
+    def test_recorre_hacia_adelante_y_atras_sin_saltos(self):
+        queryset = CalificacionTributaria.objects.all()
+        vistos = []
+        pagina = paginar_por_llave(queryset, 'fecha_pago', tamano=4)
+        paginas = [pagina]
+        while True:
+            vistos += self.ids(pagina)
+            if not pagina.has_next:
+                break
+            pagina = paginar_por_llave(queryset, 'fecha_pago', despues=pagina.cursor_siguiente, tamano=4)
+            paginas.append(pagina)
+        self.assertEqual(vistos, self.orden)
+        self.assertEqual([len(pagina) for pagina in paginas], [4, 4, 1])
+
+        anterior = paginar_por_llave(queryset, 'fecha_pago', antes=paginas[2].cursor_anterior, tamano=4)
+        self.assertEqual(self.ids(anterior), self.ids(paginas[1]))
+        self.assertTrue(anterior.has_previous)
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        pagina = paginar_por_llave(CalificacionTributaria.objects.all(), 'fecha_pago', despues='basura', tamano=4)
+        self.assertEqual(self.ids(pagina), self.orden[:4])
+        self.assertFalse(pagina.has_previous)
+
+    def test_dashboard_pagina_con_filtros(self):
+        usuario = User.objects.create_user('pagina@nuam.cl', 'pagina@nuam.cl', 'clave')
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse('calificaciones_dashboard'), {'anio': 2024})
+        pagina = respuesta.context['page_obj']
+        self.assertEqual(self.ids(pagina), list(
+            CalificacionTributaria.objects.filter(anio=2024).order_by('-fecha_pago', '-pk').values_list('pk', flat=True)
+        ))
+        self.assertEqual(respuesta.context['filtros_query'], 'anio=2024')
+
+
+@override_settings(CACHES=CACHE_PRUEBAS)
+class ListadoDatosTributariosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('listado@nuam.cl', 'listado@nuam.cl', 'clave')
+        dividendos = Clasificacion.objects.create(nombre='Dividendos', creado_por=cls.usuario)
+        intereses = Clasificacion.objects.create(nombre='Intereses', creado_por=cls.usuario)
+        DatoTributario.objects.bulk_create([
+            DatoTributario(clasificacion=dividendos, nombre_dato=f'Reparto {i}', monto=i) for i in range(44)
+        ])
+        DatoTributario.objects.create(clasificacion=intereses, nombre_dato='Cupón semestral', monto=5)
+        # Solo tres valores de creado_en, así los empates cruzan los bordes de página
+        ahora = timezone.now()
+        for pk in DatoTributario.objects.values_list('pk', flat=True):
+            DatoTributario.objects.filter(pk=pk).update(creado_en=ahora - timedelta(minutes=pk % 3))
+        cls.orden = list(DatoTributario.objects.order_by('-creado_en', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def listar(self, **parametros):
+        return self.client.get(reverse('listar_datos_tributarios'), parametros).context
+
+    def nombres(self, contexto):
+        return {dato.nombre_dato for dato in contexto['page_obj']}
+
+    def ids(self, contexto):
+        return [dato.pk for dato in contexto['page_obj']]
+
+    def test_busqueda_encuentra_texto_en_medio_del_nombre(self):
+        self.assertEqual(self.nombres(self.listar(q='semes')), {'Cupón semestral'})
+        self.assertEqual(self.nombres(self.listar(q='parto 43')), {'Reparto 43'})
+
+    def test_busqueda_incluye_nombre_de_clasificacion(self):
+        contexto = self.listar(q='interes')
+        self.assertEqual(self.nombres(contexto), {'Cupón semestral'})
+        self.assertEqual(contexto['total_registros'], 1)
+        self.assertFalse(contexto['busqueda_por_palabras'])
+
+    def test_recorre_paginas_con_empates_en_creado_en(self):
+        paginas = [self.listar()]
+        while paginas[-1]['page_obj'].has_next:
+            paginas.append(self.listar(despues=paginas[-1]['page_obj'].cursor_siguiente))
+
+        self.assertEqual(sum((self.ids(pagina) for pagina in paginas), []), self.orden)
+        self.assertEqual([len(pagina['page_obj']) for pagina in paginas], [20, 20, 5])
+        self.assertEqual(paginas[0]['total_registros'], 45)
+        self.assertFalse(paginas[0]['page_obj'].has_previous)
+
+        anterior = self.listar(antes=paginas[2]['page_obj'].cursor_anterior)
+        self.assertEqual(self.ids(anterior), self.ids(paginas[1]))
+        self.assertTrue(anterior['page_obj'].has_previous)
+        primera = self.listar(antes=anterior['page_obj'].cursor_anterior)
+        self.assertEqual(self.ids(primera), self.ids(paginas[0]))
+        self.assertFalse(primera['page_obj'].has_previous)
+
+    def test_pagina_siguiente_conserva_filtros(self):
+        repartos = list(
+            DatoTributario.objects.filter(nombre_dato__startswith='Reparto')
+            .order_by('-creado_en', '-pk').values_list('pk', flat=True)
+        )
+        primera = self.listar(q='Reparto')
+        segunda = self.listar(q='Reparto', despues=primera['page_obj'].cursor_siguiente)
+        self.assertEqual(segunda['filtros_query'], 'q=Reparto')
+        self.assertEqual(self.ids(segunda), repartos[20:40])
+
+
+class ExportacionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('exporta@nuam.cl', 'exporta@nuam.cl', 'clave')
+        dividendos = Clasificacion.objects.create(nombre='Dividendos', creado_por=cls.usuario)
+        intereses = Clasificacion.objects.create(nombre='Intereses', creado_por=cls.usuario)
+        for i in range(3):
+            DatoTributario.objects.create(clasificacion=dividendos, nombre_dato=f'Dividendo {i}', monto=10 * i)
+        DatoTributario.objects.create(clasificacion=intereses, nombre_dato='Cupón', monto=5)
+        CalificacionTributaria.objects.create(**calificacion(1, factor_08=Decimal('0.25')))
+        CalificacionTributaria.objects.create(**calificacion(2, anio=2023))
+        cls.dividendos = dividendos
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_csv_de_datos_con_filtro(self):
+        respuesta = self.client.get(reverse('exportar_datos_tributarios'), {'clasificacion': self.dividendos.pk})
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8').splitlines()
+        self.assertTrue(lineas[0].startswith('\ufeffNombre;Clasificación;Monto'))
+        self.assertEqual(len(lineas), 4)
+        self.assertNotIn('Cupón', '\n'.join(lineas))
+
+    def test_xlsx_de_calificaciones_con_factores(self):
+        respuesta = self.client.get(reverse('exportar_calificaciones'), {'formato': 'xlsx', 'anio': 2024})
+        libro = openpyxl.load_workbook(io.BytesIO(b''.join(respuesta.streaming_content)), read_only=True)
+        filas = list(libro.worksheets[0].iter_rows(values_only=True))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[0][:2], ('Mercado', 'Instrumento / Nemo'))
+        self.assertEqual(filas[1][filas[0].index('F08 No Constitutiva Renta')], 0.25)
+
+    def test_formato_no_soportado(self):
+        respuesta = self.client.get(reverse('exportar_calificaciones'), {'formato': 'pdf'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    @override_settings(EXPORTACION_XLSX_MAXIMO_FILAS=3)
+    def test_xlsx_sobre_el_maximo_vuelve_al_listado(self):
+        url = reverse('exportar_datos_tributarios')
+        respuesta = self.client.get(url, {'formato': 'xlsx', 'q': 'i'})
+        self.assertRedirects(respuesta, f"{reverse('listar_datos_tributarios')}?q=i", fetch_redirect_response=False)
+        mensajes = [str(mensaje) for mensaje in get_messages(respuesta.wsgi_request)]
+        self.assertIn('hasta 3 filas', mensajes[0])
+
+        filtrada = self.client.get(url, {'formato': 'xlsx', 'clasificacion': self.dividendos.pk})
+        self.assertEqual(filtrada.status_code, 200)
+        self.assertEqual(len(b''.join(self.client.get(url, {'formato': 'csv'}).streaming_content).splitlines()), 5)
+
+
+class CalculoCreditosTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        CalificacionTributaria.objects.create(**calificacion(
+            1, instrumento='AAA', factor_08=Decimal('0.5'), factor_19A=Decimal('0.1')
+        ))
+        CalificacionTributaria.objects.create(**calificacion(
+            2, instrumento='BBB', valor_historico=Decimal('3'), factor_08=Decimal('0.2')
+        ))
+        CalificacionTributaria.objects.create(**calificacion(
+            3, instrumento='BBB', fecha_pago=date(2024, 8, 1), valor_historico=Decimal('4'), factor_08=Decimal('0.3')
+        ))
+        CalificacionTributaria.objects.create(**calificacion(4, instrumento='BBB', anio=2023))
+        cls.tenencias = ['SEC_EVE;NEMO;CANTIDAD;MONTO', '1;;;1000', ';bbb;10;', '99;;;50']
+
+    def test_creditos_por_secuencia_y_por_instrumento(self):
+        tenencias = leer_tenencias(archivo_csv(self.tenencias))
+        cruce, creditos, sin_calificacion = calcular_creditos(tenencias, 2024)
+        f08, f19a = CODIGOS_FACTORES.index('08'), CODIGOS_FACTORES.index('19A')
+
+        self.assertEqual(cruce['fila'].tolist(), [2, 3, 3])
+        self.assertEqual(cruce['secuencia_evento'].tolist(), [1, 2, 3])
+        # Sin monto se usa cantidad x valor histórico de cada evento del NEMO en el año
+        self.assertEqual(cruce['monto'].tolist(), [1000.0, 30.0, 40.0])
+        self.assertEqual(creditos[:, f08].tolist(), [500.0, 6.0, 12.0])
+        self.assertEqual(creditos[0, f19a], 100.0)
+        self.assertEqual(sin_calificacion['fila'].tolist(), [4])
+
+    def test_vista_responde_csv(self):
+        usuario = User.objects.create_user('creditos@nuam.cl', 'creditos@nuam.cl', 'clave')
+        self.client.force_login(usuario)
+        respuesta = self.client.post(reverse('calculo_creditos'), {
+            'anio': 2024, 'archivo_tenencias': archivo_csv(self.tenencias, 'tenencias.csv')
+        })
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lineas), 5)
+        self.assertTrue(lineas[-1].endswith('Sin calificación para el año 2024'))
+
+
+@override_settings(INDICE_FACTORES_VERIFICACION=0, SINCRONIZACION_MARGEN=0)
+class IndiceFactoresTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.primera = CalificacionTributaria.objects.create(**calificacion(1, instrumento='AAA', factor_08=Decimal('0.5')))
+        CalificacionTributaria.objects.create(**calificacion(2, instrumento='AAA', fecha_pago=date(2024, 2, 1)))
+        CalificacionTributaria.objects.create(**calificacion(3, instrumento='BBB', anio=2023))
+
+    def setUp(self):
+        _indices.clear()
+        parche = mock.patch.object(indice_factores, '_anios_por_secuencia', AniosPorSecuencia())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_refresco_incremental_y_bajas(self):
+        indice = IndiceFactores(2024).refrescar()
+        self.assertEqual(len(indice), 2)
+        self.assertEqual(indice.vector(1)[0], 0.5)
+
+        self.primera.factor_08 = Decimal('0.75')
+        self.primera.instrumento = 'CCC'
+        self.primera.save()
+        CalificacionTributaria.objects.create(**calificacion(4, instrumento='AAA'))
+        indice.refrescar()
+        self.assertEqual(indice.vector(1)[0], 0.75)
+        self.assertEqual([evento['secuencia_evento'] for evento in indice.por_instrumento('aaa')], [2, 4])
+        self.assertEqual(len(indice.por_instrumento('CCC')), 1)
+
+        CalificacionTributaria.objects.filter(secuencia_evento=2).delete()
+        indice.refrescar()
+        self.assertIsNone(indice.por_secuencia(2))
+        self.assertEqual(len(indice), 2)
+
+    def test_cambio_con_actualizado_en_anterior_se_aplica(self):
+        # Una transacción que confirma después con un actualizado_en más viejo que lo ya visto
+        indice = IndiceFactores(2024).refrescar()
+        CalificacionTributaria.objects.create(**calificacion(4, instrumento='AAA'))
+        indice.refrescar()
+
+        self.primera.factor_08 = Decimal('0.9')
+        self.primera.save()
+        CalificacionTributaria.objects.filter(pk=self.primera.pk).update(
+            actualizado_en=timezone.now() - timedelta(hours=1)
+        )
+        indice.refrescar()
+        self.assertEqual(indice.vector(1)[0], 0.9)
+
+    def test_cambio_de_anio_sale_del_indice(self):
+        indice = IndiceFactores(2024).refrescar()
+        self.primera.anio = 2023
+        self.primera.save()
+        indice.refrescar()
+        self.assertIsNone(indice.por_secuencia(1))
+        self.assertEqual(buscar_factores([1])[0][1]['anio'], 2023)
+
+    def test_secuencias_sin_anio_no_consultan_la_base(self):
+        buscar_factores([1, 3])
+        with self.settings(INDICE_FACTORES_VERIFICACION=60), self.assertNumQueries(0):
+            por_secuencia, _, no_encontrados = buscar_factores([1, 3, 77])
+        self.assertEqual({secuencia: datos['anio'] for secuencia, datos in por_secuencia.items()}, {1: 2024, 3: 2023})
+        self.assertEqual(no_encontrados, [77])
+
+    def test_api_por_secuencias_e_instrumentos(self):
+        usuario = User.objects.create_user('indice@nuam.cl', 'indice@nuam.cl', 'clave')
+        cliente = self.client_class(enforce_csrf_checks=True)
+        cliente.force_login(usuario)
+        url = reverse('api_factores')
+
+        respuesta = cliente.post(url, json.dumps({'secuencias': [1, 3, 77]}), content_type='application/json')
+        datos = respuesta.json()
+        self.assertEqual(set(datos['secuencias']), {'1', '3'})
+        self.assertEqual(datos['secuencias']['3']['anio'], 2023)
+        self.assertEqual(datos['no_encontrados'], [77])
+
+        respuesta = cliente.get(url, {'instrumentos': 'AAA,ZZZ', 'anio': 2024})
+        self.assertEqual(len(respuesta.json()['instrumentos']['AAA']), 2)
+        self.assertEqual(respuesta.json()['no_encontrados'], ['ZZZ'])
+
+    def test_api_parametros_invalidos(self):
+        usuario = User.objects.create_user('indice@nuam.cl', 'indice@nuam.cl', 'clave')
+        self.client.force_login(usuario)
+        url = reverse('api_factores')
+        self.assertEqual(self.client.post(url, '[1, 2]', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(url, {'secuencias': 'uno'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'instrumentos': 'AAA'}).status_code, 400)
+
+
+@override_settings(SINCRONIZACION_MARGEN=0)
+class FeedCambiosCalificacionesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for secuencia in range(1, 6):
+            CalificacionTributaria.objects.create(**calificacion(secuencia))
+
+    def sincronizar(self, desde=0, limite=2):
+        """ Recorre el feed hasta hay_mas=False como lo haría un cliente """
+        cambios, eliminadas = [], []
+        while True:
+            pagina = cambios_calificaciones(desde, limite)
+            cambios += [cambio['secuencia_evento'] for cambio in pagina['cambios']]
+            eliminadas += [eliminada['secuencia_evento'] for eliminada in pagina['eliminadas']]
+            desde = pagina['cursor']
+            if not pagina['hay_mas']:
+                return cambios, eliminadas, desde
+
+    def test_sincronizacion_inicial_y_deltas(self):
+        cambios, eliminadas, cursor = self.sincronizar()
+        self.assertEqual((cambios, eliminadas), ([1, 2, 3, 4, 5], []))
+
+        modificada = CalificacionTributaria.objects.get(secuencia_evento=2)
+        modificada.descripcion = 'corregida'
+        modificada.save()
+        modificada.save()
+        CalificacionTributaria.objects.filter(secuencia_evento=4).delete()
+        creada = CalificacionTributaria.objects.create(**calificacion(6))
+        creada.delete()
+
+        pagina = cambios_calificaciones(cursor, limite=10)
+        # Dos guardados de la misma calificación llegan una vez; la creada y borrada solo como baja
+        self.assertEqual([cambio['secuencia_evento'] for cambio in pagina['cambios']], [2])
+        self.assertEqual(pagina['cambios'][0]['descripcion'], 'corregida')
+        self.assertEqual([eliminada['secuencia_evento'] for eliminada in pagina['eliminadas']], [4, 6])
+
+        vacia = cambios_calificaciones(pagina['cursor'])
+        self.assertEqual((vacia['cambios'], vacia['eliminadas'], vacia['cursor']), ([], [], pagina['cursor']))
+
+    def test_carga_masiva_registra_cambios(self):
+        _, _, cursor = self.sincronizar()
+        motor = MotorCargaCalificaciones(tamano_lote=10)
+        motor.agregar(0, calificacion(1, descripcion='desde archivo'))
+        motor.agregar(1, calificacion(7))
+        motor.finalizar()
+        cambios, _, _ = self.sincronizar(cursor)
+        self.assertEqual(sorted(cambios), [1, 7])
+
+    def test_margen_retiene_entradas_recientes(self):
+        with self.settings(SINCRONIZACION_MARGEN=60):
+            pagina = cambios_calificaciones(0)
+        self.assertEqual((pagina['cambios'], pagina['cursor'], pagina['hay_mas']), ([], 0, False))
+
+        primeras = CambioCalificacion.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        CambioCalificacion.objects.filter(pk__in=list(primeras)).update(registrado_en=timezone.now() - timedelta(minutes=5))
+        with self.settings(SINCRONIZACION_MARGEN=60):
+            pagina = cambios_calificaciones(0)
+        self.assertEqual([cambio['secuencia_evento'] for cambio in pagina['cambios']], [1, 2, 3])
+
+    def test_api_valida_cursor(self):
+        usuario = User.objects.create_user('feed@nuam.cl', 'feed@nuam.cl', 'clave')
+        self.client.force_login(usuario)
+        url = reverse('api_cambios_calificaciones')
+        self.assertEqual(self.client.get(url, {'desde': '2024-01-01T00:00:00_5'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limite': 0}).status_code, 400)
+        self.assertEqual(len(self.client.get(url, {'limite': 3}).json()['cambios']), 3)
+
+
+class EliminacionClasificacionesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('elimina@nuam.cl', 'elimina@nuam.cl', 'clave')
+        cls.borrar = Clasificacion.objects.create(nombre='Borrar', creado_por=cls.usuario)
+        cls.conservar = Clasificacion.objects.create(nombre='Conservar', creado_por=cls.usuario)
+        for i in range(5):
+            DatoTributario.objects.create(clasificacion=cls.borrar, nombre_dato=f'Dato {i}', monto=i)
+        DatoTributario.objects.create(clasificacion=cls.conservar, nombre_dato='Otro', monto=7)
+        SolicitudEdicion.objects.create(dato=DatoTributario.objects.first(), solicitante=cls.usuario)
+
+    def test_borra_por_lotes_con_resumenes_en_cascada(self):
+        avances = []
+        eliminados = eliminacion.eliminar_clasificacion(self.borrar.pk, tamano_lote=2, al_avanzar=avances.append)
+        self.assertEqual((eliminados, avances), (5, [2, 4, 5]))
+        self.assertFalse(Clasificacion.objects.filter(pk=self.borrar.pk).exists())
+        self.assertFalse(ResumenClasificacion.objects.filter(clasificacion_id=self.borrar.pk).exists())
+        self.assertFalse(SolicitudEdicion.objects.exists())
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.conservar).total_datos, 1)
+
+    def test_falla_a_mitad_recalcula_el_resumen(self):
+        borrar_por_ids = eliminacion._borrar_por_ids
+        llamadas = []
+
+        def falla_en_el_segundo_lote(modelo, columna, ids):
+            if modelo is DatoTributario:
+                llamadas.append(ids)
+                if len(llamadas) == 2:
+                    raise RuntimeError('conexión perdida')
+            return borrar_por_ids(modelo, columna, ids)
+
+        with mock.patch.object(eliminacion, '_borrar_por_ids', falla_en_el_segundo_lote):
+            with self.assertRaises(RuntimeError):
+                eliminacion.eliminar_clasificacion(self.borrar.pk, tamano_lote=2)
+
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.borrar).total_datos, 3)
+        self.assertEqual(self.borrar.datos.count(), 3)
+
+    def test_vista_rechaza_ids_invalidos(self):
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(reverse('eliminar_clasificaciones'), {'clasificaciones': [self.borrar.pk, 'x']})
+        self.assertRedirects(respuesta, reverse('crear_clasificacion'), fetch_redirect_response=False)
+        self.assertTrue(Clasificacion.objects.filter(pk=self.borrar.pk).exists())
+
+    @override_settings(CARGA_MASIVA_EN_SEGUNDO_PLANO=False)
+    def test_vista_respeta_permisos(self):
+        otro = User.objects.create_user('otro@nuam.cl', 'otro@nuam.cl', 'clave')
+        ajena = Clasificacion.objects.create(nombre='Ajena', creado_por=otro)
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('eliminar_clasificaciones'), {'clasificaciones': [self.borrar.pk, ajena.pk]})
+        self.assertEqual(list(Clasificacion.objects.order_by('pk').values_list('nombre', flat=True)), ['Conservar', 'Ajena'])
+
+    def test_reconstruir_resumenes_de_una_clasificacion(self):
+        ResumenClasificacion.objects.filter(clasificacion=self.borrar).update(total_datos=0)
+        ResumenClasificacion.objects.filter(clasificacion=self.conservar).update(total_datos=99)
+        call_command('reconstruir_resumenes', clasificacion=self.borrar.pk, stdout=io.StringIO())
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.borrar).total_datos, 5)
+        self.assertEqual(ResumenClasificacion.objects.get(clasificacion=self.conservar).total_datos, 99)
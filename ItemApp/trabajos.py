@@ -0,0 +1,207 @@
+import os
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .carga import cargar_datos_tributarios, cargar_calificaciones
+from .eliminacion import eliminar_clasificaciones
+from .models import Clasificacion, TrabajoCarga
+
+MAX_ERRORES_GUARDADOS = 500
+
+
+def almacenamiento_cola():
+    """ Directorio privado donde esperan los archivos de las cargas encoladas """
+    return FileSystemStorage(
+        location=settings.CARGA_MASIVA_DIRECTORIO_COLA,
+        file_permissions_mode=0o600,
+        directory_permissions_mode=0o700
+    )
+
+
+def encolar_carga(tipo, archivo, usuario, **parametros):
+    """ TrabajoCarga pendiente; el archivo se copia por trozos al almacenamiento de la cola """
+    archivo.seek(0)
+    nombre = f'{uuid.uuid4().hex}_{os.path.basename(archivo.name)}'
+    return TrabajoCarga.objects.create(
+        tipo=tipo,
+        archivo_nombre=archivo.name,
+        archivo_ruta=almacenamiento_cola().save(nombre, archivo),
+        parametros=parametros,
+        creado_por=usuario
+    )
+
+
+def procesar_carga(tipo, archivo, usuario, **parametros):
+    """
+    Con el worker activo la carga queda encolada; si no, se ejecuta en el momento sobre el
+    archivo subido, sin copiarlo.
+    """
+    if carga_en_segundo_plano():
+        return encolar_carga(tipo, archivo, usuario, **parametros)
+
+    ahora = timezone.now()
+    trabajo = TrabajoCarga.objects.create(
+        tipo=tipo,
+        archivo_nombre=archivo.name,
+        parametros=parametros,
+        creado_por=usuario,
+        estado='procesando',
+        iniciado_en=ahora,
+        actualizado_en=ahora,
+        intentos=1
+    )
+    return ejecutar_trabajo(trabajo, archivo)
+
+
+def encolar_eliminacion(clasificaciones, usuario):
+    """ TrabajoCarga pendiente que borra las clasificaciones con sus datos; el progreso son datos eliminados """
+    return TrabajoCarga.objects.create(
+        tipo='eliminacion',
+        archivo_nombre=', '.join(clasificacion.nombre for clasificacion in clasificaciones)[:255],
+        parametros={'clasificacion_ids': [clasificacion.pk for clasificacion in clasificaciones]},
+        detalle={'total_datos': sum(clasificacion.datos.count() for clasificacion in clasificaciones)},
+        creado_por=usuario
+    )
+
+
+def carga_en_segundo_plano():
+    return getattr(settings, 'CARGA_MASIVA_EN_SEGUNDO_PLANO', True)
+
+
+def _bloquear(queryset):
+    if connection.features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True)
+    return queryset.select_for_update()
+
+
+def _admite_reintento(trabajo):
+    """ Una carga de datos en modo crear no se repite: las filas ya insertadas quedarían duplicadas """
+    if trabajo.intentos >= settings.CARGA_MASIVA_MAX_INTENTOS:
+        return False
+    return not (trabajo.tipo == 'datos' and trabajo.parametros.get('modo_carga', 'crear') == 'crear')
+
+
+def recuperar_trabajos_vencidos():
+    """
+    Trabajos en 'procesando' sin avances hace más de CARGA_MASIVA_TRABAJO_VENCIDO segundos
+    (el worker murió): vuelven a la cola si se pueden repetir; si no, quedan con error.
+    """
+    limite = timezone.now() - timedelta(seconds=settings.CARGA_MASIVA_TRABAJO_VENCIDO)
+    recuperados = 0
+    with transaction.atomic():
+        vencidos = _bloquear(TrabajoCarga.objects.filter(estado='procesando', actualizado_en__lt=limite))
+        for trabajo in vencidos:
+            if _admite_reintento(trabajo):
+                trabajo.estado = 'pendiente'
+                print(f"Carga #{trabajo.pk} sin avances desde {trabajo.actualizado_en}; vuelve a la cola")
+            else:
+                trabajo.estado = 'error'
+                trabajo.mensaje = (
+                    "El proceso que ejecutaba la carga se detuvo. Revise los registros ya cargados "
+                    "antes de volver a subir el archivo."
+                )
+                trabajo.finalizado_en = timezone.now()
+                if trabajo.archivo_ruta:
+                    almacenamiento_cola().delete(trabajo.archivo_ruta)
+                    trabajo.archivo_ruta = ''
+            trabajo.save(update_fields=['estado', 'mensaje', 'finalizado_en', 'archivo_ruta'])
+            recuperados += 1
+    return recuperados
+
+
+def tomar_siguiente_trabajo():
+    """ Reclama el trabajo pendiente más antiguo; con SKIP LOCKED varios workers no toman el mismo """
+    recuperar_trabajos_vencidos()
+    with transaction.atomic():
+        trabajo = _bloquear(TrabajoCarga.objects.filter(estado='pendiente').order_by('creado_en', 'pk')).first()
+        if trabajo is None:
+            return None
+
+        trabajo.estado = 'procesando'
+        trabajo.iniciado_en = trabajo.actualizado_en = timezone.now()
+        trabajo.intentos += 1
+        trabajo.save(update_fields=['estado', 'iniciado_en', 'actualizado_en', 'intentos'])
+    return trabajo
+
+
+def _ejecutar_carga(trabajo, archivo, al_avanzar):
+    if trabajo.tipo == 'datos':
+        clasificacion = Clasificacion.objects.get(pk=trabajo.parametros['clasificacion_id'])
+        motor = cargar_datos_tributarios(
+            archivo,
+            clasificacion,
+            trabajo.creado_por,
+            trabajo.parametros.get('modo_carga', 'crear'),
+            al_avanzar=al_avanzar,
+            token=trabajo.parametros.get('token_preparado')
+        )
+        trabajo.registros_creados = motor.registros_creados
+    else:
+        motor, mapeo_factores = cargar_calificaciones(archivo, al_avanzar=al_avanzar)
+        trabajo.registros_creados = motor.registros_insertados
+        trabajo.detalle = {'factores': mapeo_factores}
+    return motor
+
+
+def ejecutar_trabajo(trabajo, archivo=None):
+    """
+    Procesa un trabajo y deja en la base el resultado, el progreso y los errores. Sin `archivo`
+    se lee el que quedó en la cola al encolarlo.
+    """
+    if trabajo.estado != 'procesando':
+        trabajo.estado = 'procesando'
+        trabajo.iniciado_en = timezone.now()
+        trabajo.save(update_fields=['estado', 'iniciado_en'])
+
+    def al_avanzar(filas_procesadas, creados, actualizados):
+        TrabajoCarga.objects.filter(pk=trabajo.pk).update(
+            filas_procesadas=filas_procesadas,
+            registros_creados=creados,
+            registros_actualizados=actualizados,
+            actualizado_en=timezone.now()
+        )
+
+    # Si falla, las columnas de progreso quedan como las dejó el último al_avanzar
+    campos = ['estado', 'mensaje', 'archivo_ruta', 'finalizado_en', 'actualizado_en']
+
+    try:
+        if trabajo.tipo == 'eliminacion':
+            # Progreso: datos tributarios eliminados hasta el momento
+            trabajo.filas_procesadas = eliminar_clasificaciones(
+                trabajo.parametros['clasificacion_ids'],
+                al_avanzar=lambda eliminados: al_avanzar(eliminados, 0, 0)
+            )
+        else:
+            if archivo is None:
+                archivo = almacenamiento_cola().open(trabajo.archivo_ruta, 'rb')
+            with archivo:
+                motor = _ejecutar_carga(trabajo, archivo, al_avanzar)
+            trabajo.filas_procesadas = motor.filas_procesadas
+            trabajo.registros_actualizados = motor.registros_actualizados
+            trabajo.total_errores = len(motor.errores)
+            trabajo.errores = motor.errores[:MAX_ERRORES_GUARDADOS]
+        trabajo.estado = 'completado'
+        campos += [
+            'filas_procesadas', 'registros_creados', 'registros_actualizados',
+            'total_errores', 'errores', 'detalle'
+        ]
+    except Exception as e:
+        print("=" * 50)
+        print(f"ERROR EN TRABAJO DE CARGA #{trabajo.pk}:")
+        print(traceback.format_exc())
+        print("=" * 50)
+        trabajo.estado = 'error'
+        trabajo.mensaje = str(e)
+
+    if trabajo.archivo_ruta:
+        almacenamiento_cola().delete(trabajo.archivo_ruta)
+        trabajo.archivo_ruta = ''
+    trabajo.finalizado_en = trabajo.actualizado_en = timezone.now()
+    trabajo.save(update_fields=campos)
+    return trabajo
@@ -0,0 +1,161 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Funciones puras de pandas/NumPy: no importan modelos para poder ejecutarse en procesos hijos
+
+VALORES_NOMBRE_INVALIDOS = ['nan', 'none', 'null', 'nat', 'n/a', 'na', '']
+
+
+def _resolver_columna(df, nombre_col):
+    if nombre_col in df.columns:
+        return nombre_col
+    for col in df.columns:
+        if str(col).strip().lower() == nombre_col.strip().lower():
+            return col
+    return None
+
+
+def _serie_detectada(df, columnas_detectadas, tipo):
+    col = _resolver_columna(df, columnas_detectadas[tipo]['nombre_original'])
+    if col is None:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    return df[col]
+
+
+def _convertir_numerico(serie, quitar_simbolo=False):
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype('float64')
+    texto = serie.astype(str).str.replace(',', '.', regex=False)
+    if quitar_simbolo:
+        texto = texto.str.replace('$', '', regex=False)
+    return pd.to_numeric(texto.str.strip(), errors='coerce').astype('float64')
+
+
+def validar_datos(df, columnas_detectadas, desplazamiento=0):
+    """ 
+    Valida un bloque de filas columna a columna. Retorna el frame tipado 
+    (nombre_dato, monto, factor, fecha_dato) y un arreglo con el error de cada fila o None.
+    """
+    filas = np.arange(desplazamiento, desplazamiento + len(df)) + 2
+    errores = np.full(len(df), None, dtype=object)
+    validado = pd.DataFrame(index=df.index)
+
+    if 'nombre' in columnas_detectadas:
+        serie = _serie_detectada(df, columnas_detectadas, 'nombre')
+        nombres = serie.astype(str).str.strip()
+        vacio = serie.isna().to_numpy()
+        invalido = ~vacio & nombres.str.lower().isin(VALORES_NOMBRE_INVALIDOS).to_numpy()
+        errores[vacio] = [f"Fila {fila}: El nombre está vacío" for fila in filas[vacio]]
+        errores[invalido] = [f"Fila {fila}: El nombre está vacío o es inválido" for fila in filas[invalido]]
+        validado['nombre_dato'] = nombres
+    else:
+        errores[:] = [f"Fila {fila}: No se encontró columna de nombre" for fila in filas]
+
+    if 'monto' in columnas_detectadas:
+        validado['monto'] = _convertir_numerico(
+            _serie_detectada(df, columnas_detectadas, 'monto'), quitar_simbolo=True
+        )
+
+    if 'factor' in columnas_detectadas:
+        validado['factor'] = _convertir_numerico(_serie_detectada(df, columnas_detectadas, 'factor'))
+
+    if 'fecha' in columnas_detectadas:
+        fechas = pd.to_datetime(
+            _serie_detectada(df, columnas_detectadas, 'fecha'),
+            errors='coerce',
+            dayfirst=True,
+            format='mixed'
+        )
+        validado['fecha_dato'] = fechas.dt.date.astype(object).where(fechas.notna(), None)
+
+    return validado, errores
+
+
+# --- FACTORES DE CALIFICACIONES ---
+
+CODIGOS_FACTORES = [f'{i:02d}' for i in range(8, 20)] + ['19A'] + [f'{i:02d}' for i in range(20, 38)]
+CAMPOS_FACTORES = [f'factor_{codigo}' for codigo in CODIGOS_FACTORES]
+
+
+def resolver_columnas_factores(columnas):
+    """ 
+    Asocia cada campo factor_XX con su columna de origen (F08-..., FACTOR 8, ...) una sola vez 
+    por archivo. Los códigos más largos se resuelven primero para que F19 no tome la columna F19A.
+    """
+    mapeo = {}
+    usadas = set()
+    for codigo in sorted(CODIGOS_FACTORES, key=len, reverse=True):
+        numero = codigo.lstrip('0')
+        claves = (
+            f'F{numero}-', f'F{codigo}-',
+            f'FACTOR-{numero}', f'FACTOR {numero}',
+            f'F{numero}', f'F{codigo}'
+        )
+        for col in columnas:
+            if col not in usadas and col.startswith(claves):
+                mapeo[f'factor_{codigo}'] = col
+                usadas.add(col)
+                break
+    return {campo: mapeo.get(campo) for campo in CAMPOS_FACTORES}
+
+
+def convertir_factores(df, mapeo):
+    """ Convierte el bloque de factores completo a float en una pasada; vacíos e inválidos quedan en 0 """
+    factores = pd.DataFrame(index=df.index)
+    for campo, col in mapeo.items():
+        if col is None:
+            factores[campo] = 0.0
+        else:
+            factores[campo] = _convertir_numerico(df[col], quitar_simbolo=True).fillna(0.0)
+    return factores
+
+
+def preparar_calificaciones(df, mapeo_factores, desplazamiento, fecha_defecto, anio_defecto):
+    """ Arma los datos de cada fila con secuencia válida; retorna ([(index, datos)], filas leídas) """
+    factores = convertir_factores(df, mapeo_factores).to_dict('records')
+    filas = []
+
+    for index, (row, valores_factores) in enumerate(zip(df.to_dict('records'), factores), start=desplazamiento):
+        sec_eve = row.get('SEC_EVE') or row.get('SECUENCIA') or row.get('ID')
+        if not sec_eve or pd.isna(sec_eve):
+            continue
+
+        datos = {
+            'mercado': row.get('MERCADO', 'AC'),
+            'instrumento': row.get('NEMO') or row.get('INSTRUMENTO') or 'DESCONOCIDO',
+            'descripcion': row.get('DESCRIPCION', ''),
+            'fecha_pago': row.get('FEC_PAGO') or row.get('FECHA') or fecha_defecto,
+            'anio': row.get('EJERCICIO') or row.get('ANO') or anio_defecto,
+            'valor_historico': row.get('VALOR_HISTORICO', 0),
+        }
+        datos.update(valores_factores)
+        datos['secuencia_evento'] = sec_eve
+        filas.append((index, datos))
+
+    return filas, len(df)
+
+
+def ejecutar_en_paralelo(funcion, tareas, procesos=1, en_vuelo=None):
+    """ 
+    Aplica `funcion` a cada tupla de argumentos de `tareas` en un ProcessPoolExecutor y entrega 
+    los resultados en el mismo orden de entrada. Solo mantiene `en_vuelo` tareas pendientes 
+    para que la memoria siga acotada aunque el archivo sea grande.
+    """
+    if procesos <= 1:
+        for argumentos in tareas:
+            yield funcion(*argumentos)
+        return
+
+    en_vuelo = en_vuelo or procesos * 2
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pendientes = deque()
+        for argumentos in tareas:
+            pendientes.append(pool.submit(funcion, *argumentos))
+            if len(pendientes) >= en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
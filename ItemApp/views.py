@@ -3,16 +3,19 @@ from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum, Count, Avg, Max, Min
+from django.db.models import Count, Max, Sum
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 import pandas as pd
 import io
 import json
-import gc 
 from datetime import datetime, timedelta
 from django.utils import timezone
+from django.urls import reverse
+from django.utils.text import capfirst
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.contrib.auth.decorators import user_passes_test 
 
 from .forms import (
@@ -20,15 +23,44 @@ from .forms import (
     ClasificacionForm, 
     CargaMasivaForm, 
     CalificacionForm, 
-    CargaMasivaCalificacionForm
+    CargaMasivaCalificacionForm,
+    CalculoCreditosForm
 )
 from .models import (
     RegistroNUAM, 
     Clasificacion, 
     DatoTributario, 
     CalificacionTributaria,
-    SolicitudEdicion
+    SolicitudEdicion,
+    TrabajoCarga,
+    ResumenClasificacion
 )
+from .carga import (
+    leer_encabezado_archivo,
+    contar_filas_archivo,
+    detectar_columnas,
+    preparar_archivo
+)
+from .busqueda import busqueda_por_palabras, filtrar_datos_por_texto, contar_en_cache
+from .paginacion import paginar_por_llave
+from .exportacion import exportar, respuesta_csv, FORMATOS_EXPORTACION
+from .indice_factores import buscar_factores
+from .sincronizacion import cambios_calificaciones
+from .creditos import leer_tenencias, calcular_creditos, filas_resultado, ENCABEZADOS_RESULTADO
+from .validacion import CAMPOS_FACTORES, CODIGOS_FACTORES
+from .estadisticas import estadisticas_panel, serie_actividad, AGRUPACIONES
+from .fragmentos import version_fragmentos, ttl_fragmentos, diferido
+from .resumenes import (
+    totales_globales,
+    clasificaciones_con_resumen,
+    reporte_desde_resumen
+)
+from .trabajos import (
+    procesar_carga,
+    encolar_eliminacion,
+    carga_en_segundo_plano
+)
+from .eliminacion import eliminar_clasificaciones
 
 
 def vista_registro(request):
@@ -84,34 +116,17 @@ def vista_inicio_logueado(request):
     except:
         pass 
     
-    total_usuarios = User.objects.count()
-    total_clasificaciones = Clasificacion.objects.count()
-    total_datos = DatoTributario.objects.count()
-    
-    stats_datos = DatoTributario.objects.aggregate(
-        monto_total=Sum('monto'),
-        monto_promedio=Avg('monto'),
-        factor_promedio=Avg('factor')
-    )
-    
-    monto_total = stats_datos['monto_total'] or 0
-    monto_promedio = stats_datos['monto_promedio'] or 0
-    
-    datos_recientes = DatoTributario.objects.select_related('clasificacion').order_by('-creado_en')[:10]
-    
-    stats_clasificacion = Clasificacion.objects.annotate(
-        total_datos=Count('datos'),
-        monto_total=Sum('datos__monto')
-    ).order_by('-total_datos')[:5]
-    
+    # Los valores se calculan solo si los fragmentos cacheados de inicio.html expiraron
     context = {
-        'total_usuarios': total_usuarios,
-        'total_clasificaciones': total_clasificaciones,
-        'total_datos': total_datos,
-        'monto_total': monto_total,
-        'monto_promedio': monto_promedio,
-        'datos_recientes': datos_recientes,
-        'stats_clasificacion': stats_clasificacion,
+        'version_fragmentos': version_fragmentos(),
+        'ttl_fragmentos': ttl_fragmentos(),
+        'total_usuarios': diferido(User.objects.count),
+        'total_clasificaciones': diferido(Clasificacion.objects.count),
+        # Totales desde las tablas de resumen (una fila por clasificación)
+        'stats_datos': diferido(totales_globales),
+        'datos_recientes': DatoTributario.objects.select_related(
+            'clasificacion', 'creado_por').order_by('-creado_en')[:10],
+        'stats_clasificacion': clasificaciones_con_resumen()[:5],
     }
     
     return render(request, 'inicio.html', context)
@@ -163,14 +178,45 @@ def vista_eliminar_clasificacion(request, pk):
         return redirect('crear_clasificacion')
 
     if request.method == 'POST':
-        nombre = clasificacion.nombre
-        clasificacion.delete()
-        messages.success(request, f'Clasificación "{nombre}" eliminada exitosamente.')
-        return redirect('crear_clasificacion')
+        return _eliminar_clasificaciones(request, [clasificacion])
     
     context = {'clasificacion': clasificacion}
     return render(request, 'eliminar_clasificacion.html', context)
 
+
+def _eliminar_clasificaciones(request, clasificaciones):
+    """ Borra por lotes; con el worker activo queda encolado y se sigue en la página de estado """
+    if carga_en_segundo_plano():
+        trabajo = encolar_eliminacion(clasificaciones, request.user)
+        return redirect('estado_carga', pk=trabajo.pk)
+
+    nombres = ', '.join(f'"{clasificacion.nombre}"' for clasificacion in clasificaciones)
+    eliminados = eliminar_clasificaciones([clasificacion.pk for clasificacion in clasificaciones])
+    messages.success(request, f'Clasificación(es) {nombres} eliminada(s) exitosamente junto a {eliminados} dato(s).')
+    return redirect('crear_clasificacion')
+
+
+@login_required
+@require_http_methods(['POST'])
+def vista_eliminar_clasificaciones(request):
+    """ Eliminación de las clasificaciones marcadas en el listado """
+    try:
+        ids = [int(pk) for pk in request.POST.getlist('clasificaciones')]
+    except ValueError:
+        messages.error(request, 'La selección de clasificaciones no es válida.')
+        return redirect('crear_clasificacion')
+
+    seleccionadas = Clasificacion.objects.filter(pk__in=ids)
+    permitidas = [c for c in seleccionadas if request.user.is_staff or c.creado_por_id == request.user.pk]
+
+    if len(permitidas) < len(seleccionadas):
+        messages.warning(request, f'{len(seleccionadas) - len(permitidas)} clasificación(es) no se eliminaron por falta de permisos.')
+    if not permitidas:
+        messages.error(request, 'No se seleccionó ninguna clasificación que puedas eliminar.')
+        return redirect('crear_clasificacion')
+
+    return _eliminar_clasificaciones(request, permitidas)
+
 @login_required
 def vista_editar_clasificacion(request, pk):
     clasificacion = get_object_or_404(Clasificacion, pk=pk)
@@ -192,321 +238,6 @@ def vista_editar_clasificacion(request, pk):
     return render(request, 'editar_clasificacion.html', context)
 
 
-# --- FUNCIONES DE LECTURA DE EXCEL (HELPERS) ---
-
-def leer_archivo_excel(archivo):
-    nombre = archivo.name.lower()
-    try:
-        if nombre.endswith('.csv'):
-            encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252', 'windows-1252']
-            delimiters = [',', ';', '\t']
-            
-            for encoding in encodings:
-                for delimiter in delimiters:
-                    try:
-                        archivo.seek(0)
-                        df = pd.read_csv(
-                            archivo, 
-                            encoding=encoding,
-                            delimiter=delimiter,
-                            skipinitialspace=True,
-                            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null', 'NaN'],
-                            keep_default_na=True,
-                            quotechar='"',
-                            skip_blank_lines=True
-                        )
-                        
-                        if len(df.columns) == 0:
-                            continue
-                        
-                        df = df.dropna(how='all')
-                        df = df.loc[:, ~df.columns.str.contains('^Unnamed|^Unnamed:', case=False, na=False)]
-                        df = df.dropna(axis=1, how='all')
-                        
-                        if not df.empty and len(df.columns) > 0:
-                            if len(df) > 0:
-                                return df
-                    except (UnicodeDecodeError, pd.errors.EmptyDataError) as e:
-                        continue
-                    except Exception as e:
-                        continue
-            
-            archivo.seek(0)
-            try:
-                df = pd.read_csv(
-                    archivo, 
-                    encoding='utf-8', 
-                    errors='ignore',
-                    skipinitialspace=True,
-                    na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
-                    skip_blank_lines=True
-                )
-                df = df.dropna(how='all')
-                df = df.loc[:, ~df.columns.str.contains('^Unnamed|^Unnamed:', case=False, na=False)]
-                df = df.dropna(axis=1, how='all')
-                return df
-            except Exception as e:
-                raise ValueError(f"No se pudo leer el archivo CSV. Error: {str(e)}")
-            
-        elif nombre.endswith(('.xls', '.xlsx')):
-            archivo.seek(0)
-            try:
-                if nombre.endswith('.xlsx'):
-                    df = pd.read_excel(
-                        archivo, 
-                        engine='openpyxl',
-                        sheet_name=0,
-                        na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null', 'NaN', '#N/A'],
-                        keep_default_na=True,
-                        header=0
-                    )
-                else:
-                    try:
-                        df = pd.read_excel(
-                            archivo, 
-                            engine='xlrd',
-                            sheet_name=0,
-                            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
-                            header=0
-                        )
-                    except Exception:
-                        archivo.seek(0)
-                        df = pd.read_excel(
-                            archivo, 
-                            engine='openpyxl',
-                            sheet_name=0,
-                            na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
-                            header=0
-                        )
-            except Exception as e:
-                try:
-                    archivo.seek(0)
-                    df = pd.read_excel(
-                        archivo, 
-                        sheet_name=0, 
-                        na_values=['', ' ', 'N/A', 'n/a', 'NULL', 'null'],
-                        header=0
-                    )
-                except Exception as e2:
-                    raise ValueError(f"No se pudo leer el archivo Excel. Error: {str(e2)}. Verifique que el archivo no esté dañado.")
-            
-            if len(df.columns) == 0:
-                raise ValueError("El archivo Excel no contiene columnas. Verifique que la primera fila tenga nombres de columnas.")
-            
-            df = df.dropna(how='all')
-            df = df.loc[:, ~df.columns.astype(str).str.contains('^Unnamed|^Unnamed:', case=False, na=False)]
-            df = df.dropna(axis=1, how='all')
-            
-            if len(df.columns) == 0:
-                raise ValueError("Después de limpiar el archivo, no quedan columnas válidas. Verifique el formato del archivo.")
-            
-            return df
-        else:
-            raise ValueError("Formato de archivo no soportado. Use .csv, .xlsx o .xls")
-    except pd.errors.EmptyDataError:
-        raise ValueError("El archivo está vacío o no contiene datos válidos")
-    except Exception as e:
-        raise ValueError(f"Error al leer el archivo: {str(e)}. Verifique que el archivo tenga el formato correcto.")
-
-
-def detectar_columnas(df):
-    
-    if df.empty:
-        raise ValueError("El archivo no contiene datos. Verifique que el archivo tenga filas de datos además del encabezado.")
-    
-    if len(df.columns) == 0:
-        raise ValueError("El archivo no contiene columnas. Verifique el formato del archivo.")
-    
-    columnas_reales = [str(col) for col in df.columns.tolist()]
-    columnas_actuales = columnas_reales.copy()
-    
-    mapeo_columnas = {
-        'nombre': ['nombre', 'name', 'nombre_dato', 'descripcion', 'descripción', 'desc', 'dato', 'item', 
-                   'concepto', 'detalle', 'descrip', 'titulo', 'title', 'concept', 'detail'],
-        'monto': ['monto', 'amount', 'valor', 'value', 'precio', 'price', 'importe', 'cantidad', 
-                  'total', 'suma', 'capital', 'dinero', 'money', 'val', 'mnt'],
-        'factor': ['factor', 'factor_', 'multiplicador', 'multiplier', 'ratio', 'coeficiente', 
-                   'coef', 'multi', 'porcentaje', 'percent', 'fac', 'rat'],
-        'fecha': ['fecha', 'date', 'fecha_dato', 'fecha_creacion', 'created_at', 'fecha_registro',
-                  'fecha_ingreso', 'fecha_carga', 'fech', 'fecha_', 'date_', 'fec']
-    }
-    
-    columnas_detectadas = {}
-    columnas_no_detectadas = []
-    
-    def normalizar_para_comparar(texto):
-        if not texto:
-            return ""
-        texto = str(texto).lower().strip()
-        texto = texto.replace(' ', '').replace('-', '').replace('_', '').replace('.', '')
-        return texto
-    
-    for tipo, posibles_nombres in mapeo_columnas.items():
-        encontrada = None
-        mejor_coincidencia = None
-        mejor_score = 0
-        
-        for col_real in columnas_reales:
-            col_normalizada = normalizar_para_comparar(col_real)
-            
-            for nombre in posibles_nombres:
-                nombre_normalizado = normalizar_para_comparar(nombre)
-                
-                if nombre_normalizado == col_normalizada:
-                    encontrada = col_real
-                    mejor_score = 100
-                    break
-                
-                if nombre_normalizado and col_normalizada:
-                    if nombre_normalizado in col_normalizada:
-                        score = (len(nombre_normalizado) / max(len(col_normalizada), 1)) * 100
-                        if score > mejor_score:
-                            mejor_score = score
-                            mejor_coincidencia = col_real
-                        
-                    elif col_normalizada in nombre_normalizado and len(col_normalizada) > 3:
-                        score = (len(col_normalizada) / len(nombre_normalizado)) * 80
-                        if score > mejor_score:
-                            mejor_score = score
-                            mejor_coincidencia = col_real
-        
-        if encontrada:
-            if encontrada in df.columns:
-                idx = list(df.columns).index(encontrada)
-                columnas_detectadas[tipo] = {
-                    'nombre_original': encontrada,
-                    'nombre_normalizado': normalizar_para_comparar(encontrada),
-                    'indice': idx
-                }
-        elif mejor_coincidencia and mejor_score > 40:
-            if mejor_coincidencia in df.columns:
-                idx = list(df.columns).index(mejor_coincidencia)
-                columnas_detectadas[tipo] = {
-                    'nombre_original': mejor_coincidencia,
-                    'nombre_normalizado': normalizar_para_comparar(mejor_coincidencia),
-                    'indice': idx
-                }
-        else:
-            if tipo == 'nombre':
-                columnas_no_detectadas.append(tipo)
-    
-    for tipo in list(columnas_detectadas.keys()):
-        nombre_col = columnas_detectadas[tipo]['nombre_original']
-        if nombre_col not in df.columns:
-            encontrada = None
-            for col in df.columns:
-                if str(col).strip().lower() == nombre_col.strip().lower():
-                    encontrada = str(col).strip()
-                    columnas_detectadas[tipo]['nombre_original'] = encontrada
-                    break
-            if not encontrada:
-                del columnas_detectadas[tipo]
-                if tipo == 'nombre':
-                    columnas_no_detectadas.append(tipo)
-    
-    return columnas_detectadas, columnas_no_detectadas, columnas_actuales
-
-
-def validar_fila_datos(fila, columnas_detectadas, index):
-    
-    errores = []
-    datos = {}
-    
-    def obtener_valor_columna(nombre_col):
-        if nombre_col in fila.index:
-            return fila[nombre_col]
-        for col in fila.index:
-            if str(col).strip().lower() == nombre_col.strip().lower():
-                return fila[col]
-        return None
-    
-    if 'nombre' in columnas_detectadas:
-        nombre_col_original = columnas_detectadas['nombre']['nombre_original']
-        try:
-            nombre_valor = obtener_valor_columna(nombre_col_original)
-            
-            if nombre_valor is not None and pd.notna(nombre_valor):
-                nombre = str(nombre_valor).strip()
-                if nombre and nombre.lower() not in ['nan', 'none', 'null', 'nat', 'n/a', 'na', '', ' ']:
-                    datos['nombre_dato'] = nombre
-                else:
-                    errores.append(f"Fila {index + 2}: El nombre está vacío o es inválido")
-            else:
-                errores.append(f"Fila {index + 2}: El nombre está vacío")
-        except Exception as e:
-            errores.append(f"Fila {index + 2}: Error al procesar el nombre: {str(e)}")
-    else:
-        errores.append(f"Fila {index + 2}: No se encontró columna de nombre")
-    
-    if 'monto' in columnas_detectadas:
-        monto_col_original = columnas_detectadas['monto']['nombre_original']
-        try:
-            monto_valor = obtener_valor_columna(monto_col_original)
-            
-            if monto_valor is not None and pd.notna(monto_valor):
-                if isinstance(monto_valor, (int, float)):
-                    datos['monto'] = float(monto_valor)
-                else:
-                    monto_val = pd.to_numeric(str(monto_valor).replace(',', '.').replace('$', '').strip(), errors='coerce')
-                    if pd.notna(monto_val):
-                        datos['monto'] = float(monto_val)
-                    else:
-                        datos['monto'] = None
-            else:
-                datos['monto'] = None
-        except Exception as e:
-            datos['monto'] = None
-    
-    if 'factor' in columnas_detectadas:
-        factor_col_original = columnas_detectadas['factor']['nombre_original']
-        try:
-            factor_valor = obtener_valor_columna(factor_col_original)
-            
-            if factor_valor is not None and pd.notna(factor_valor):
-                if isinstance(factor_valor, (int, float)):
-                    datos['factor'] = float(factor_valor)
-                else:
-                    factor_val = pd.to_numeric(str(factor_valor).replace(',', '.').strip(), errors='coerce')
-                    if pd.notna(factor_val):
-                        datos['factor'] = float(factor_val)
-                    else:
-                        datos['factor'] = None
-            else:
-                datos['factor'] = None
-        except Exception as e:
-            datos['factor'] = None
-    
-    if 'fecha' in columnas_detectadas:
-        fecha_col_original = columnas_detectadas['fecha']['nombre_original']
-        try:
-            fecha_valor = obtener_valor_columna(fecha_col_original)
-            
-            if fecha_valor is not None and pd.notna(fecha_valor):
-                try:
-                    if isinstance(fecha_valor, pd.Timestamp):
-                        datos['fecha_dato'] = fecha_valor.date()
-                    else:
-                        fecha_val = pd.to_datetime(
-                            fecha_valor, 
-                            errors='coerce', 
-                            dayfirst=True, 
-                            yearfirst=False,
-                            infer_datetime_format=True
-                        )
-                        if pd.notna(fecha_val):
-                            datos['fecha_dato'] = fecha_val.date()
-                        else:
-                            datos['fecha_dato'] = None
-                except:
-                    datos['fecha_dato'] = None
-            else:
-                datos['fecha_dato'] = None
-        except Exception as e:
-            datos['fecha_dato'] = None
-    
-    return datos, errores
-
-
 @login_required
 def vista_carga_datos(request):
     
@@ -524,209 +255,15 @@ def vista_carga_datos(request):
             archivo = form.cleaned_data['archivo_masivo']
             modo_carga = form.cleaned_data.get('modo_carga', 'crear')
 
-            try:
-                df = leer_archivo_excel(archivo)
-                
-                if df.empty:
-                    messages.error(request, 
-                        'El archivo está vacío o no contiene datos. '
-                        'Asegúrese de que el archivo tenga al menos una fila de datos además del encabezado.')
-                    return render(request, 'carga_datos.html', {'form': form})
-                
-                if len(df.columns) == 0:
-                    messages.error(request, 
-                        'El archivo no contiene columnas válidas. '
-                        'Verifique que el archivo tenga nombres de columnas en la primera fila.')
-                    return render(request, 'carga_datos.html', {'form': form})
-                
-                df.columns = df.columns.astype(str).str.strip()
-                df = df.loc[:, ~df.columns.str.contains('^Unnamed|^nan$', case=False, na=False)]
-                df = df.dropna(axis=1, how='all')
-                df = df.dropna(how='all')
-                
-                try:
-                    columnas_detectadas, columnas_no_detectadas, columnas_originales = detectar_columnas(df.copy())
-                except ValueError as ve:
-                    messages.error(request, str(ve))
-                    return render(request, 'carga_datos.html', {'form': form})
-                
-                if 'nombre' in columnas_no_detectadas:
-                    mensaje_error = (
-                        f'No se pudo detectar la columna de nombre en el archivo. '
-                        f'Columnas encontradas en el archivo: {", ".join(columnas_originales[:10])}'
-                    )
-                    if len(columnas_originales) > 10:
-                        mensaje_error += f' (y {len(columnas_originales) - 10} más)'
-                    mensaje_error += (
-                        '. La columna de nombre es obligatoria y puede llamarse: '
-                        'Nombre, Name, Descripción, Desc, Dato, Item, etc. '
-                        'Asegúrese de que la primera fila del archivo contenga los nombres de las columnas.'
-                    )
-                    messages.error(request, mensaje_error)
-                    return render(request, 'carga_datos.html', {'form': form})
-                
-                if len(df) == 0:
-                    messages.error(request, 
-                        'El archivo no contiene filas de datos. '
-                        'Asegúrese de que el archivo tenga datos además del encabezado de columnas.')
-                    return render(request, 'carga_datos.html', {'form': form})
-
-                for tipo, info in columnas_detectadas.items():
-                    nombre_col = info['nombre_original']
-                    if nombre_col not in df.columns:
-                        messages.error(request, 
-                            f'Error: La columna detectada "{nombre_col}" no existe en el DataFrame. '
-                            f'Columnas disponibles: {", ".join(df.columns.tolist()[:10])}')
-                        return render(request, 'carga_datos.html', {'form': form})
-                
-                print("=" * 60)
-                print(f"PROCESAMIENTO DE ARCHIVO: {archivo.name}")
-                print(f"Total de filas: {len(df)}")
-                print(f"Total de columnas: {len(df.columns)}")
-                print(f"Columnas en DataFrame: {list(df.columns)}")
-                print(f"Columnas detectadas:")
-                for tipo, info in columnas_detectadas.items():
-                    print(f"   - {tipo}: '{info['nombre_original']}' (índice: {info['indice']})")
-                print("=" * 60)
-                
-                
-                data_records = df.to_dict('records')
-                del df
-                gc.collect()
-                
-
-                registros_creados = 0
-                registros_actualizados = 0
-                errores = []
-                advertencias = []
-                
-                if not data_records:
-                    messages.error(request, 
-                        'Después de procesar el archivo, no quedan filas válidas para cargar. '
-                        'Verifique que el archivo tenga datos en las filas.')
-                    return render(request, 'carga_datos.html', {'form': form})
-                
-                filas_procesadas = 0
-                for index, fila_dict in enumerate(data_records):
-                    filas_procesadas += 1
-                    
-                    
-                    fila = pd.Series(fila_dict)
-
-                    try:
-                        datos, errores_fila = validar_fila_datos(fila, columnas_detectadas, index)
-                        
-                        if errores_fila:
-                            errores.extend(errores_fila)
-                            continue
-                        
-                        if 'nombre_dato' not in datos or not datos['nombre_dato']:
-                            errores.append(f"Fila {index + 2}: El nombre del dato está vacío")
-                            continue
-                        
-                        if modo_carga == 'actualizar':
-                            dato_existente = DatoTributario.objects.filter(
-                                nombre_dato=datos['nombre_dato'],
-                                clasificacion=clasificacion_seleccionada
-                            ).first()
-                            
-                            if dato_existente:
-                                if 'monto' in datos:
-                                    dato_existente.monto = datos['monto']
-                                if 'factor' in datos:
-                                    dato_existente.factor = datos['factor']
-                                if 'fecha_dato' in datos:
-                                    dato_existente.fecha_dato = datos['fecha_dato']
-                                dato_existente.save()
-                                registros_actualizados += 1
-                            else:
-                                DatoTributario.objects.create(
-                                    clasificacion=clasificacion_seleccionada,
-                                    nombre_dato=datos['nombre_dato'],
-                                    monto=datos.get('monto'),
-                                    factor=datos.get('factor'),
-                                    fecha_dato=datos.get('fecha_dato'),
-                                    creado_por=request.user
-                                )
-                                registros_creados += 1
-                        else:
-                            DatoTributario.objects.create(
-                                clasificacion=clasificacion_seleccionada,
-                                nombre_dato=datos['nombre_dato'],
-                                monto=datos.get('monto'),
-                                factor=datos.get('factor'),
-                                fecha_dato=datos.get('fecha_dato'),
-                                creado_por=request.user
-                            )
-                            registros_creados += 1
-                        
-                    except Exception as e:
-                        error_msg = f"Fila {index + 2}: {str(e)}"
-                        errores.append(error_msg)
-                        print(f"ERROR en fila {index + 2}: {str(e)}")
-                        import traceback
-                        print(traceback.format_exc())
-                
-                print("=" * 60)
-                print(f"RESUMEN DE CARGA:")
-                print(f"   - Filas procesadas: {filas_procesadas}")
-                print(f"   - Registros creados: {registros_creados}")
-                print(f"   - Registros actualizados: {registros_actualizados}")
-                print(f"   - Errores: {len(errores)}")
-                print("=" * 60)
-                
-                if registros_creados > 0:
-                    messages.success(request, 
-                        f'Se crearon exitosamente {registros_creados} registro(s) nuevo(s).')
-                
-                if registros_actualizados > 0:
-                    messages.info(request, 
-                        f'Se actualizaron {registros_actualizados} registro(s) existente(s).')
-                
-                if errores:
-                    errores_mostrar = errores[:10]
-                    mensaje_errores = f'Se encontraron {len(errores)} error(es). '
-                    if len(errores) > 10:
-                        mensaje_errores += f'Mostrando los primeros 10:'
-                    messages.error(request, mensaje_errores)
-                    for error in errores_mostrar:
-                        messages.error(request, f'   • {error}')
-                    
-                    if len(errores) > 10:
-                        messages.warning(request, 
-                            f'Hay {len(errores) - 10} error(es) adicional(es). '
-                            f'Revisa el formato del archivo y descarga la plantilla para ver el formato correcto.')
-                
-                if advertencias:
-                    for advertencia in advertencias[:5]:
-                        messages.warning(request, advertencia)
-                
-                if registros_creados == 0 and registros_actualizados == 0 and errores:
-                    messages.error(request, 
-                        'No se pudo cargar ningún registro. Por favor revisa los errores y el formato del archivo.')
-                
-                return redirect('carga_datos') 
-
-            except ValueError as e:
-                messages.error(request, f"Error al leer el archivo: {str(e)}")
-                import traceback
-                print("=" * 50)
-                print("ERROR EN LECTURA DE ARCHIVO:")
-                print(traceback.format_exc())
-                print("=" * 50)
-            except pd.errors.EmptyDataError:
-                messages.error(request, 
-                    "El archivo está vacío o no contiene datos válidos. "
-                    "Asegúrese de que el archivo tenga al menos una fila de datos además del encabezado.")
-            except Exception as e:
-                error_msg = f"Error inesperado al procesar el archivo: {str(e)}"
-                messages.error(request, error_msg)
-                import traceback
-                print("=" * 50)
-                print("ERROR INESPERADO:")
-                print(traceback.format_exc())
-                print("=" * 50)
-
+            trabajo = procesar_carga(
+                'datos',
+                archivo,
+                request.user,
+                clasificacion_id=clasificacion_seleccionada.pk,
+                modo_carga=modo_carga,
+                token_preparado=form.cleaned_data.get('token_preparado', '')
+            )
+            return redirect('estado_carga', pk=trabajo.pk)
     else:
         form = CargaMasivaForm()
 
@@ -786,26 +323,86 @@ def descargar_plantilla_excel(request):
         return redirect('carga_datos')
 
 
+def _obtener_trabajo(request, pk):
+    trabajo = get_object_or_404(TrabajoCarga, pk=pk)
+    if not request.user.is_staff and trabajo.creado_por != request.user:
+        return None
+    return trabajo
+
+
+@login_required
+def vista_estado_carga(request, pk):
+    """ Página de seguimiento de una carga masiva; consulta el progreso por JSON mientras no termine """
+    trabajo = _obtener_trabajo(request, pk)
+    if trabajo is None:
+        messages.error(request, 'No tienes permiso para ver esta carga.')
+        return redirect('inicio')
+    
+    factores = trabajo.detalle.get('factores', {})
+    context = {
+        'trabajo': trabajo,
+        'errores_mostrar': trabajo.errores[:10],
+        'errores_adicionales': max(trabajo.total_errores - 10, 0),
+        'factores_detectados': [(campo[7:], col) for campo, col in factores.items() if col],
+        'factores_faltantes': [campo[7:] for campo, col in factores.items() if not col],
+    }
+    return render(request, 'carga_estado.html', context)
+
+
+@login_required
+def vista_progreso_carga(request, pk):
+    trabajo = _obtener_trabajo(request, pk)
+    if trabajo is None:
+        return JsonResponse({'success': False, 'error': 'Sin permiso'}, status=403)
+    
+    return JsonResponse({
+        'success': True,
+        'estado': trabajo.estado,
+        'terminado': trabajo.terminado,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'registros_creados': trabajo.registros_creados,
+        'registros_actualizados': trabajo.registros_actualizados,
+        'total_errores': trabajo.total_errores,
+        'mensaje': trabajo.mensaje,
+    })
+
+
 @login_required
 def vista_preview_archivo(request):
     
     if request.method == 'POST' and request.FILES.get('archivo'):
         archivo = request.FILES['archivo']
         try:
-            df = leer_archivo_excel(archivo)
+            # Las filas de ejemplo y las columnas salen del encabezado
+            df = leer_encabezado_archivo(archivo)
+            if df is None:
+                raise ValueError("El archivo está vacío o no contiene datos válidos")
             
             columnas_detectadas, columnas_no_detectadas, columnas_originales = detectar_columnas(df.copy())
+
+            # El archivo completo queda validado para la carga; si no se puede, solo se cuentan las filas
+            token = None
+            if 'nombre' in columnas_detectadas:
+                try:
+                    token, total_filas = preparar_archivo(archivo, columnas_detectadas)
+                except Exception as e:
+                    print(f"Advertencia: No se pudo preparar el archivo para la carga: {e}")
+            if token is None:
+                total_filas = contar_filas_archivo(archivo)
             
             preview_data = df.head(5).to_dict('records')
             
             return JsonResponse({
                 'success': True,
-                'total_filas': len(df),
+                'total_filas': total_filas,
+                'total_aproximado': token is None,
                 'columnas_detectadas': {
                     k: v['nombre_original'] for k, v in columnas_detectadas.items()
                 },
                 'columnas_no_detectadas': columnas_no_detectadas,
                 'columnas_originales': columnas_originales,
+                'dialecto': df.attrs.get('dialecto'),
+                'token': token,
                 'preview': preview_data
             })
         except Exception as e:
@@ -817,40 +414,87 @@ def vista_preview_archivo(request):
     return JsonResponse({'success': False, 'error': 'No se proporcionó archivo'})
 
 
-@login_required
-def vista_listar_datos_tributarios(request):
-    
+def _filtrar_datos_tributarios(request, datos):
+    """ Filtros del listado (q y clasificacion); los comparten el listado y la exportación """
     busqueda = request.GET.get('q', '')
     clasificacion_id = request.GET.get('clasificacion', '')
     
-    datos = DatoTributario.objects.select_related('clasificacion').all()
-    
     if busqueda:
-        datos = datos.filter(
-            Q(nombre_dato__icontains=busqueda) |
-            Q(clasificacion__nombre__icontains=busqueda)
-        )
+        datos = filtrar_datos_por_texto(datos, busqueda)
     
     if clasificacion_id:
         datos = datos.filter(clasificacion_id=clasificacion_id)
+    return datos
+
+
+@login_required
+def vista_listar_datos_tributarios(request):
     
-    datos = datos.order_by('-creado_en')
+    busqueda = request.GET.get('q', '')
+    clasificacion_id = request.GET.get('clasificacion', '')
     
-    paginator = Paginator(datos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    datos = _filtrar_datos_tributarios(
+        request, DatoTributario.objects.select_related('clasificacion', 'creado_por').all()
+    )
+    
+    page_obj = paginar_por_llave(
+        datos,
+        'creado_en',
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=20
+    )
+    total_registros = contar_en_cache(datos)
     
     clasificaciones = Clasificacion.objects.all()
+
+    filtros = request.GET.copy()
+    for parametro in ('despues', 'antes', 'page'):
+        filtros.pop(parametro, None)
     
     context = {
         'page_obj': page_obj,
+        'total_registros': total_registros,
         'clasificaciones': clasificaciones,
         'busqueda': busqueda,
+        'busqueda_por_palabras': busqueda_por_palabras(),
         'clasificacion_seleccionada': clasificacion_id,
+        'filtros_query': filtros.urlencode(),
     }
     
     return render(request, 'listar_datos_tributarios.html', context)
 
+
+def _volver_sin_exportar(request, vista, error):
+    """ Regresa al listado con los mismos filtros y el motivo por el que no se exportó """
+    messages.warning(request, str(error))
+    filtros = request.GET.copy()
+    filtros.pop('formato', None)
+    return redirect(f"{reverse(vista)}?{filtros.urlencode()}")
+
+
+@login_required
+def vista_exportar_datos_tributarios(request):
+    """ Descarga en CSV o XLSX de los datos tributarios con los mismos filtros del listado """
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return JsonResponse({'success': False, 'error': 'Formato no soportado'}, status=400)
+
+    datos = _filtrar_datos_tributarios(request, DatoTributario.objects.all())
+    columnas = [
+        ('nombre_dato', 'Nombre'),
+        ('clasificacion__nombre', 'Clasificación'),
+        ('monto', 'Monto'),
+        ('factor', 'Factor'),
+        ('fecha_dato', 'Fecha'),
+        ('creado_en', 'Creado en'),
+        ('creado_por__username', 'Creado por'),
+    ]
+    try:
+        return exportar(datos, columnas, 'datos_tributarios', formato)
+    except ValueError as e:
+        return _volver_sin_exportar(request, 'listar_datos_tributarios', e)
+
 @login_required
 def vista_eliminar_dato_tributario(request, pk):
     dato = get_object_or_404(DatoTributario, pk=pk)
@@ -893,72 +537,22 @@ def vista_panel_administracion(request):
     solicitudes_pendientes = SolicitudEdicion.objects.filter(revisado=False).select_related('solicitante', 'dato').order_by('-fecha_solicitud')
    
     
-    total_usuarios = User.objects.count()
-    total_staff = User.objects.filter(is_staff=True).count()
-    total_superusuarios = User.objects.filter(is_superuser=True).count()
-    total_registros_nuam = RegistroNUAM.objects.count()
-    total_clasificaciones = Clasificacion.objects.count()
-    total_datos_tributarios = DatoTributario.objects.count()
-
-    stats_datos = DatoTributario.objects.aggregate(
-        monto_total=Sum('monto'),
-        monto_promedio=Avg('monto'),
-        monto_maximo=Max('monto'),
-        monto_minimo=Min('monto'),
-        factor_promedio=Avg('factor')
-    )
-    
-    stats_paises = RegistroNUAM.objects.values('pais').annotate(
-        total=Count('id')
-    ).order_by('-total')[:10]
-    
-    stats_clasificacion = Clasificacion.objects.annotate(
-        total_datos=Count('datos'),
-        monto_total=Sum('datos__monto')
-    ).order_by('-total_datos')[:10]
-    
     usuarios_recientes = User.objects.order_by('-date_joined')[:10]
     
     registros_recientes = RegistroNUAM.objects.select_related().order_by('-creado_en')[:10]
     
-    datos_recientes = DatoTributario.objects.select_related('clasificacion').order_by('-creado_en')[:10]
- 
-    fecha_limite = timezone.now() - timedelta(days=30)
-    usuarios_nuevos_30d = User.objects.filter(date_joined__gte=fecha_limite).count()
-    datos_nuevos_30d = DatoTributario.objects.filter(creado_en__gte=fecha_limite).count()
-    registros_nuevos_30d = RegistroNUAM.objects.filter(creado_en__gte=fecha_limite).count()
-    
-    usuarios_activos_30d = User.objects.filter(last_login__gte=fecha_limite).count()
-    
-    total_usuarios_regulares = total_usuarios - total_staff
+    datos_recientes = DatoTributario.objects.select_related('clasificacion', 'creado_por').order_by('-creado_en')[:10]
     
+    # Contadores, montos y rankings: pocas consultas agregadas y en caché por unos segundos
     context = {
         'solicitudes_pendientes': solicitudes_pendientes, # <-- SE ENVÍA AL TEMPLATE
-        'total_usuarios': total_usuarios,
-        'total_staff': total_staff,
-        'total_superusuarios': total_superusuarios,
-        'total_usuarios_regulares': total_usuarios_regulares,
-        'total_registros_nuam': total_registros_nuam,
-        'total_clasificaciones': total_clasificaciones,
-        'total_datos_tributarios': total_datos_tributarios,
-        
-        'monto_total': stats_datos['monto_total'] or 0,
-        'monto_promedio': stats_datos['monto_promedio'] or 0,
-        'monto_maximo': stats_datos['monto_maximo'] or 0,
-        'monto_minimo': stats_datos['monto_minimo'] or 0,
-        'factor_promedio': stats_datos['factor_promedio'] or 0,
-        
-        'stats_paises': stats_paises,
-        'stats_clasificacion': stats_clasificacion,
+        'version_fragmentos': version_fragmentos(),
+        'ttl_fragmentos': ttl_fragmentos(),
+        **estadisticas_panel(),
         
         'usuarios_recientes': usuarios_recientes,
         'registros_recientes': registros_recientes,
         'datos_recientes': datos_recientes,
-        
-        'usuarios_nuevos_30d': usuarios_nuevos_30d,
-        'datos_nuevos_30d': datos_nuevos_30d,
-        'registros_nuevos_30d': registros_nuevos_30d,
-        'usuarios_activos_30d': usuarios_activos_30d,
     }
     
     return render(request, 'admin_panel.html', context)
@@ -1030,21 +624,28 @@ def vista_reportes(request):
         except ValueError:
             messages.error(request, 'El formato de la fecha de inicio es inválido. Use AAAA-MM-DD.')
 
-    reporte_data_qs = datos_query.values('clasificacion__nombre').annotate(
-        total_datos=Count('id'),
-        monto_total=Sum('monto'),
-        monto_promedio=Avg('monto')
-    ).order_by('-monto_total')
-
-    # --- CORRECCIÓN CLAVE ---
-    # Convertir el QuerySet de agregación a una lista de diccionarios.
-    # Esto resuelve el error "Object of type QuerySet is not JSON serializable".
-    reporte_data = list(reporte_data_qs) 
-    # -------------------------
+    if fecha_inicio_seleccionada is None:
+        # Sin filtro de fecha el reporte sale de la tabla de resumen
+        reporte_data = diferido(reporte_desde_resumen, clasificacion_id)
+    else:
+        reporte_data_qs = datos_query.values('clasificacion__nombre').annotate(
+            total_datos=Count('id'),
+            monto_total=Sum('monto'),
+            monto_promedio=Avg('monto')
+        ).order_by('-monto_total')
+
+        # --- CORRECCIÓN CLAVE ---
+        # Convertir el QuerySet de agregación a una lista de diccionarios.
+        # Esto resuelve el error "Object of type QuerySet is not JSON serializable".
+        # Se evalúa solo si el fragmento del reporte no está en caché.
+        reporte_data = diferido(list, reporte_data_qs)
+        # -------------------------
     
     clasificaciones_list = Clasificacion.objects.all().order_by('nombre')
     
     context = {
+        'version_fragmentos': version_fragmentos(),
+        'ttl_fragmentos': ttl_fragmentos(),
         'reporte_data': reporte_data,
         'clasificaciones_list': clasificaciones_list,
         'clasificacion_seleccionada': clasificacion_id,
@@ -1056,6 +657,135 @@ def vista_reportes(request):
 
 
 
+def _version_actividad(request):
+    """
+    Validador sacado de la base y no de la caché, para que sea el mismo en todos los procesos:
+    cada escritura de datos tributarios guarda el resumen de su clasificación, y las bajas de
+    clasificaciones cambian la cantidad de resúmenes.
+    """
+    if not hasattr(request, '_version_actividad'):
+        request._version_actividad = ResumenClasificacion.objects.aggregate(
+            ultima=Max('actualizado_en'), resumenes=Count('pk'), total=Sum('total_datos')
+        )
+    return request._version_actividad
+
+
+def _etag_actividad(request):
+    version = _version_actividad(request)
+    ultima = version['ultima'].timestamp() if version['ultima'] else 0
+    return f"actividad-{ultima}-{version['resumenes']}-{version['total'] or 0}-{request.GET.urlencode()}"
+
+
+def _ultima_modificacion_actividad(request):
+    return _version_actividad(request)['ultima']
+
+
+@login_required
+@cache_control(private=True, max_age=60)
+@condition(etag_func=_etag_actividad, last_modified_func=_ultima_modificacion_actividad)
+def vista_api_actividad(request):
+    """ Serie de datos cargados por día, semana o mes para el gráfico de actividad """
+    agrupacion = request.GET.get('agrupacion', 'dia')
+    if agrupacion not in AGRUPACIONES:
+        return JsonResponse({'success': False, 'error': 'Agrupación inválida. Use dia, semana o mes.'}, status=400)
+
+    try:
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') \
+            else timezone.localdate()
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') \
+            else hasta - timedelta(days=29)
+        clasificacion_id = int(request.GET['clasificacion']) if request.GET.get('clasificacion') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos. Use fechas AAAA-MM-DD.'}, status=400)
+
+    if desde > hasta:
+        return JsonResponse({'success': False, 'error': 'La fecha desde no puede ser posterior a hasta.'}, status=400)
+    if (hasta - desde).days > 2 * 366:
+        return JsonResponse({'success': False, 'error': 'El rango máximo es de dos años.'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'agrupacion': agrupacion,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'serie': serie_actividad(desde, hasta, agrupacion, clasificacion_id),
+    })
+
+
+MAXIMO_LLAVES_FACTORES = 1000
+
+
+def _lista_parametro(valor):
+    if isinstance(valor, str):
+        return [parte.strip() for parte in valor.split(',') if parte.strip()]
+    return list(valor or [])
+
+
+@csrf_exempt
+@login_required
+def vista_api_factores(request):
+    """
+    Factores de varias calificaciones en una llamada, desde el índice en memoria. GET con
+    secuencias/instrumentos separados por coma, o POST con un JSON de la misma forma. Es de solo
+    lectura, por eso el POST queda fuera de la protección CSRF para los servicios que la consumen.
+    """
+    if request.method == 'POST':
+        try:
+            parametros = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'El cuerpo debe ser JSON.'}, status=400)
+        if not isinstance(parametros, dict):
+            return JsonResponse({'success': False, 'error': 'El cuerpo debe ser un objeto JSON.'}, status=400)
+    else:
+        parametros = request.GET
+
+    try:
+        secuencias = [int(secuencia) for secuencia in _lista_parametro(parametros.get('secuencias'))]
+        instrumentos = [str(instrumento) for instrumento in _lista_parametro(parametros.get('instrumentos'))]
+        anio = int(parametros['anio']) if parametros.get('anio') else None
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos.'}, status=400)
+
+    if len(secuencias) + len(instrumentos) > MAXIMO_LLAVES_FACTORES:
+        return JsonResponse(
+            {'success': False, 'error': f'Máximo {MAXIMO_LLAVES_FACTORES} llaves por consulta.'}, status=400
+        )
+
+    try:
+        por_secuencia, por_instrumento, no_encontrados = buscar_factores(secuencias, instrumentos, anio)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'codigos': CODIGOS_FACTORES,
+        'secuencias': {str(secuencia): resultado for secuencia, resultado in por_secuencia.items()},
+        'instrumentos': por_instrumento,
+        'no_encontrados': no_encontrados,
+    })
+
+
+MAXIMO_CAMBIOS_POR_PAGINA = 5000
+
+
+@login_required
+def vista_api_cambios_calificaciones(request):
+    """
+    Feed para sincronizar calificaciones. Se llama con el cursor de la respuesta anterior
+    hasta que hay_mas sea false; sin cursor entrega todo desde el principio.
+    """
+    try:
+        desde = int(request.GET.get('desde') or 0)
+        limite = min(int(request.GET.get('limite', 500)), MAXIMO_CAMBIOS_POR_PAGINA)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'El cursor y el límite deben ser números.'}, status=400)
+
+    if desde < 0 or limite < 1:
+        return JsonResponse({'success': False, 'error': 'Cursor o límite inválido.'}, status=400)
+
+    return JsonResponse({'success': True, **cambios_calificaciones(desde, limite)})
+
+
 @login_required
 def vista_secreta_convertir_admin(request):
     
@@ -1079,32 +809,70 @@ def vista_secreta_convertir_admin(request):
         return redirect('inicio')
 
 
-@login_required
-def vista_calificaciones_dashboard(request):
-    """ Dashboard principal que lista las calificaciones ingresadas """
-    
+def _filtrar_calificaciones(request, calificaciones):
     anio = request.GET.get('anio')
     mercado = request.GET.get('mercado')
     
-    calificaciones = CalificacionTributaria.objects.all().order_by('-fecha_pago')
-    
     if anio:
         calificaciones = calificaciones.filter(anio=anio)
     if mercado:
         calificaciones = calificaciones.filter(mercado=mercado)
+    return calificaciones
 
-    paginator = Paginator(calificaciones, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+
+@login_required
+def vista_calificaciones_dashboard(request):
+    """ Dashboard principal que lista las calificaciones ingresadas """
+    
+    anio = request.GET.get('anio')
+    mercado = request.GET.get('mercado')
+    
+    # Solo las columnas que muestra la tabla; los 31 factores no se cargan
+    calificaciones = _filtrar_calificaciones(request, CalificacionTributaria.objects.only(
+        'id', 'anio', 'mercado', 'instrumento', 'fecha_pago', 'secuencia_evento', 'valor_historico'
+    ))
+
+    page_obj = paginar_por_llave(
+        calificaciones,
+        'fecha_pago',
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        tamano=20
+    )
+
+    filtros = request.GET.copy()
+    for parametro in ('despues', 'antes', 'page'):
+        filtros.pop(parametro, None)
 
     context = {
         'page_obj': page_obj,
         'anio_filter': anio,
-        'mercado_filter': mercado
+        'mercado_filter': mercado,
+        'filtros_query': filtros.urlencode()
     }
     return render(request, 'calificaciones/dashboard.html', context)
 
 
+@login_required
+def vista_exportar_calificaciones(request):
+    """ Descarga en CSV o XLSX de las calificaciones filtradas por año y mercado, con todos sus factores """
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return JsonResponse({'success': False, 'error': 'Formato no soportado'}, status=400)
+
+    calificaciones = _filtrar_calificaciones(request, CalificacionTributaria.objects.all())
+    campos = [
+        'mercado', 'instrumento', 'descripcion', 'fecha_pago', 'secuencia_evento', 'anio',
+        'isfut', 'ingreso_por_montos', 'valor_historico', *CAMPOS_FACTORES
+    ]
+    modelo = CalificacionTributaria._meta
+    columnas = [(campo, capfirst(modelo.get_field(campo).verbose_name)) for campo in campos]
+    try:
+        return exportar(calificaciones, columnas, 'calificaciones', formato)
+    except ValueError as e:
+        return _volver_sin_exportar(request, 'calificaciones_dashboard', e)
+
+
 @login_required
 def vista_gestionar_calificacion(request, id=None):
     """ Vista única para Crear (sin ID) y Modificar (con ID) """
@@ -1165,75 +933,38 @@ def vista_carga_masiva_calificaciones(request):
         form = CargaMasivaCalificacionForm(request.POST, request.FILES)
         if form.is_valid():
             archivo = request.FILES['archivo_excel']
-            try:
-                df = pd.read_excel(archivo)
-                df.columns = df.columns.str.strip().str.upper()
-                
-                
-                columnas_disponibles = list(df.columns)
-                data_records = df.to_dict('records')
-                del df
-                gc.collect()
-                
-                
-                registros_procesados = 0
-                
-                for index, row in enumerate(data_records):
-                    try:
-                        sec_eve = row.get('SEC_EVE') or row.get('SECUENCIA') or row.get('ID')
-                        if not sec_eve:
-                            continue 
-
-                        datos = {
-                            'mercado': row.get('MERCADO', 'AC'),
-                            'instrumento': row.get('NEMO') or row.get('INSTRUMENTO') or 'DESCONOCIDO',
-                            'descripcion': row.get('DESCRIPCION', ''),
-                            'fecha_pago': row.get('FEC_PAGO') or row.get('FECHA') or timezone.now().date(),
-                            'anio': row.get('EJERCICIO') or row.get('ANO') or datetime.now().year,
-                            'valor_historico': row.get('VALOR_HISTORICO', 0),
-                        }
-
-                        for i in range(8, 38):
-                            field_name = f'factor_{i:02d}' 
-                            
-                            keys_to_check = [
-                                f'F{i}-', f'F{i:02d}-', 
-                                f'FACTOR-{i}', f'FACTOR {i}',
-                                f'F{i}', f'F{i:02d}'
-                            ]
-                            
-                            val = 0
-                            for col in columnas_disponibles:
-                                if any(col.startswith(k) for k in keys_to_check):
-                                    val = row[col]
-                                    break
-                            
-                            if isinstance(val, str):
-                                val = val.replace(',', '.').replace('$', '').strip()
-                            
-                            datos[field_name] = pd.to_numeric(val, errors='coerce') or 0
-
-                        CalificacionTributaria.objects.update_or_create(
-                            secuencia_evento=sec_eve,
-                            defaults=datos
-                        )
-                        registros_procesados += 1
-                        
-                    except Exception as e:
-                        print(f"Error en fila {index}: {e}")
-                        continue
-
-                messages.success(request, f'Proceso finalizado. {registros_procesados} registros procesados.')
-                return redirect('calificaciones_dashboard')
-
-            except Exception as e:
-                messages.error(request, f"Error al procesar el archivo: {str(e)}")
+            trabajo = procesar_carga('calificaciones', archivo, request.user)
+            return redirect('estado_carga', pk=trabajo.pk)
     else:
         form = CargaMasivaCalificacionForm()
 
     return render(request, 'calificaciones/carga_masiva.html', {'form': form})
 
 
+@login_required
+def vista_calculo_creditos(request):
+    """ Aplica los factores del año a un archivo de tenencias y descarga el resultado en CSV """
+    if request.method == 'POST':
+        form = CalculoCreditosForm(request.POST, request.FILES)
+        if form.is_valid():
+            anio = form.cleaned_data['anio']
+            try:
+                tenencias = leer_tenencias(request.FILES['archivo_tenencias'])
+                cruce, creditos, sin_calificacion = calcular_creditos(tenencias, anio)
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                return respuesta_csv(
+                    ENCABEZADOS_RESULTADO,
+                    filas_resultado(cruce, creditos, sin_calificacion, anio),
+                    f'creditos_{anio}'
+                )
+    else:
+        form = CalculoCreditosForm(initial={'anio': timezone.localdate().year})
+
+    return render(request, 'calificaciones/calculo_creditos.html', {'form': form})
+
+
 
 @login_required
 def vista_solicitar_edicion(request, pk):
@@ -139,6 +139,74 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Filas por lote (y por transacción) en la carga masiva de datos tributarios
+CARGA_MASIVA_TAMANO_LOTE = int(os.environ.get('CARGA_MASIVA_TAMANO_LOTE', 1000))
+
+# Procesos para validar los bloques de una carga en paralelo (1 = en el mismo proceso)
+CARGA_MASIVA_PROCESOS = int(os.environ.get('CARGA_MASIVA_PROCESOS', 1))
+
+# Las cargas masivas y las eliminaciones de clasificaciones quedan encoladas y las procesa
+# `manage.py procesar_cargas` (proceso worker del Procfile). Con 'False' se ejecutan dentro de la
+# petición, sujetas al timeout de gunicorn: solo para desarrollo sin worker.
+CARGA_MASIVA_EN_SEGUNDO_PLANO = os.environ.get('CARGA_MASIVA_EN_SEGUNDO_PLANO', 'True') == 'True'
+
+# Archivos de las cargas encoladas hasta que el worker los procesa. Debe ser un directorio
+# privado que vean tanto la web como el worker (en hosts separados, un volumen compartido).
+CARGA_MASIVA_DIRECTORIO_COLA = os.environ.get('CARGA_MASIVA_DIRECTORIO_COLA', str(BASE_DIR / 'privado' / 'cola'))
+
+# Un trabajo en proceso sin avances por más de estos segundos se da por abandonado (worker caído).
+# Debe superar lo que tarda el lote más lento. Se reintenta hasta CARGA_MASIVA_MAX_INTENTOS veces,
+# salvo las cargas de datos en modo crear, que quedan con error para no duplicar filas.
+CARGA_MASIVA_TRABAJO_VENCIDO = int(os.environ.get('CARGA_MASIVA_TRABAJO_VENCIDO', '900'))
+CARGA_MASIVA_MAX_INTENTOS = int(os.environ.get('CARGA_MASIVA_MAX_INTENTOS', '3'))
+
+# Datos ya leídos y validados en la vista previa de una carga, en Parquet bajo el hash del contenido;
+# la carga del mismo archivo los usa en vez de volver a leerlo. Directorio privado que vean la web y
+# el worker; las entradas vencen a los CARGA_MASIVA_PREPARADOS_TTL segundos.
+CARGA_MASIVA_DIRECTORIO_PREPARADOS = os.environ.get('CARGA_MASIVA_DIRECTORIO_PREPARADOS', str(BASE_DIR / 'privado' / 'preparados'))
+CARGA_MASIVA_PREPARADOS_TTL = int(os.environ.get('CARGA_MASIVA_PREPARADOS_TTL', 3600))
+
+# Datos tributarios por lote (y por transacción) al eliminar una clasificación
+CLASIFICACION_ELIMINACION_LOTE = int(os.environ.get('CLASIFICACION_ELIMINACION_LOTE', 2000))
+
+# Máximo de filas de una exportación a Excel. A diferencia del CSV, el XLSX se arma completo en un
+# archivo temporal antes de empezar la descarga; para más filas se exporta en CSV
+EXPORTACION_XLSX_MAXIMO_FILAS = int(os.environ.get('EXPORTACION_XLSX_MAXIMO_FILAS', 100000))
+
+# Segundos que se reutilizan las estadísticas del panel; se invalidan al cambiar los datos
+ESTADISTICAS_CACHE_TTL = int(os.environ.get('ESTADISTICAS_CACHE_TTL', 60))
+
+# Segundos que viven los fragmentos cacheados de inicio, panel y reportes
+FRAGMENTOS_CACHE_TTL = int(os.environ.get('FRAGMENTOS_CACHE_TTL', 300))
+
+# Cada cuántos segundos el índice de factores en memoria lee las entradas nuevas de la bitácora de
+# calificaciones; como el feed, no aplica las de los últimos SINCRONIZACION_MARGEN segundos
+INDICE_FACTORES_VERIFICACION = float(os.environ.get('INDICE_FACTORES_VERIFICACION', 1))
+
+# El feed de cambios de calificaciones no entrega entradas de la bitácora más nuevas que este
+# margen (segundos). Cada transacción escribe su entrada justo antes del commit, así que debe
+# cubrir ese último tramo (un INSERT y el COMMIT) más la diferencia de reloj entre servidores.
+SINCRONIZACION_MARGEN = int(os.environ.get('SINCRONIZACION_MARGEN', 5))
+
+# La caché guarda las estadísticas y los fragmentos, y sus invalidaciones deben llegar a todos los
+# procesos (gunicorn y el worker de cargas): por defecto son archivos en CACHE_DIRECTORIO, que debe
+# ser el mismo para ambos (en hosts separados, un volumen compartido). CACHE_EN_MEMORIA es solo para
+# un único proceso, p.ej. desarrollo: cada proceso tendría su propia copia.
+if os.environ.get('CACHE_EN_MEMORIA', 'False') == 'True':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'nuam',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIRECTORIO', str(BASE_DIR / 'privado' / 'cache')),
+        }
+    }
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/inicio/'
 LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
@@ -13,17 +13,24 @@ urlpatterns = [
     ), name='login'),
     
     path('inicio/', item_views.vista_inicio_logueado, name='inicio'),
+    path('api/actividad/', item_views.vista_api_actividad, name='api_actividad'),
+    path('api/factores/', item_views.vista_api_factores, name='api_factores'),
+    path('api/calificaciones/cambios/', item_views.vista_api_cambios_calificaciones, name='api_cambios_calificaciones'),
     
     
     path('clasificacion/', item_views.vista_gestion_clasificacion, name='crear_clasificacion'),
     path('clasificacion/editar/<int:pk>/', item_views.vista_editar_clasificacion, name='editar_clasificacion'),
     path('clasificacion/eliminar/<int:pk>/', item_views.vista_eliminar_clasificacion, name='eliminar_clasificacion'),
+    path('clasificacion/eliminar/', item_views.vista_eliminar_clasificaciones, name='eliminar_clasificaciones'),
     
     
     path('carga-datos/', item_views.vista_carga_datos, name='carga_datos'),
     path('carga-datos/plantilla/', item_views.descargar_plantilla_excel, name='descargar_plantilla'),
     path('carga-datos/preview/', item_views.vista_preview_archivo, name='preview_archivo'),
+    path('cargas/<int:pk>/', item_views.vista_estado_carga, name='estado_carga'),
+    path('cargas/<int:pk>/progreso/', item_views.vista_progreso_carga, name='progreso_carga'),
     path('datos-tributarios/', item_views.vista_listar_datos_tributarios, name='listar_datos_tributarios'),
+    path('datos-tributarios/exportar/', item_views.vista_exportar_datos_tributarios, name='exportar_datos_tributarios'),
     path('datos-tributarios/eliminar/<int:pk>/', item_views.vista_eliminar_dato_tributario, name='eliminar_dato_tributario'),
     
    
@@ -39,10 +46,12 @@ urlpatterns = [
     
     
     path('calificaciones/', item_views.vista_calificaciones_dashboard, name='calificaciones_dashboard'),
+    path('calificaciones/exportar/', item_views.vista_exportar_calificaciones, name='exportar_calificaciones'),
     path('calificaciones/ingresar/', item_views.vista_gestionar_calificacion, name='ingresar_calificacion'),
     path('calificaciones/modificar/<int:id>/', item_views.vista_gestionar_calificacion, name='modificar_calificacion'),
     path('calificaciones/eliminar/<int:id>/', item_views.vista_eliminar_calificacion, name='eliminar_calificacion_tributaria'),
     path('calificaciones/carga-masiva/', item_views.vista_carga_masiva_calificaciones, name='carga_masiva_calificaciones'),
+    path('calificaciones/calculo-creditos/', item_views.vista_calculo_creditos, name='calculo_creditos'),
     
     path('logout/', item_views.vista_logout, name='logout'),
 ]
\ No newline at end of file